@@ -10,23 +10,45 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 # BASE_DIR = Path(__file__).resolve().parent.parent
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
+# Профиль настроек: development (runserver, DEBUG) или production (gunicorn за nginx, см. gunicorn.conf.py)
+DJANGO_ENV = os.environ.get('DJANGO_ENV', 'development')
+PRODUCTION = DJANGO_ENV == 'production'
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-39^%wf)$9v-xck8rxos3db46$c7fp@c=_eq_)+y&8jfr=e)&k%'
+if PRODUCTION:
+    SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', '')
+    if not SECRET_KEY or SECRET_KEY.startswith('change-me'):
+        raise ImproperlyConfigured(
+            "DJANGO_ENV=production требует собственный DJANGO_SECRET_KEY (пустой и образец change-me "
+            "не подходят); для разработки запустите с DJANGO_ENV=development."
+        )
+else:
+    SECRET_KEY = os.environ.get(
+        'DJANGO_SECRET_KEY', 'django-insecure-39^%wf)$9v-xck8rxos3db46$c7fp@c=_eq_)+y&8jfr=e)&k%'
+    )
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '0' if PRODUCTION else '1') == '1'
 
-CSRF_TRUSTED_ORIGINS = ['http://*', 'https://*']
-
-ALLOWED_HOSTS = ['*']
+if PRODUCTION:
+    ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+    CSRF_TRUSTED_ORIGINS = [origin for origin in os.environ.get('DJANGO_CSRF_TRUSTED_ORIGINS', '').split(',') if origin]
+    # nginx передаёт схему исходного запроса
+    SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+else:
+    CSRF_TRUSTED_ORIGINS = ['http://*', 'https://*']
+    ALLOWED_HOSTS = ['*']
 
 # Application definition
 
@@ -41,6 +63,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mi_django.metrics.RequestMetricsMiddleware',  # Первым: замеряет весь запрос
+    'mi_django.circuit.BackendBudgetMiddleware',  # Бюджет времени на обращения к сервисам
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,25 +74,34 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Логи пишет фоновый поток (mi_django/logs.py): файл с ротацией по размеру в JSON и консоль.
+# Уровни отдельных логгеров: LOG_LEVELS="mi_django.views=DEBUG,django.db.backends=WARNING"
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_LEVELS = dict(
+    item.strip().split('=', 1) for item in os.environ.get('LOG_LEVELS', '').split(',') if '=' in item
+)
+LOG_FILE = os.environ.get('LOG_FILE', 'debug.log')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
-        'console':{
-            'class':'logging.StreamHandler',
-        },
-        'file': {
-            'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': 'debug.log',  # Путь к вашему файлу логов
+        'queue': {
+            '()': 'mi_django.logs.QueueListenerHandler',
+            'filename': LOG_FILE,
+            'max_bytes': int(os.environ.get('LOG_FILE_MAX_BYTES', 10 * 1024 * 1024)),
+            'backup_count': int(os.environ.get('LOG_FILE_BACKUP_COUNT', 5)),
+            'console': True,
+            'console_json': os.environ.get('LOG_CONSOLE_JSON', '0') == '1',
+            'queue_size': 10000,  # при переполнении записи отбрасываются, запрос не ждёт
         },
     },
+    'root': {
+        'handlers': ['queue'],
+        'level': LOG_LEVEL.upper(),
+    },
     'loggers': {
-        '': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',  # Установите нужный уровень логирования
-            'propagate': True,
-        },
+        name: {'level': level.strip().upper()} for name, level in LOG_LEVELS.items()
     },
 }
 
@@ -90,6 +123,15 @@ TEMPLATES = [
         },
     },
 ]
+if PRODUCTION:
+    # Скомпилированные шаблоны хранятся в памяти процесса: без чтения и разбора файлов на каждый запрос
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
 
 WSGI_APPLICATION = 'django_cor.wsgi.application'
 
@@ -110,6 +152,60 @@ DATABASES = {
     }
 }
 
+# Соединения с PostgreSQL:
+#   'none'       — новое соединение на каждый запрос (прежнее поведение);
+#   'persistent' — соединение потока живёт DB_CONN_MAX_AGE секунд и проверяется перед повторным использованием;
+#   'pool'       — пул psycopg 3 в каждом процессе-воркере (для ASGI: постоянные соединения там не переиспользуются).
+DB_CONNECTION_MODE = os.environ.get(
+    'DB_CONNECTION_MODE', 'pool' if os.environ.get('ASYNC_VIEWS', '0') == '1' else 'persistent'
+)
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+# Поток gunicorn держит не больше одного соединения, поэтому пул процесса — по числу потоков воркера.
+# Всего соединений: GUNICORN_WORKERS * DB_POOL_MAX_SIZE (+ воркер анализа) — не больше max_connections PostgreSQL.
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', os.environ.get('GUNICORN_THREADS', 8)))
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 2))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))  # сколько ждать свободного соединения, с
+
+if DB_CONNECTION_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_CONNECTION_MODE == 'pool':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+            'max_idle': 300,  # простаивающие сверх min_size соединения закрываются через 5 минут
+        },
+    }
+
+# Кэш, общий для всех процессов (таблица цен, фрагменты страниц, тексты документов, обновление токенов, сессии):
+# Redis по REDIS_URL. Без него у каждого процесса свой LocMemCache — только для разработки в одном процессе:
+# метки версий цен и фрагментов, сброшенные одним воркером, другие не увидят.
+REDIS_URL = os.environ.get('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+elif PRODUCTION:
+    raise ImproperlyConfigured(
+        "DJANGO_ENV=production требует REDIS_URL: без общего кэша воркеры gunicorn "
+        "отдают устаревшие цены и страницы после изменений в других процессах."
+    )
+
+# Сессии (в них JWT прокси-сервера, их читает каждый запрос вошедшего пользователя):
+#   'db'        — строка django_session на каждый запрос;
+#   'cached_db' — mi_django/sessions.py: память процесса -> общий кэш -> БД; нужен общий кэш (REDIS_URL).
+# Истёкшие сессии удаляет manage.py prune_sessions.
+SESSION_MODE = os.environ.get('SESSION_MODE', 'cached_db' if REDIS_URL else 'db')
+if SESSION_MODE == 'cached_db':
+    SESSION_ENGINE = 'mi_django.sessions'
+SESSION_LOCAL_TTL = float(os.environ.get('SESSION_LOCAL_TTL', 2))  # с; столько запись другого воркера может быть не видна
+SESSION_LOCAL_MAX_ENTRIES = 10000  # сессий в памяти процесса
+
 #
 # if 'test' in sys.argv or 'test_coverage' in sys.argv:
 #     # Настройки базы данных для тестов
@@ -171,8 +267,18 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 MEDIA_URL = '/media/'  # URL для доступа к медиафайлам
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Папка для хранения медиафайлов
 
-STATIC_ROOT = BASE_DIR
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  # сюда collectstatic, отсюда отдаёт nginx
 STATIC_URL = '/static/'
+if PRODUCTION:
+    # Имена с хэшем содержимого: nginx отдаёт статику с бессрочным кэшированием и gzip
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'},
+    }
+
+# Отдача медиафайлов (mi_django/media_delivery.py): 'django', 'x-accel' (nginx) или 'x-sendfile'
+MEDIA_DELIVERY = os.environ.get('MEDIA_DELIVERY', 'x-accel' if PRODUCTION else 'django')
+MEDIA_ACCEL_PREFIX = '/protected-media/'  # internal-location nginx с alias на MEDIA_ROOT
 
 # URL перенаправления после входа и выхода
 LOGIN_URL = '/accounts/login/'        # URL страницы входа
@@ -181,6 +287,55 @@ LOGOUT_REDIRECT_URL = '/'             # URL после выхода
 
 # Дополнительные настройки
 DEFAULT_PRICE_PER_KB = 1.0  # Цена по умолчанию
+PRICE_VERSION_CHECK_INTERVAL = 1.0  # Как часто процесс сверяет таблицу цен с меткой версии в кэше, с
+INDEX_PAGE_SIZE = 24  # Документов на странице главной
+# Кэш отрисованной сетки документов и списка корзины (mi_django/fragments.py)
+FRAGMENT_CACHE_ALIAS = 'default'
+FRAGMENT_CACHE_TIMEOUT = 3600  # с; после изменения Doc/Cart старые фрагменты просто не читаются
+THUMBNAIL_SIZES = {'sm': 320, 'md': 640}  # Миниатюры для главной: имя -> наибольшая сторона, px
+THUMBNAIL_FORMAT = 'WEBP'  # WEBP или JPEG
+THUMBNAIL_QUALITY = 80
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Размер куска при потоковой загрузке документов (байт)
+# Обработчики загрузки считают sha256 файла при приёме (хранилище с адресацией по содержимому)
+FILE_UPLOAD_HANDLERS = [
+    'mi_django.uploads.HashingMemoryFileUploadHandler',
+    'mi_django.uploads.HashingTemporaryFileUploadHandler',
+]
+# Повторная загрузка тех же байтов переиспользует документ FastAPI: 'user', 'all' или 'none'
+DEDUP_REUSE_ANALYSIS = 'user'
+# Пакетная загрузка (mi_django/bulk_upload.py)
+BULK_UPLOAD_CONCURRENCY = 8  # Одновременных отправок на прокси-сервер в одном запросе
+BULK_UPLOAD_MAX_FILES = 500  # Файлов в одном пакете, включая содержимое архивов
+BULK_UPLOAD_MAX_FILE_SIZE = 50 * 1024 * 1024  # Наибольший размер файла в архиве, байт
+BULK_UPLOAD_MAX_TOTAL_SIZE = 500 * 1024 * 1024  # Наибольший размер пакета после распаковки архивов, байт
+DATA_UPLOAD_MAX_NUMBER_FILES = BULK_UPLOAD_MAX_FILES
+
+# Кэш извлечённого текста документов (mi_django/text_cache.py). Хранится в общем кэше (CACHES['default']),
+# чтобы сброс при новом анализе или удалении был виден всем процессам.
+# LRUTextCache держит тексты в памяти процесса — только для одного процесса (runserver).
+DOC_TEXT_CACHE = {
+    'BACKEND': 'mi_django.text_cache.DjangoTextCache',
+    'OPTIONS': {'alias': 'default', 'timeout': 7 * 24 * 3600},
+}
+# Через сколько секунд сохранённый в БД текст обновляется из FastAPI в фоне (None — не обновлять)
+DOC_TEXT_REFRESH_AFTER = None
+
+# Очередь анализа (mi_django/analysis_queue.py, воркер: manage.py run_analysis_worker)
+ANALYSIS_MAX_ATTEMPTS = 5  # Неудачных обращений к FastAPI подряд до статуса failed
+ANALYSIS_RETRY_BACKOFF = 5  # Задержка перед повтором, с; удваивается с каждой попыткой
+ANALYSIS_RETRY_BACKOFF_MAX = 600
+ANALYSIS_POLL_INTERVAL = 10  # Как часто опрашивать готовность текста, с
+ANALYSIS_POLL_TIMEOUT = 3600  # Сколько ждать завершения анализа, с
+ANALYSIS_JOB_LEASE = 60  # На сколько секунд захваченная задача скрыта от других воркеров
+
+# Пакетное удаление и outbox удалений в FastAPI (mi_django/deletions.py, воркер: manage.py run_deletion_worker)
+DELETION_BATCH_SIZE = 1000  # Документов в одной транзакции удаления
+DELETION_MAX_SELECTED = 10000  # Документов, выбранных в одном запросе
+DELETION_UNLINK_WORKERS = 8  # Потоков удаления файлов с диска
+DELETION_CONCURRENCY = 8  # Одновременных DELETE в FastAPI у воркера
+DELETION_RETRY_BACKOFF = 5  # Задержка перед повтором, с; удваивается с каждой попыткой
+DELETION_RETRY_BACKOFF_MAX = 3600
+DELETION_LEASE = 60  # На сколько секунд захваченная запись скрыта от других воркеров
 
 # Настройка URL для FastAPI
 if 'test' in sys.argv or 'test_coverage' in sys.argv:
@@ -190,9 +345,43 @@ else:
 
 
 PROXY_BASE_URL = 'http://djangorest:8002'
+
+# JWT прокси-сервера в сессии (mi_django/tokens.py): обновлять access-токен за столько секунд до exp
+TOKEN_REFRESH_MARGIN = 60
+TOKEN_REFRESH_LOCK_TIMEOUT = 10  # Сколько ждать, пока токен обновляет другой процесс, с
+
+# Быстрый путь входа (mi_django/logins.py)
+LOGIN_USER_CACHE_TIMEOUT = 24 * 3600  # Кэш username -> пользователь Django, с; 0 — get_or_create на каждый вход
+LOGIN_REJECTED_CACHE_TIMEOUT = 30  # Сколько отклонять без прокси-сервера только что отклонённый пароль, с
+LOGIN_RATE_LIMIT = None  # (попыток, секунд) обращений к /api/login/ на имя пользователя, например (10, 60)
+LOGIN_LAST_LOGIN_FLUSH_INTERVAL = 10  # last_login пишется пачкой раз в столько секунд; 0 — на каждый вход
+
+# Пул HTTP-соединений к прокси-серверу и FastAPI (mi_django/http_client.py)
+BACKEND_POOL_CONNECTIONS = int(os.environ.get('BACKEND_POOL_CONNECTIONS', 10))  # число хостов с собственным пулом
+BACKEND_POOL_MAXSIZE = int(os.environ.get('BACKEND_POOL_MAXSIZE', 20))  # keep-alive соединений на хост
+BACKEND_TIMEOUT = (3.05, 10)  # таймауты (подключение, чтение) в секундах
+BACKEND_RETRIES = 3  # повторы идемпотентных запросов (GET/PUT/DELETE)
+BACKEND_RETRY_BACKOFF = 0.3  # множитель экспоненциальной задержки между повторами
+BACKEND_ASYNC_MAX_CONNECTIONS = 500  # предел одновременных соединений асинхронного клиента
+# Автоматы отключения хостов (mi_django/circuit.py)
+BACKEND_CIRCUIT_FAILURE_THRESHOLD = 5  # неудач подряд до размыкания
+BACKEND_CIRCUIT_RECOVERY_TIMEOUT = 30  # сколько секунд обращения к хосту отклоняются сразу
+BACKEND_CIRCUIT_HALF_OPEN_CALLS = 1  # пробных запросов после паузы
+# Бюджет времени запроса на обращения к сервисам, с; по имени маршрута — свой.
+# Меньше GUNICORN_TIMEOUT (120 с), чтобы запрос завершался ошибкой, а не убийством воркера.
+BACKEND_LATENCY_BUDGET = 10
+BACKEND_LATENCY_BUDGETS = {
+    'upload_document': 110,
+    'bulk_upload_documents': 110,
+}
+
+# Метрики запросов по представлениям (mi_django/metrics.py), Prometheus: /metrics/
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 0.1))  # доля замеряемых запросов
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # Bearer-токен сборщика; без него — только сотрудники
+
+# Асинхронные представления для работы под ASGI (uvicorn django_cor.asgi:application)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-
-print(f"MEDIA_ROOT: {MEDIA_ROOT}")
\ No newline at end of file
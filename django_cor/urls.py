@@ -1,7 +1,8 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from mi_django import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -9,5 +10,7 @@ urlpatterns = [
     path('accounts/', include('django.contrib.auth.urls')),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# Медиафайлы: проверку входа выполняет Django, байты в production отдаёт nginx (MEDIA_DELIVERY)
+urlpatterns += [
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.+)$', views.serve_media, name='media'),
+]
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""
+Настройки gunicorn для production (DJANGO_ENV=production):
+
+    gunicorn -c gunicorn.conf.py django_cor.wsgi
+    ASYNC_VIEWS=1 gunicorn -c gunicorn.conf.py django_cor.asgi:application
+
+Представления ждут ответа прокси-сервера и FastAPI, поэтому под WSGI
+используются потоки (gthread): пока один поток ждёт сеть, другие
+обслуживают запросы. С ASYNC_VIEWS=1 воркеры — uvicorn (ASGI), и потоки
+не нужны. Все значения можно переопределить переменными окружения.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8001')
+
+# 2 * ядра + 1 — обычная отправная точка для смешанной нагрузки (CPU на шаблоны и миниатюры, ожидание сети)
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+if os.environ.get('ASYNC_VIEWS', '0') == '1':
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    worker_class = 'gthread'
+    # Из той же переменной settings.py берёт размер пула соединений с БД (DB_POOL_MAX_SIZE)
+    threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# За nginx с keepalive к upstream: соединение держится между запросами
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Перезапуск воркера после max_requests запросов (с разбросом, чтобы не все сразу): ограничивает рост памяти
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# Загрузка больших документов на прокси-сервер может идти дольше стандартных 30 с
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Приложение загружается в каждом воркере: пулы соединений и поток логирования создаются после fork()
+preload_app = False
+
+# Временные файлы heartbeat в памяти: в Docker /tmp может быть на медленном overlayfs
+worker_tmp_dir = '/dev/shm'
+
+# Журнал доступа ведёт nginx; для gunicorn включается переменной GUNICORN_ACCESS_LOG=-
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+# nginx передаёт адрес клиента в X-Forwarded-For
+forwarded_allow_ips = os.environ.get('GUNICORN_FORWARDED_ALLOW_IPS', '*')
@@ -1,14 +1,36 @@
 from django.contrib import admin
-from .models import Doc, Price, Cart
+from .models import AnalysisJob, BackendDeletion, Doc, DocText, Price, Cart
 
 @admin.register(Doc)
 class DocAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'file_path', 'size', 'fastapi_doc_id')
+    list_display = ('id', 'user', 'file_path', 'size', 'fastapi_doc_id', 'analysis_status')
     search_fields = ('user__username', 'file_path')
-    list_filter = ('user',)
+    list_filter = ('user', 'analysis_status')
     ordering = ('-id',)
     readonly_fields = ('id',)
 
+@admin.register(DocText)
+class DocTextAdmin(admin.ModelAdmin):
+    list_display = ('doc', 'content_hash', 'fetched_at')
+    search_fields = ('doc__id', 'content_hash')
+    ordering = ('-fetched_at',)
+    readonly_fields = ('content_hash', 'fetched_at')
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'doc', 'status', 'attempts', 'run_after', 'started_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('doc__id', 'last_error')
+    ordering = ('-id',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+
+@admin.register(BackendDeletion)
+class BackendDeletionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'fastapi_doc_id', 'attempts', 'run_after', 'created_at')
+    search_fields = ('fastapi_doc_id', 'last_error')
+    ordering = ('run_after',)
+    readonly_fields = ('created_at',)
+
 @admin.register(Price)
 class PriceAdmin(admin.ModelAdmin):
     list_display = ('file_type', 'price')
@@ -0,0 +1,181 @@
+"""
+Очередь анализа документов в БД, без брокера сообщений.
+
+Представление analyze_document только ставит AnalysisJob в очередь и сразу
+отвечает. Воркер (manage.py run_analysis_worker, их можно запускать сколько
+угодно) забирает задачи через SELECT ... FOR UPDATE SKIP LOCKED:
+
+    queued  -> PUT /doc_analyse/<id>  -> running
+    running -> GET /get_text/<id>     -> done, когда текст готов
+
+Неудачные обращения к FastAPI повторяются с экспоненциальной задержкой,
+после ANALYSIS_MAX_ATTEMPTS подряд задача переходит в failed. Состояние и
+время этапов дублируются в Doc для показа пользователю.
+"""
+import logging
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .doc_text import forget_texts, save_texts
+from .fragments import fragment_cache
+from .http_client import backend, FASTAPI_BASE_URL
+from .models import AnalysisJob, AnalysisStatus, Doc
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_MAX_ATTEMPTS = getattr(settings, 'ANALYSIS_MAX_ATTEMPTS', 5)
+ANALYSIS_RETRY_BACKOFF = getattr(settings, 'ANALYSIS_RETRY_BACKOFF', 5)  # секунд, удваивается с каждой попыткой
+ANALYSIS_RETRY_BACKOFF_MAX = getattr(settings, 'ANALYSIS_RETRY_BACKOFF_MAX', 600)
+ANALYSIS_POLL_INTERVAL = getattr(settings, 'ANALYSIS_POLL_INTERVAL', 10)  # секунд между опросами /get_text/
+ANALYSIS_POLL_TIMEOUT = getattr(settings, 'ANALYSIS_POLL_TIMEOUT', 3600)  # секунд на весь анализ
+# Сколько секунд задача невидима для других воркеров после захвата;
+# если воркер упал, задачу подхватит другой по истечении этого времени
+ANALYSIS_JOB_LEASE = getattr(settings, 'ANALYSIS_JOB_LEASE', 60)
+
+ACTIVE_STATUSES = (AnalysisStatus.QUEUED, AnalysisStatus.RUNNING)
+
+
+def enqueue_analysis(doc):
+    """
+    Ставит анализ документа в очередь и возвращает задачу.
+
+    Если анализ документа уже в очереди или выполняется, новая задача не создаётся.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # Блокировка строки Doc не даёт двум одновременным запросам создать две задачи
+        Doc.objects.select_for_update().filter(id=doc.id).exists()
+        job = AnalysisJob.objects.filter(doc=doc, status__in=ACTIVE_STATUSES).first()
+        if job is not None:
+            return job
+        job = AnalysisJob.objects.create(doc=doc, run_after=now)
+        Doc.objects.filter(id=doc.id).update(
+            analysis_status=AnalysisStatus.QUEUED,
+            analysis_queued_at=now,
+            analysis_started_at=None,
+            analysis_finished_at=None,
+        )
+    fragment_cache.bump(doc.user_id)
+    # Новый анализ заменит извлечённый текст
+    forget_texts(doc)
+    logger.info("Анализ документа %s поставлен в очередь (задача %s).", doc.id, job.id)
+    return job
+
+
+def claim_jobs(limit=10, lease=ANALYSIS_JOB_LEASE):
+    """Захватывает до limit готовых к выполнению задач и откладывает их на время lease."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            AnalysisJob.objects.select_for_update(skip_locked=True)
+            .filter(status__in=ACTIVE_STATUSES, run_after__lte=now)
+            .select_related('doc')
+            .order_by('run_after')[:limit]
+        )
+        if jobs:
+            AnalysisJob.objects.filter(id__in=[job.id for job in jobs]).update(
+                run_after=now + timedelta(seconds=lease)
+            )
+    return jobs
+
+
+def retry_delay(attempts):
+    return min(ANALYSIS_RETRY_BACKOFF * 2 ** (attempts - 1), ANALYSIS_RETRY_BACKOFF_MAX)
+
+
+def process_job(job):
+    """Выполняет следующий шаг задачи и возвращает её новое состояние."""
+    try:
+        if job.status == AnalysisStatus.QUEUED:
+            _dispatch(job)
+        else:
+            _poll(job)
+    except ValueError as e:
+        # Тело ответа не JSON (ошибка прокси, HTML-страница): повторяем как сбой FastAPI
+        _fail_attempt(job, f"Неверный ответ FastAPI: {e}")
+    except requests.RequestException as e:
+        _fail_attempt(job, f"Ошибка соединения с FastAPI: {e}")
+    return job.status
+
+
+def _dispatch(job):
+    doc = job.doc
+    response = backend.put(f"{FASTAPI_BASE_URL}/doc_analyse/{doc.fastapi_doc_id}")
+    if response.status_code != 200:
+        _fail_attempt(job, f"Ошибка при запуске анализа: {response.status_code} {response.text}")
+        return
+
+    now = timezone.now()
+    job.status = AnalysisStatus.RUNNING
+    job.attempts = 0
+    job.started_at = now
+    job.run_after = now + timedelta(seconds=ANALYSIS_POLL_INTERVAL)
+    job.save(update_fields=['status', 'attempts', 'started_at', 'run_after'])
+    Doc.objects.filter(id=doc.id).update(analysis_status=AnalysisStatus.RUNNING, analysis_started_at=now)
+    fragment_cache.bump(doc.user_id)
+    logger.info("Анализ документа %s запущен (задача %s).", doc.id, job.id)
+
+
+def _poll(job):
+    doc = job.doc
+    response = backend.get(f"{FASTAPI_BASE_URL}/get_text/{doc.fastapi_doc_id}")
+    if response.status_code != 200:
+        _fail_attempt(job, f"Ошибка при получении текста: {response.status_code} {response.text}")
+        return
+
+    texts = response.json().get('texts', [])
+    now = timezone.now()
+    if texts:
+        save_texts(doc, texts)
+        _finish(job, AnalysisStatus.DONE, now)
+        logger.info("Анализ документа %s завершён за %.1f с.", doc.id, (now - job.started_at).total_seconds())
+        return
+
+    if job.started_at and now - job.started_at > timedelta(seconds=ANALYSIS_POLL_TIMEOUT):
+        job.last_error = f"Текст не готов через {ANALYSIS_POLL_TIMEOUT} с после запуска анализа."
+        _finish(job, AnalysisStatus.FAILED, now)
+        logger.error("Анализ документа %s: %s", doc.id, job.last_error)
+        return
+
+    # Анализ ещё идёт
+    job.attempts = 0
+    job.run_after = now + timedelta(seconds=ANALYSIS_POLL_INTERVAL)
+    job.save(update_fields=['attempts', 'run_after'])
+
+
+def _fail_attempt(job, error):
+    now = timezone.now()
+    job.attempts += 1
+    job.last_error = error
+    if job.attempts >= ANALYSIS_MAX_ATTEMPTS:
+        _finish(job, AnalysisStatus.FAILED, now)
+        logger.error("Анализ документа %s не удался после %s попыток: %s", job.doc_id, job.attempts, error)
+        return
+    delay = retry_delay(job.attempts)
+    job.run_after = now + timedelta(seconds=delay)
+    job.save(update_fields=['attempts', 'last_error', 'run_after'])
+    logger.warning("Анализ документа %s, попытка %s: %s. Повтор через %s с.", job.doc_id, job.attempts, error, delay)
+
+
+def _finish(job, status, now):
+    job.status = status
+    job.finished_at = now
+    job.save(update_fields=['status', 'attempts', 'last_error', 'finished_at'])
+    Doc.objects.filter(id=job.doc_id).update(analysis_status=status, analysis_finished_at=now)
+    fragment_cache.bump(job.doc.user_id)
+
+
+def run_once(limit=10):
+    """Обрабатывает одну пачку задач; возвращает число обработанных."""
+    jobs = claim_jobs(limit)
+    for job in jobs:
+        try:
+            process_job(job)
+        except Exception as e:
+            # Например, документ удалён во время обработки; задача вернётся в очередь после аренды
+            logger.exception("Ошибка обработки задачи анализа %s: %s", job.id, e)
+    return len(jobs)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MiDjangoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mi_django'
+
+    def ready(self):
+        # Сигналы сброса таблицы цен и кэша фрагментов, замер запросов к БД на новых соединениях
+        from . import fragments, metrics, prices  # noqa: F401
+        # last_login записывается пачками, а не user.save() на каждый вход
+        from .logins import replace_last_login_handler
+        replace_last_login_handler()
@@ -0,0 +1,242 @@
+"""
+Асинхронные варианты представлений, обращающихся к прокси-серверу и FastAPI.
+
+Под ASGI (uvicorn) ожидание ответа сервиса не занимает поток воркера, поэтому
+один воркер обслуживает сотни одновременных обращений к бэкенду. Подключаются
+вместо синхронных в mi_django/urls.py при ASYNC_VIEWS = True.
+"""
+import logging
+import os
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.http import require_POST
+
+from .http_client import async_backend, token_manager, FASTAPI_BASE_URL
+from .doc_text import load_texts, save_texts
+from .analysis_queue import enqueue_analysis
+from .models import Doc, Cart
+from .text_cache import text_cache
+from .thumbnails import delete_thumbnails, generate_thumbnails
+from .media_store import create_from_existing, delete_doc, discard_unreferenced, shared_thumbnails
+from .deletions import confirm_deleted
+from .uploads import LocalCopy, MultipartFileStream, content_addressed_name, upload_sha256
+
+logger = logging.getLogger(__name__)
+
+# render() обращается к request.user и сессии, которые загружаются синхронно
+arender = sync_to_async(render)
+
+
+async def _aget_owned_doc(request, doc_id):
+    user = await request.auser()
+    return await Doc.objects.filter(id=doc_id, user=user).afirst()
+
+
+def _remove_files(file_path, thumbnails):
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    delete_thumbnails(thumbnails)
+
+
+@login_required
+async def get_document_text(request, doc_id):
+    doc = await _aget_owned_doc(request, doc_id)
+    if doc is None:
+        return HttpResponse("Документ не найден", status=404)
+
+    texts = await sync_to_async(load_texts)(doc)
+    if texts is not None:
+        return await arender(request, 'mi_django/document_text.html', {'texts': texts, 'file_path': doc.file_path})
+
+    try:
+        response = await async_backend.get(
+            f"{FASTAPI_BASE_URL}/get_text/{doc.fastapi_doc_id}", user_session=request.session
+        )
+    except httpx.HTTPError as e:
+        logger.error("Ошибка при запросе текста документа %s из FastAPI: %s", doc.id, e)
+        return HttpResponse(f"Ошибка при получении текста: {e}", status=500)
+
+    if response.status_code == 200:
+        try:
+            texts = response.json().get('texts', [])
+        except ValueError:
+            logger.error("Ответ FastAPI на запрос текста документа %s — не JSON.", doc.id)
+            return HttpResponse(f"Ошибка при получении текста: {response.text}", status=500)
+        await sync_to_async(save_texts)(doc, texts)
+        return await arender(request, 'mi_django/document_text.html', {'texts': texts, 'file_path': doc.file_path})
+    else:
+        return HttpResponse(f"Ошибка при получении текста: {response.text}", status=500)
+
+
+@login_required
+@require_POST
+async def delete_document(request, doc_id):
+    doc = await _aget_owned_doc(request, doc_id)
+    if doc is None:
+        return HttpResponse("Документ не найден", status=404)
+
+    file_path = os.path.join(settings.MEDIA_ROOT, doc.file_path)
+    last_file_ref, last_fastapi_ref = await sync_to_async(delete_doc)(doc)
+
+    # При неудаче удаление в FastAPI повторит воркер outbox
+    # Документ без анализа (fastapi_doc_id пуст) в FastAPI не отправлялся
+    if last_fastapi_ref and doc.fastapi_doc_id is not None:
+        try:
+            response = await async_backend.delete(
+                f"{FASTAPI_BASE_URL}/doc_delete/{doc.fastapi_doc_id}", user_session=request.session
+            )
+            await sync_to_async(confirm_deleted)(doc.fastapi_doc_id, response.status_code)
+        except httpx.HTTPError as e:
+            logger.error("Ошибка при удалении документа %s в FastAPI, повторит воркер: %s", doc.fastapi_doc_id, e)
+
+        await text_cache.ainvalidate(doc.fastapi_doc_id)
+
+    # Удаление файлов — блокирующий ввод-вывод, он идёт в пуле потоков
+    if last_file_ref:
+        await sync_to_async(_remove_files, thread_sensitive=False)(file_path, doc.thumbnails)
+
+    messages.success(request, "Документ и изображение успешно удалены!")
+
+    return redirect('index')
+
+
+@login_required
+async def analyze_document(request, doc_id):
+    user = await request.auser()
+    doc = await Doc.objects.filter(id=doc_id).afirst()
+    if doc is None:
+        return HttpResponse("Документ не найден", status=404)
+
+    if doc.user_id != user.id and not user.is_superuser:
+        messages.error(request, "У вас нет доступа к этому документу.")
+        return redirect('index')
+
+    if request.method != 'POST':
+        return await arender(request, 'mi_django/confirm_analyze.html', {'doc': doc})
+
+    if not user.is_superuser:
+        paid = await Cart.objects.filter(user=user, doc=doc, payment=True).aexists()
+        if not paid:
+            messages.error(request, "Сначала оплатите.")
+            return redirect('order_analysis', doc_id=doc_id)
+
+    await sync_to_async(enqueue_analysis)(doc)
+    messages.success(request, "Анализ документа поставлен в очередь!")
+    return redirect('index')
+
+
+async def _aupload(file, session, sinks=()):
+    body = MultipartFileStream(file, filename=file.name, content_type=file.content_type, sinks=sinks)
+    response = await async_backend.post(
+        f"{settings.PROXY_BASE_URL}/api/upload_doc/",
+        content=body.aiter_chunks(),
+        headers={
+            'Content-Type': body.content_type,
+            'Content-Length': str(len(body)),
+        },
+        user_session=session,
+    )
+    await sync_to_async(body.drain, thread_sensitive=False)()
+    return response
+
+
+@login_required
+async def upload_document(request):
+    if request.method != 'POST':
+        return await arender(request, 'mi_django/upload_document.html')
+
+    file = request.FILES.get("document")
+    if not file:
+        messages.error(request, "Файл не выбран.")
+        return redirect('upload_document')
+
+    access_token = await request.session.aget('access_token')
+    refresh_token = await request.session.aget('refresh_token')
+    if not access_token or not refresh_token:
+        logger.error("Ошибка аутентификации: токены отсутствуют в сессии.")
+        messages.error(request, "Ошибка аутентификации: необходимо войти в систему.")
+        return redirect('login')
+
+    # Истекающий токен обновляется до отправки, чтобы файл не пришлось отправлять повторно
+    if not await token_manager.aaccess_token(request.session):
+        messages.error(request, "Сессия истекла. Пожалуйста, войдите снова.")
+        return redirect('login')
+
+    user = await request.auser()
+    # Хэширование и запись копии — блокирующий файловый ввод-вывод, он идёт в пуле потоков
+    sha256 = await sync_to_async(upload_sha256, thread_sensitive=False)(file)
+    doc = await sync_to_async(create_from_existing)(user, sha256, file.size / 1024)
+    if doc is not None:
+        messages.success(request, "Документ успешно загружен!")
+        return redirect('index')
+
+    try:
+        local_copy = await sync_to_async(LocalCopy, thread_sensitive=False)(content_addressed_name(sha256, file.name))
+    except Exception as e:
+        logger.error("Ошибка при сохранении файла %s: %s", file.name, e)
+        messages.error(request, "Ошибка при сохранении файла.")
+        return redirect('upload_document')
+    discard = sync_to_async(local_copy.discard, thread_sensitive=False)
+
+    try:
+        response = await _aupload(file, request.session, sinks=[local_copy.write])
+        if response.status_code == 401:
+            # Токен отклонён до истечения срока (отозван, расходятся часы): без обновления не обойтись
+            if not await sync_to_async(token_manager.handle_unauthorized)(request.session, response):
+                messages.error(request, "Сессия истекла. Пожалуйста, войдите снова.")
+                await discard()
+                return redirect('login')
+            response = await _aupload(file, request.session)
+        response.raise_for_status()
+        # Ответ разбираем до сохранения копии: при ошибке файл не останется без документа
+        data = response.json()
+    except httpx.HTTPError as e:
+        logger.error("Ошибка при загрузке документа на сервер: %s", e)
+        messages.error(request, f"Ошибка при загрузке документа: {str(e)}")
+        await discard()
+        return redirect('upload_document')
+    except ValueError:
+        logger.error("Ошибка: не удалось декодировать JSON-ответ от сервера.")
+        messages.error(request, "Ошибка при обработке ответа от сервера.")
+        await discard()
+        return redirect('upload_document')
+    except Exception as e:
+        logger.error("Непредвиденная ошибка при загрузке документа: %s", e)
+        messages.error(request, "Произошла ошибка при загрузке документа.")
+        await discard()
+        return redirect('upload_document')
+
+    try:
+        file_path = await sync_to_async(local_copy.commit, thread_sensitive=False)(source=file)
+    except Exception as e:
+        logger.error("Ошибка при сохранении файла %s: %s", file.name, e)
+        messages.error(request, "Ошибка при сохранении файла.")
+        await discard()
+        return redirect('upload_document')
+
+    thumbnails = {}
+    try:
+        thumbnails = (await sync_to_async(shared_thumbnails)(file_path)
+                      or await sync_to_async(generate_thumbnails, thread_sensitive=False)(file_path))
+        await Doc.objects.acreate(
+            user=user,
+            file_path=file_path,
+            size=file.size / 1024,
+            fastapi_doc_id=data.get('id'),
+            content_hash=sha256,
+            thumbnails=thumbnails,
+        )
+    except Exception as e:
+        logger.error("Ошибка при сохранении информации о документе в базе данных: %s", e)
+        messages.error(request, "Ошибка при сохранении данных документа.")
+        await sync_to_async(discard_unreferenced)(file_path, thumbnails)
+        return redirect('upload_document')
+    logger.info("Документ %s успешно загружен. ID документа: %s", file.name, data.get('id'))
+    messages.success(request, "Документ успешно загружен!")
+    return redirect('index')
@@ -0,0 +1,231 @@
+"""
+Пакетная загрузка документов: много файлов или zip-архив в одном запросе.
+
+Файлы (и члены архива) сохраняются потоково во временные файлы с подсчётом
+sha256, затем отправляются на прокси-сервер параллельно в ограниченном пуле
+потоков (BULK_UPLOAD_CONCURRENCY). Каждый файл пишется в хранилище по
+адресу содержимого одновременно с отправкой, как и при одиночной загрузке.
+Строки Doc создаются одним bulk_create в конце, результат возвращается
+по каждому файлу отдельно.
+"""
+import contextvars
+import hashlib
+import logging
+import mimetypes
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
+
+from .fragments import fragment_cache
+from .http_client import backend, token_manager
+from .media_store import DEDUP_REUSE_ANALYSIS
+from .models import Doc
+from .thumbnails import generate_thumbnails
+from .uploads import UPLOAD_CHUNK_SIZE, LocalCopy, MultipartFileStream, content_addressed_name, upload_sha256
+
+logger = logging.getLogger(__name__)
+
+BULK_UPLOAD_CONCURRENCY = getattr(settings, 'BULK_UPLOAD_CONCURRENCY', 8)
+BULK_UPLOAD_MAX_FILES = getattr(settings, 'BULK_UPLOAD_MAX_FILES', 500)
+BULK_UPLOAD_MAX_FILE_SIZE = getattr(settings, 'BULK_UPLOAD_MAX_FILE_SIZE', 50 * 1024 * 1024)  # байт на файл в архиве
+BULK_UPLOAD_MAX_TOTAL_SIZE = getattr(settings, 'BULK_UPLOAD_MAX_TOTAL_SIZE', 500 * 1024 * 1024)  # байт на пакет после распаковки
+
+ZIP_CONTENT_TYPES = ('application/zip', 'application/x-zip-compressed')
+
+
+class BulkUploadError(Exception):
+    """Пакет не может быть принят целиком (слишком много файлов, битый архив)."""
+
+
+def is_zip(file):
+    return file.name.lower().endswith('.zip') or file.content_type in ZIP_CONTENT_TYPES
+
+
+def _extract_member(archive, member, max_size):
+    """
+    Распаковывает член архива во временный файл, считая sha256 по пути.
+    Больше max_size байт не пишет: заголовок архива может занижать размер.
+    """
+    name = os.path.basename(member.filename)
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    extracted = TemporaryUploadedFile(name, content_type, member.file_size, None)
+    hasher = hashlib.sha256()
+    size = 0
+    with archive.open(member) as source:
+        while chunk := source.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                extracted.close()
+                if size > BULK_UPLOAD_MAX_FILE_SIZE:
+                    raise BulkUploadError(f"Файл {name} в архиве больше допустимого размера.")
+                raise BulkUploadError("Пакет после распаковки больше допустимого размера.")
+            hasher.update(chunk)
+            extracted.write(chunk)
+    extracted.size = size
+    extracted.seek(0)
+    extracted.sha256 = hasher.hexdigest()
+    return extracted
+
+
+def expand_uploads(files):
+    """Разворачивает zip-архивы в список файлов; временные файлы закрывает вызывающий."""
+    result = []
+    # Сумма размеров файлов пакета: заявленных в архиве до распаковки, фактических после
+    total_size = 0
+    try:
+        for file in files:
+            if not is_zip(file):
+                total_size += file.size
+                if total_size > BULK_UPLOAD_MAX_TOTAL_SIZE:
+                    raise BulkUploadError("Пакет больше допустимого размера.")
+                result.append(file)
+                continue
+            try:
+                archive = zipfile.ZipFile(file)
+            except zipfile.BadZipFile:
+                raise BulkUploadError(f"Архив {file.name} повреждён.")
+            with archive:
+                for member in archive.infolist():
+                    name = os.path.basename(member.filename)
+                    if member.is_dir() or not name or name.startswith('.') or member.filename.startswith('__MACOSX/'):
+                        continue
+                    if member.file_size > BULK_UPLOAD_MAX_FILE_SIZE:
+                        raise BulkUploadError(f"Файл {name} в архиве больше допустимого размера.")
+                    if len(result) >= BULK_UPLOAD_MAX_FILES:
+                        raise BulkUploadError(f"В пакете больше {BULK_UPLOAD_MAX_FILES} файлов.")
+                    if total_size + member.file_size > BULK_UPLOAD_MAX_TOTAL_SIZE:
+                        raise BulkUploadError("Пакет после распаковки больше допустимого размера.")
+                    extracted = _extract_member(
+                        archive, member, min(BULK_UPLOAD_MAX_FILE_SIZE, BULK_UPLOAD_MAX_TOTAL_SIZE - total_size)
+                    )
+                    result.append(extracted)
+                    total_size += extracted.size
+    except Exception:
+        for file in result:
+            file.close()
+        raise
+    if len(result) > BULK_UPLOAD_MAX_FILES:
+        raise BulkUploadError(f"В пакете больше {BULK_UPLOAD_MAX_FILES} файлов.")
+    return result
+
+
+def _forward(file, sha256, session):
+    """Отправляет файл на прокси-сервер, сохраняя локальную копию; возвращает данные для Doc."""
+    local_copy = LocalCopy(content_addressed_name(sha256, file.name))
+
+    def post(sinks=()):
+        body = MultipartFileStream(file, filename=file.name, content_type=file.content_type, sinks=sinks)
+        response = backend.post(
+            f"{settings.PROXY_BASE_URL}/api/upload_doc/",
+            data=body,
+            headers={'Content-Type': body.content_type},
+            user_session=session,
+        )
+        body.drain()
+        return response
+
+    try:
+        response = post(sinks=[local_copy.write])
+        if response.status_code == 401:
+            # Одновременные 401 из разных потоков обновляют токен один раз
+            if not token_manager.handle_unauthorized(session, response):
+                raise requests.HTTPError("Сессия истекла. Пожалуйста, войдите снова.")
+            response = post()
+        response.raise_for_status()
+        document_id = response.json().get('id')
+        file_path = local_copy.commit(source=file)
+    except Exception:
+        local_copy.discard()
+        raise
+    return {'file_path': file_path, 'fastapi_doc_id': document_id, 'thumbnails': generate_thumbnails(file_path)}
+
+
+def _reusable_sources(user, hashes, lock=False):
+    """Уже загруженные документы с таким содержимым: sha256 -> Doc."""
+    if DEDUP_REUSE_ANALYSIS == 'none' or not hashes:
+        return {}
+    docs = Doc.objects.filter(content_hash__in=hashes, fastapi_doc_id__isnull=False)
+    if DEDUP_REUSE_ANALYSIS == 'user':
+        docs = docs.filter(user=user)
+    if lock:
+        docs = docs.select_for_update()
+    sources = {}
+    for doc in docs.only('id', 'file_path', 'fastapi_doc_id', 'content_hash', 'thumbnails').order_by('id'):
+        sources.setdefault(doc.content_hash, doc)
+    return sources
+
+
+def upload_many(user, files, session):
+    """
+    Загружает пакет файлов от имени пользователя с сессией session
+    и создаёт документы одним bulk_create.
+
+    Возвращает список {'name', 'status', 'doc_id', 'error'} в порядке файлов;
+    status — 'created' (отправлен в FastAPI), 'reused' (такое содержимое уже
+    загружено) или 'error'.
+    """
+    hashes = [upload_sha256(file) for file in files]
+    results = [{'name': file.name, 'status': None, 'doc_id': None, 'error': ''} for file in files]
+
+    # Одинаковое содержимое отправляется один раз: и уже загруженное, и повторы внутри пакета
+    sources = _reusable_sources(user, set(hashes))
+    first_index = {}
+    to_forward = []
+    for index, sha256 in enumerate(hashes):
+        if sha256 in sources or sha256 in first_index:
+            continue
+        first_index[sha256] = index
+        to_forward.append(index)
+
+    forwarded = {}
+    with ThreadPoolExecutor(max_workers=BULK_UPLOAD_CONCURRENCY) as pool:
+        # Копия контекста на каждую отправку: обращения к прокси-серверу попадут в метрики запроса
+        futures = {
+            index: pool.submit(contextvars.copy_context().run, _forward, files[index], hashes[index], session)
+            for index in to_forward
+        }
+        for index, future in futures.items():
+            try:
+                forwarded[hashes[index]] = future.result()
+            except Exception as e:
+                logger.error("Ошибка при загрузке документа %s: %s", files[index].name, e)
+                results[index].update(status='error', error=str(e))
+
+    with transaction.atomic():
+        # Блокируем переиспользуемые строки, как create_from_existing: файл не удалят до bulk_create
+        locked = _reusable_sources(user, set(sources), lock=True)
+        docs, doc_indexes = [], []
+        for index, (file, sha256) in enumerate(zip(files, hashes)):
+            if results[index]['status'] == 'error':
+                continue
+            if index == first_index.get(sha256):
+                data = forwarded[sha256]
+                results[index]['status'] = 'created'
+            elif sha256 in forwarded or sha256 in locked:
+                source = locked.get(sha256)
+                data = forwarded[sha256] if source is None else {
+                    'file_path': source.file_path,
+                    'fastapi_doc_id': source.fastapi_doc_id,
+                    'thumbnails': source.thumbnails,
+                }
+                results[index]['status'] = 'reused'
+            else:
+                # Исходный файл удалён во время загрузки или его отправка не удалась
+                results[index].update(status='error', error="Не удалось загрузить файл, повторите загрузку.")
+                continue
+            docs.append(Doc(user=user, size=file.size / 1024, content_hash=sha256, **data))
+            doc_indexes.append(index)
+        Doc.objects.bulk_create(docs)
+    # bulk_create не вызывает post_save
+    fragment_cache.bump(user.id)
+
+    for index, doc in zip(doc_indexes, docs):
+        results[index]['doc_id'] = doc.id
+    created = sum(1 for result in results if result['status'] != 'error')
+    logger.info("Пакетная загрузка пользователя %s: %s из %s файлов.", user.username, created, len(files))
+    return results
@@ -0,0 +1,274 @@
+"""
+Автоматы отключения (circuit breaker) для хостов прокси-сервера и FastAPI
+и бюджет времени запроса на обращения к ним.
+
+Когда сервис деградирует, каждое представление ждёт его до полного
+таймаута, потоки gunicorn заканчиваются, и встаёт весь сайт. Поэтому:
+
+- на каждый хост (host:port) — свой автомат. После
+  BACKEND_CIRCUIT_FAILURE_THRESHOLD неудач подряд (ошибка соединения,
+  таймаут, ответ 500/502/503/504) он размыкается, и обращения к хосту
+  BACKEND_CIRCUIT_RECOVERY_TIMEOUT секунд завершаются сразу, без сети,
+  ошибкой CircuitOpen. Потом автомат полуоткрыт: пропускает
+  BACKEND_CIRCUIT_HALF_OPEN_CALLS пробных запросов; успех замыкает его,
+  неудача снова размыкает;
+- у запроса к Django есть бюджет времени на обращения к сервисам
+  (BACKEND_LATENCY_BUDGET, для отдельных представлений —
+  BACKEND_LATENCY_BUDGETS по имени маршрута). Таймаут каждого обращения
+  урезается до остатка бюджета, а после его исчерпания обращения
+  завершаются сразу ошибкой BudgetExceeded. Повторы urllib3 идут внутри
+  одного обращения, поэтому с ними запрос может превысить бюджет на
+  время повторов.
+
+CircuitOpen и BudgetExceeded — наследники requests.ConnectionError и
+requests.Timeout (для асинхронного клиента — httpx.ConnectError и
+httpx.TimeoutException), поэтому существующая обработка ошибок
+представлений и очереди анализа работает без изменений.
+
+Состояние автоматов — в /metrics/ (Prometheus) и /metrics/backend-circuits/.
+Каждый процесс-воркер ведёт свои автоматы.
+"""
+import contextvars
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+BACKEND_CIRCUIT_FAILURE_THRESHOLD = getattr(settings, 'BACKEND_CIRCUIT_FAILURE_THRESHOLD', 5)
+BACKEND_CIRCUIT_RECOVERY_TIMEOUT = getattr(settings, 'BACKEND_CIRCUIT_RECOVERY_TIMEOUT', 30)  # секунд
+BACKEND_CIRCUIT_HALF_OPEN_CALLS = getattr(settings, 'BACKEND_CIRCUIT_HALF_OPEN_CALLS', 1)
+BACKEND_LATENCY_BUDGET = getattr(settings, 'BACKEND_LATENCY_BUDGET', None)  # секунд; None — без бюджета
+BACKEND_LATENCY_BUDGETS = getattr(settings, 'BACKEND_LATENCY_BUDGETS', {})
+
+# Ответы, означающие, что сервис недоступен или перегружен (а не ошибку в запросе)
+FAILURE_STATUSES = frozenset({500, 502, 503, 504})
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_budget = contextvars.ContextVar('backend_budget', default=None)
+
+
+class CircuitOpen(requests.ConnectionError):
+    """Автомат хоста разомкнут: запрос не отправлялся."""
+
+
+class BudgetExceeded(requests.Timeout):
+    """Бюджет времени запроса на обращения к сервисам исчерпан: запрос не отправлялся."""
+
+
+class AsyncCircuitOpen(httpx.ConnectError):
+    """Автомат хоста разомкнут (асинхронный клиент)."""
+
+
+class AsyncBudgetExceeded(httpx.TimeoutException):
+    """Бюджет времени запроса исчерпан (асинхронный клиент)."""
+
+
+def host_of(url):
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    return f'{parts.hostname}:{port}'
+
+
+class CircuitBreaker:
+    """Автомат одного хоста: closed -> open -> half_open -> closed."""
+
+    def __init__(self, host, failure_threshold=BACKEND_CIRCUIT_FAILURE_THRESHOLD,
+                 recovery_timeout=BACKEND_CIRCUIT_RECOVERY_TIMEOUT, half_open_calls=BACKEND_CIRCUIT_HALF_OPEN_CALLS):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Можно ли отправить запрос. В полуоткрытом состоянии занимает место пробного запроса."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+                logger.info("Автомат %s полуоткрыт: пробный запрос.", self.host)
+            if self._probes >= self.half_open_calls:
+                return False
+            self._probes += 1
+            return True
+
+    def retry_after(self):
+        with self._lock:
+            return max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+
+    def record(self, ok):
+        """Исход запроса: True — успех, False — неудача, None — не говорит о здоровье хоста."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes -= 1
+            if ok is None:
+                return None
+            if ok:
+                if self.state != CLOSED:
+                    logger.info("Автомат %s замкнут: сервис отвечает.", self.host)
+                self.state = CLOSED
+                self.failures = 0
+                return None
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                logger.warning("Автомат %s разомкнут после %s неудач подряд на %s с.",
+                               self.host, self.failures, self.recovery_timeout)
+                return OPEN
+            return None
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures}
+
+
+class CircuitBreakers:
+    """Автоматы по хостам процесса и их счётчики."""
+
+    def __init__(self, **options):
+        self.options = options
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.rejected = Counter('backend_circuit_rejected_total',
+                                'Обращения, отклонённые без сети (автомат разомкнут или бюджет исчерпан).',
+                                labels=('host', 'reason'))
+        self.opened = Counter('backend_circuit_opened_total', 'Размыкания автомата.', labels=('host',))
+
+    def get(self, host):
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(host, CircuitBreaker(host, **self.options))
+        return breaker
+
+    def before_request(self, url, timeout, open_error, budget_error):
+        """Проверяет автомат и бюджет; возвращает автомат и таймаут, урезанный до остатка бюджета."""
+        host = host_of(url)
+        remaining = remaining_budget()
+        if remaining is not None and remaining <= 0:
+            self.rejected.inc(host, 'budget')
+            raise budget_error("Бюджет времени запроса на обращения к сервисам исчерпан.")
+        breaker = self.get(host)
+        if not breaker.allow():
+            self.rejected.inc(host, 'open')
+            raise open_error(f"Сервис {host} недоступен, повтор через {breaker.retry_after():.0f} с.")
+        return breaker, _cap_timeout(timeout, remaining)
+
+    def record(self, breaker, ok):
+        if breaker.record(ok) == OPEN:
+            self.opened.inc(breaker.host)
+
+    def stats(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.host: breaker.snapshot() for breaker in breakers}
+
+    def render(self):
+        lines = ['# HELP backend_circuit_state Состояние автомата хоста: 0 — замкнут, 1 — полуоткрыт, 2 — разомкнут.',
+                 '# TYPE backend_circuit_state gauge']
+        for host, snapshot in sorted(self.stats().items()):
+            lines.append(f'backend_circuit_state{{host="{host}"}} {_STATE_VALUES[snapshot["state"]]}')
+        lines += self.rejected.render()
+        lines += self.opened.render()
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._breakers.clear()
+        self.rejected.reset()
+        self.opened.reset()
+
+
+circuit_breakers = CircuitBreakers()
+
+
+def _cap_timeout(timeout, remaining):
+    if remaining is None or timeout is None:
+        return timeout if remaining is None else remaining
+    if isinstance(timeout, httpx.Timeout):
+        return httpx.Timeout(**{name: remaining if part is None else min(part, remaining)
+                                for name, part in timeout.as_dict().items()})
+    if isinstance(timeout, (tuple, list)):
+        return tuple(min(part, remaining) for part in timeout)
+    return min(timeout, remaining)
+
+
+class Budget:
+    """Срок, до которого текущий запрос может ждать сервисы."""
+
+    __slots__ = ('started', 'seconds')
+
+    def __init__(self, seconds=None):
+        self.started = time.monotonic()
+        self.seconds = seconds
+
+    def remaining(self):
+        if self.seconds is None:
+            return None
+        return self.seconds - (time.monotonic() - self.started)
+
+
+def remaining_budget():
+    """Остаток бюджета текущего запроса в секундах или None, если бюджета нет."""
+    budget = _budget.get()
+    return budget.remaining() if budget is not None else None
+
+
+def budget_for(view_name):
+    return BACKEND_LATENCY_BUDGETS.get(view_name, BACKEND_LATENCY_BUDGET)
+
+
+class BackendBudgetMiddleware:
+    """Задаёт бюджет времени на обращения к сервисам по имени маршрута представления."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        # Отсчёт от начала запроса; сам бюджет известен после разбора URL (process_view)
+        token = _budget.set(Budget())
+        try:
+            return self.get_response(request)
+        finally:
+            _budget.reset(token)
+
+    async def __acall__(self, request):
+        token = _budget.set(Budget())
+        try:
+            return await self.get_response(request)
+        finally:
+            _budget.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = _budget.get()
+        if budget is not None:
+            budget.seconds = budget_for(request.resolver_match.url_name)
+        return None
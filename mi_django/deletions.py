@@ -0,0 +1,161 @@
+"""
+Пакетное удаление документов и надёжное удаление их в FastAPI.
+
+Удаление документа раньше обращалось к FastAPI прямо в запросе, не
+проверяя ответ: при сбое документ оставался в FastAPI навсегда. Теперь:
+
+- строки Doc удаляются пачками (media_store.delete_docs), а документы
+  FastAPI без других ссылок в той же транзакции попадают в outbox
+  (BackendDeletion);
+- файлы и миниатюры без ссылок удаляются с диска в пуле потоков;
+- воркер (manage.py run_deletion_worker) забирает записи outbox пачками
+  через SELECT ... FOR UPDATE SKIP LOCKED, отправляет DELETE в FastAPI
+  параллельно и удаляет запись после ответа 200/204/404. Неудачи
+  повторяются с экспоненциальной задержкой без ограничения числа попыток.
+
+Представления удаления одного документа по-прежнему сразу обращаются
+к FastAPI и убирают запись outbox при успехе (confirm_deleted), чтобы
+не ждать воркер.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .fragments import fragment_cache
+from .http_client import backend, FASTAPI_BASE_URL
+from .media_store import delete_docs
+from .models import BackendDeletion, Doc
+from .text_cache import text_cache
+
+logger = logging.getLogger(__name__)
+
+DELETION_BATCH_SIZE = getattr(settings, 'DELETION_BATCH_SIZE', 1000)  # строк Doc в одной транзакции
+DELETION_MAX_SELECTED = getattr(settings, 'DELETION_MAX_SELECTED', 10000)  # документов, выбранных в одном запросе
+DELETION_UNLINK_WORKERS = getattr(settings, 'DELETION_UNLINK_WORKERS', 8)  # потоков удаления файлов
+DELETION_CONCURRENCY = getattr(settings, 'DELETION_CONCURRENCY', 8)  # одновременных DELETE в FastAPI
+DELETION_RETRY_BACKOFF = getattr(settings, 'DELETION_RETRY_BACKOFF', 5)  # секунд, удваивается с каждой попыткой
+DELETION_RETRY_BACKOFF_MAX = getattr(settings, 'DELETION_RETRY_BACKOFF_MAX', 3600)
+DELETION_LEASE = getattr(settings, 'DELETION_LEASE', 60)  # секунд, как ANALYSIS_JOB_LEASE
+
+# 404: документа в FastAPI уже нет — удалять нечего
+DELETED_STATUSES = frozenset({200, 204, 404})
+
+
+def delete_documents(user, doc_ids=None):
+    """
+    Удаляет документы пользователя (все, если doc_ids не задан) и возвращает
+    их число. Документы FastAPI удалит воркер run_deletion_worker.
+    """
+    deleted, files, fastapi_ids, user_ids = delete_docs(user, doc_ids, DELETION_BATCH_SIZE)
+    removed = unlink_files(files)
+    for fastapi_doc_id in fastapi_ids:
+        text_cache.invalidate(fastapi_doc_id)
+    # Строки удалены без сигналов: кэш фрагментов сбрасывается один раз на пользователя
+    for user_id in user_ids:
+        fragment_cache.bump(user_id)
+    logger.info("Пользователь %s удалил %s документов: файлов удалено %s, в очереди FastAPI %s.",
+                user.id, deleted, removed, len(fastapi_ids))
+    return deleted
+
+
+def _unlink(name):
+    try:
+        os.remove(os.path.join(settings.MEDIA_ROOT, name))
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.error("Не удалось удалить файл %s: %s", name, e)
+        return False
+
+
+def unlink_files(files):
+    """Удаляет файлы {путь: миниатюры} вместе с миниатюрами; возвращает число удалённых файлов."""
+    names = [name for file_path, thumbnails in files.items()
+             for name in [file_path, *(thumbnails or {}).values()]]
+    if not names:
+        return 0
+    with ThreadPoolExecutor(max_workers=DELETION_UNLINK_WORKERS) as pool:
+        return sum(pool.map(_unlink, names))
+
+
+def confirm_deleted(fastapi_doc_id, status_code):
+    """Убирает запись outbox, если FastAPI подтвердил удаление; иначе её повторит воркер."""
+    if status_code in DELETED_STATUSES:
+        BackendDeletion.objects.filter(fastapi_doc_id=fastapi_doc_id).delete()
+        return True
+    logger.warning("FastAPI ответил %s на удаление документа %s, повторит воркер.", status_code, fastapi_doc_id)
+    return False
+
+
+def claim_deletions(limit=100, lease=DELETION_LEASE):
+    """Захватывает до limit записей outbox, готовых к отправке, и откладывает их на время lease."""
+    now = timezone.now()
+    with transaction.atomic():
+        entries = list(
+            BackendDeletion.objects.select_for_update(skip_locked=True)
+            .filter(run_after__lte=now)
+            .order_by('run_after')[:limit]
+        )
+        if entries:
+            BackendDeletion.objects.filter(id__in=[entry.id for entry in entries]).update(
+                run_after=now + timedelta(seconds=lease)
+            )
+    return entries
+
+
+def retry_delay(attempts):
+    return min(DELETION_RETRY_BACKOFF * 2 ** (attempts - 1), DELETION_RETRY_BACKOFF_MAX)
+
+
+def _send(fastapi_doc_id):
+    """Ошибка удаления документа в FastAPI или None при успехе."""
+    try:
+        response = backend.delete(f"{FASTAPI_BASE_URL}/doc_delete/{fastapi_doc_id}")
+    except requests.RequestException as e:
+        return f"Ошибка соединения с FastAPI: {e}"
+    if response.status_code not in DELETED_STATUSES:
+        return f"Ошибка при удалении: {response.status_code} {response.text}"
+    return None
+
+
+def run_once(limit=100):
+    """Обрабатывает одну пачку outbox; возвращает число обработанных записей."""
+    entries = claim_deletions(limit)
+    if not entries:
+        return 0
+
+    # Документ FastAPI снова используется (повторная загрузка того же содержимого до удаления)
+    referenced = set(
+        Doc.objects.filter(fastapi_doc_id__in=[entry.fastapi_doc_id for entry in entries])
+        .values_list('fastapi_doc_id', flat=True)
+    )
+    to_send = [entry for entry in entries if entry.fastapi_doc_id not in referenced]
+    with ThreadPoolExecutor(max_workers=DELETION_CONCURRENCY) as pool:
+        errors = list(pool.map(_send, [entry.fastapi_doc_id for entry in to_send]))
+
+    done = [entry.id for entry in entries if entry.fastapi_doc_id in referenced]
+    failed = []
+    now = timezone.now()
+    for entry, error in zip(to_send, errors):
+        if error is None:
+            done.append(entry.id)
+            continue
+        entry.attempts += 1
+        entry.last_error = error
+        entry.run_after = now + timedelta(seconds=retry_delay(entry.attempts))
+        failed.append(entry)
+        logger.warning("Удаление документа FastAPI %s, попытка %s: %s", entry.fastapi_doc_id, entry.attempts, error)
+
+    BackendDeletion.objects.filter(id__in=done).delete()
+    BackendDeletion.objects.bulk_update(failed, ['attempts', 'last_error', 'run_after'])
+    if referenced:
+        logger.info("Документы FastAPI %s снова используются, удаление отменено.", sorted(referenced))
+    logger.info("Outbox удалений: удалено в FastAPI %s, ошибок %s.", len(done) - len(referenced), len(failed))
+    return len(entries)
@@ -0,0 +1,107 @@
+"""
+Извлечённый текст документов, сохранённый в БД (модель DocText).
+
+После первого успешного получения из FastAPI текст хранится в Postgres, и
+страница текста больше не зависит от доступности FastAPI. Порядок чтения:
+кэш процесса (text_cache) -> DocText -> FastAPI. Если задан
+DOC_TEXT_REFRESH_AFTER (секунды), устаревшая запись обновляется в фоновом
+потоке, а пользователь сразу получает сохранённый текст.
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .http_client import backend, FASTAPI_BASE_URL
+from .models import DocText
+from .text_cache import text_cache
+
+logger = logging.getLogger(__name__)
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def compute_hash(texts):
+    payload = json.dumps(texts, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def load_texts(doc):
+    """Сохранённый текст документа или None, если его ещё нет."""
+    texts = text_cache.get(doc.fastapi_doc_id)
+    if texts is not None:
+        return texts
+
+    stored = DocText.objects.filter(doc=doc).only('texts', 'fetched_at').first()
+    if stored is None:
+        return None
+
+    text_cache.set(doc.fastapi_doc_id, stored.texts)
+    refresh_after = getattr(settings, 'DOC_TEXT_REFRESH_AFTER', None)
+    if refresh_after is not None and stored.fetched_at < timezone.now() - timedelta(seconds=refresh_after):
+        refresh_in_background(doc)
+    return stored.texts
+
+
+def save_texts(doc, texts):
+    """Сохраняет текст завершённого анализа; пустой ответ не сохраняется."""
+    if not texts:
+        return
+    DocText.objects.update_or_create(
+        doc=doc,
+        defaults={'texts': texts, 'content_hash': compute_hash(texts), 'fetched_at': timezone.now()},
+    )
+    text_cache.set(doc.fastapi_doc_id, texts)
+
+
+def forget_texts(doc):
+    """Удаляет сохранённый текст, например перед новым анализом."""
+    # Документ FastAPI может быть общим для нескольких Doc с одинаковым содержимым
+    if doc.fastapi_doc_id is not None:
+        DocText.objects.filter(doc__fastapi_doc_id=doc.fastapi_doc_id).delete()
+    else:
+        DocText.objects.filter(doc=doc).delete()
+    text_cache.invalidate(doc.fastapi_doc_id)
+
+
+def _refresh(doc):
+    try:
+        response = backend.get(f"{FASTAPI_BASE_URL}/get_text/{doc.fastapi_doc_id}")
+        if response.status_code != 200:
+            logger.warning("Фоновое обновление текста документа %s: статус %s", doc.id, response.status_code)
+            return
+        texts = response.json().get('texts', [])
+        if not texts:
+            return
+        new_hash = compute_hash(texts)
+        updated = DocText.objects.filter(doc=doc).exclude(content_hash=new_hash).update(
+            texts=texts, content_hash=new_hash, fetched_at=timezone.now(),
+        )
+        if updated:
+            text_cache.set(doc.fastapi_doc_id, texts)
+            logger.info("Текст документа %s обновлён в фоне.", doc.id)
+        else:
+            DocText.objects.filter(doc=doc).update(fetched_at=timezone.now())
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("Фоновое обновление текста документа %s не удалось: %s", doc.id, e)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(doc.id)
+        # У фонового потока своё соединение с БД
+        connection.close()
+
+
+def refresh_in_background(doc):
+    """Запускает обновление текста из FastAPI, не более одного на документ."""
+    with _refreshing_lock:
+        if doc.id in _refreshing:
+            return
+        _refreshing.add(doc.id)
+    threading.Thread(target=_refresh, args=(doc,), daemon=True).start()
@@ -0,0 +1,143 @@
+"""
+Кэш отрисованных фрагментов страниц пользователя: сетки документов на
+главной и списка корзины.
+
+Ключ фрагмента содержит метку версии пользователя из кэша Django. При
+сохранении или удалении Doc и Cart (сигналы post_save/post_delete) метка
+заменяется новой, и все фрагменты пользователя перестают находиться —
+старые записи просто истекают по FRAGMENT_CACHE_TIMEOUT. Попадание не
+обращается к БД и не отрисовывает шаблон.
+
+Во фрагментах есть формы с {% csrf_token %}. Маскированный токен остаётся
+действительным, пока не сменился секрет CSRF посетителя, поэтому хэш
+секрета тоже входит в ключ: после входа (смена секрета) фрагмент
+отрисуется заново.
+
+Изменения через QuerySet.update(), bulk_create и bulk_update сигналов не
+вызывают — после них нужно вызвать fragment_cache.bump(user_id). Между
+процессами метка действует только с общим кэшем (Redis, Memcached, база
+данных), как и у таблицы цен.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.middleware.csrf import get_token
+
+from .metrics import Counter
+from .models import Cart, Doc
+
+logger = logging.getLogger(__name__)
+
+FRAGMENT_CACHE_ALIAS = getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'default')
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 3600)  # секунд
+
+
+class FragmentCache:
+    """Фрагменты HTML пользователя, версионированные меткой последнего изменения."""
+
+    def __init__(self, cache_alias=FRAGMENT_CACHE_ALIAS, timeout=FRAGMENT_CACHE_TIMEOUT):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self.lookups = Counter('django_fragment_cache_lookups_total',
+                               'Обращения к кэшу фрагментов страниц.', labels=('fragment', 'result'))
+        self._render_time = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def _version_key(user_id):
+        return f'fragments:version:{user_id}'
+
+    def version(self, user_id):
+        key = self._version_key(user_id)
+        version = self.cache.get(key)
+        if version is None:
+            # Кэш очищен или перезапущен: заводим метку (add — если другой процесс не успел раньше)
+            self.cache.add(key, uuid.uuid4().hex, None)
+            version = self.cache.get(key)
+        return version
+
+    def bump(self, user_id):
+        """Делает недействительными все фрагменты пользователя."""
+        self.cache.set(self._version_key(user_id), uuid.uuid4().hex, None)
+        logger.debug("Метка фрагментов пользователя %s обновлена.", user_id)
+
+    def key(self, request, name, *parts):
+        # get_token заводит секрет CSRF, если его ещё нет, как это сделал бы {% csrf_token %}
+        get_token(request)
+        secret = hashlib.sha256(request.META['CSRF_COOKIE'].encode()).hexdigest()[:16]
+        suffix = ':'.join(str(part) for part in parts)
+        return f'fragments:{name}:{request.user.id}:{self.version(request.user.id)}:{secret}:{suffix}'
+
+    def get_or_render(self, request, name, render, *parts):
+        """
+        Значение фрагмента name из кэша или результат render(), сохранённый
+        в кэш. render возвращает любое сериализуемое значение — обычно
+        отрисованный HTML вместе с данными, нужными остальной странице.
+        """
+        key = self.key(request, name, *parts)
+        value = self.cache.get(key)
+        if value is not None:
+            self.lookups.inc(name, 'hit')
+            return value
+        self.lookups.inc(name, 'miss')
+        started = time.perf_counter()
+        value = render()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            total, count = self._render_time.get(name, (0.0, 0))
+            self._render_time[name] = (total + elapsed, count + 1)
+        self.cache.set(key, value, self.timeout)
+        return value
+
+    def stats(self):
+        with self._lock:
+            render_time = dict(self._render_time)
+        fragments = {}
+        for name in sorted({label_values[0] for label_values in self.lookups.items()} | set(render_time)):
+            hits, misses = self.lookups.value(name, 'hit'), self.lookups.value(name, 'miss')
+            total, count = render_time.get(name, (0.0, 0))
+            fragments[name] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+                'avg_render_ms': total / count * 1000 if count else 0.0,
+            }
+        hits = sum(fragment['hits'] for fragment in fragments.values())
+        misses = sum(fragment['misses'] for fragment in fragments.values())
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+            'fragments': fragments,
+        }
+
+    def reset(self):
+        self.lookups.reset()
+        with self._lock:
+            self._render_time.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+@receiver([post_save, post_delete], sender=Doc, dispatch_uid='fragments_doc_changed')
+@receiver([post_save, post_delete], sender=Cart, dispatch_uid='fragments_cart_changed')
+def _user_data_changed(sender, instance, **kwargs):
+    user_id = instance.user_id
+    fragment_cache.bump(user_id)
+    # Внутри транзакции — ещё раз после фиксации: параллельный запрос мог
+    # закэшировать данные до коммита под новой меткой
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: fragment_cache.bump(user_id))
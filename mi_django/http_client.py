@@ -0,0 +1,308 @@
+"""
+Общий HTTP-клиент для обращений к прокси-серверу и FastAPI.
+
+Каждый процесс-воркер один раз создаёт requests.Session с пулом keep-alive
+соединений на каждый хост, единым таймаутом и повтором с экспоненциальной
+задержкой для идемпотентных методов. Клиент считает попадания в пул
+(переиспользованное соединение) и промахи (новое TCP-соединение).
+
+Для асинхронных представлений (ASGI) есть AsyncBackendClient на httpx
+с теми же настройками пула и таймаутов.
+
+Запросы от имени пользователя передают его сессию (user_session=request.session):
+клиент подставляет действующий access-токен через token_manager и, если
+тело запроса можно отправить повторно, один раз повторяет запрос после 401.
+
+Каждое обращение учитывается в метриках текущего запроса (metrics.backend_call)
+и проходит через автомат отключения хоста и бюджет времени запроса
+(circuit.circuit_breakers).
+"""
+import asyncio
+import logging
+import os
+import threading
+import weakref
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from .circuit import (FAILURE_STATUSES, AsyncBudgetExceeded, AsyncCircuitOpen, BudgetExceeded, CircuitOpen,
+                      circuit_breakers)
+from .metrics import backend_call
+from .tokens import TokenManager
+
+logger = logging.getLogger(__name__)
+
+FASTAPI_BASE_URL = os.environ.get('FASTAPI_BASE_URL', 'http://web:8000')
+
+
+class PoolStats:
+    """Счётчики переиспользования соединений по хостам."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def record(self, host, reused):
+        with self._lock:
+            counters = self._hosts.setdefault(host, {'hits': 0, 'misses': 0})
+            counters['hits' if reused else 'misses'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for host, counters in self._hosts.items():
+                total = counters['hits'] + counters['misses']
+                result[host] = {
+                    **counters,
+                    'reuse_ratio': counters['hits'] / total if total else 0.0,
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._hosts.clear()
+
+
+pool_stats = PoolStats()
+
+
+class _CountingPoolMixin:
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout=timeout)
+        # Соединение из пула уже подключено; новое подключится при отправке запроса
+        pool_stats.record(f"{self.host}:{self.port}", reused=conn.is_connected)
+        return conn
+
+
+class CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+
+class BackendClient:
+    """
+    Пул соединений к внутренним сервисам, создаваемый один раз на процесс.
+
+    Сессия создаётся лениво и пересоздаётся после fork(), чтобы воркеры
+    gunicorn не делили сокеты родительского процесса. Cookies от сервисов
+    не сохраняются: сессия общая для всех пользователей.
+    """
+
+    def __init__(self, pool_connections=None, pool_maxsize=None, timeout=None,
+                 retries=None, backoff_factor=None, breakers=None):
+        self.pool_connections = pool_connections or getattr(settings, 'BACKEND_POOL_CONNECTIONS', 10)
+        self.pool_maxsize = pool_maxsize or getattr(settings, 'BACKEND_POOL_MAXSIZE', 20)
+        self.timeout = timeout or getattr(settings, 'BACKEND_TIMEOUT', 10)
+        self.retries = retries if retries is not None else getattr(settings, 'BACKEND_RETRIES', 3)
+        self.backoff_factor = (backoff_factor if backoff_factor is not None
+                               else getattr(settings, 'BACKEND_RETRY_BACKOFF', 0.3))
+        self.breakers = breakers or circuit_breakers
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    def _create_session(self):
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # только идемпотентные методы
+            raise_on_status=False,
+        )
+        adapter = PooledHTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        logger.debug("Создан пул соединений к сервисам (pid %s, pool_maxsize=%s, retries=%s)",
+                     os.getpid(), self.pool_maxsize, self.retries)
+        return session
+
+    @property
+    def session(self):
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._create_session()
+                    self._pid = pid
+        return self._session
+
+    def _send(self, method, url, **kwargs):
+        breaker, kwargs['timeout'] = self.breakers.before_request(
+            url, kwargs.get('timeout'), CircuitOpen, BudgetExceeded
+        )
+        ok = None
+        try:
+            with backend_call():
+                response = self.session.request(method, url, **kwargs)
+            ok = response.status_code not in FAILURE_STATUSES
+            return response
+        except (requests.ConnectionError, requests.Timeout):
+            ok = False
+            raise
+        finally:
+            self.breakers.record(breaker, ok)
+
+    def request(self, method, url, user_session=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if user_session is None:
+            return self._send(method, url, **kwargs)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        token = token_manager.access_token(user_session)
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        response = self._send(method, url, headers=headers, **kwargs)
+        if response.status_code == 401 and token and _replayable(kwargs):
+            token = token_manager.handle_unauthorized(user_session, response)
+            if token:
+                headers['Authorization'] = f'Bearer {token}'
+                response = self._send(method, url, headers=headers, **kwargs)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def stats(self):
+        return pool_stats.snapshot()
+
+
+backend = BackendClient()
+token_manager = TokenManager(backend)
+
+
+def _replayable(kwargs):
+    """Тело запроса можно отправить ещё раз (не поток и не файл)."""
+    if kwargs.get('files'):
+        return False
+    body = kwargs.get('data', kwargs.get('content'))
+    return body is None or isinstance(body, (bytes, str, dict, list, tuple))
+
+
+def _httpx_timeout(timeout):
+    """Таймаут в формате requests (число или пара подключение/чтение) для httpx."""
+    if isinstance(timeout, httpx.Timeout):
+        return timeout
+    if isinstance(timeout, (tuple, list)):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+class AsyncBackendClient:
+    """
+    Асинхронный пул соединений на httpx.AsyncClient.
+
+    httpx.AsyncClient привязан к циклу событий, поэтому клиент создаётся
+    отдельно для каждого цикла (под uvicorn он один на воркер).
+    """
+
+    def __init__(self, pool_maxsize=None, timeout=None, retries=None, breakers=None):
+        self.breakers = breakers or circuit_breakers
+        self.pool_maxsize = pool_maxsize or getattr(settings, 'BACKEND_POOL_MAXSIZE', 20)
+        self.max_connections = getattr(settings, 'BACKEND_ASYNC_MAX_CONNECTIONS', 500)
+        self.timeout = timeout or getattr(settings, 'BACKEND_TIMEOUT', 10)
+        self.retries = retries if retries is not None else getattr(settings, 'BACKEND_RETRIES', 3)
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _create_client(self):
+        timeout = _httpx_timeout(self.timeout)
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.pool_maxsize,
+        )
+        # Транспорт httpx повторяет только неудачные подключения, что безопасно для любых методов
+        transport = httpx.AsyncHTTPTransport(retries=self.retries, limits=limits)
+        # Cookies от сервисов не сохраняются: клиент общий для всех пользователей
+        cookies = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+        return httpx.AsyncClient(timeout=timeout, limits=limits, transport=transport, cookies=cookies)
+
+    @property
+    def client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = self._create_client()
+            logger.debug("Создан асинхронный пул соединений к сервисам (pid %s)", os.getpid())
+        return client
+
+    async def _send(self, method, url, **kwargs):
+        breaker, timeout = self.breakers.before_request(
+            url, kwargs.pop('timeout', self.timeout), AsyncCircuitOpen, AsyncBudgetExceeded
+        )
+        kwargs['timeout'] = _httpx_timeout(timeout)
+        ok = None
+        try:
+            with backend_call():
+                response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code not in FAILURE_STATUSES
+            return response
+        except (httpx.TransportError, httpx.TimeoutException):
+            ok = False
+            raise
+        finally:
+            self.breakers.record(breaker, ok)
+
+    async def request(self, method, url, user_session=None, **kwargs):
+        if user_session is None:
+            return await self._send(method, url, **kwargs)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        token = await token_manager.aaccess_token(user_session)
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        response = await self._send(method, url, headers=headers, **kwargs)
+        if response.status_code == 401 and token and _replayable(kwargs):
+            token = await sync_to_async(token_manager.handle_unauthorized)(user_session, response)
+            if token:
+                headers['Authorization'] = f'Bearer {token}'
+                response = await self._send(method, url, headers=headers, **kwargs)
+        return response
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        return await self.request('PUT', url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request('DELETE', url, **kwargs)
+
+
+async_backend = AsyncBackendClient()
@@ -0,0 +1,236 @@
+"""
+Быстрый путь входа (login_view).
+
+Пароль проверяет прокси-сервер (/api/login/), а пользователь Django нужен
+только для сессии. Раньше каждый вход выполнял get_or_create и запись
+last_login — минимум два обращения к БД и запись, что в утренний пик
+входов становится узким местом. Здесь:
+
+- login_users — кэш username -> (id, пароль, is_active) в кэше Django:
+  повторный вход не читает auth_user. Запись сбрасывается при сохранении,
+  переименовании и удалении пользователя (post_save/post_delete);
+  изменения через QuerySet.update() её не сбрасывают — нужен
+  login_users.invalidate(username);
+- rejected_logins — отрицательный кэш: пара (имя, пароль), отклонённая
+  прокси-сервером, LOGIN_REJECTED_CACHE_TIMEOUT секунд отклоняется без
+  обращения к нему. Хранится HMAC пары, не пароль;
+- login_rate_limit — необязательное ограничение обращений к /api/login/
+  на имя пользователя (LOGIN_RATE_LIMIT = (попыток, секунд));
+- last_logins — last_login копится в памяти процесса и записывается одним
+  UPDATE раз в LOGIN_LAST_LOGIN_FLUSH_INTERVAL секунд (и при выходе
+  процесса). При аварийном завершении воркера теряются отметки за
+  последний интервал.
+
+Между процессами кэши действуют с общим кэшем (REDIS_URL).
+"""
+import atexit
+import hashlib
+import hmac
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import caches
+from django.db.models import Case, DateTimeField, Value, When
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+LOGIN_CACHE_ALIAS = getattr(settings, 'LOGIN_CACHE_ALIAS', 'default')
+LOGIN_USER_CACHE_TIMEOUT = getattr(settings, 'LOGIN_USER_CACHE_TIMEOUT', 24 * 3600)  # секунд; 0 — без кэша
+LOGIN_REJECTED_CACHE_TIMEOUT = getattr(settings, 'LOGIN_REJECTED_CACHE_TIMEOUT', 30)  # секунд; 0 — без кэша
+LOGIN_RATE_LIMIT = getattr(settings, 'LOGIN_RATE_LIMIT', None)  # (попыток, секунд) или None
+LOGIN_LAST_LOGIN_FLUSH_INTERVAL = getattr(settings, 'LOGIN_LAST_LOGIN_FLUSH_INTERVAL', 10)  # секунд; 0 — сразу
+LOGIN_LAST_LOGIN_BATCH_SIZE = getattr(settings, 'LOGIN_LAST_LOGIN_BATCH_SIZE', 500)
+
+
+def _username_key(prefix, username):
+    # Имя пользователя может содержать символы, недопустимые в ключах memcached
+    return f'{prefix}:{hashlib.sha256(username.encode()).hexdigest()[:32]}'
+
+
+class LoginUserCache:
+    """username -> пользователь Django без запроса к auth_user."""
+
+    def __init__(self, cache_alias=LOGIN_CACHE_ALIAS, timeout=LOGIN_USER_CACHE_TIMEOUT):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get_or_create(self, username):
+        """Пользователь с именем username и признак, что он только что создан."""
+        key = _username_key('login-user', username)
+        entry = self.cache.get(key) if self.timeout else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if entry is not None:
+            user_id, password, is_active = entry
+            # Для login() нужны только pk и пароль (хэш сессии); объект не сохраняется
+            return User(id=user_id, username=username, password=password, is_active=is_active), False
+
+        user, created = User.objects.get_or_create(username=username)
+        if self.timeout:
+            self.cache.set(key, (user.id, user.password, user.is_active), self.timeout)
+        return user, created
+
+    def invalidate(self, username):
+        self.cache.delete(_username_key('login-user', username))
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': self.hits / total if total else 0.0}
+
+
+class RejectedLogins:
+    """Отрицательный кэш входов, отклонённых прокси-сервером."""
+
+    def __init__(self, cache_alias=LOGIN_CACHE_ALIAS, timeout=LOGIN_REJECTED_CACHE_TIMEOUT):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def _key(username, password):
+        digest = hmac.new(settings.SECRET_KEY.encode(), f'{username}\0{password}'.encode(), hashlib.sha256)
+        return f'login-rejected:{digest.hexdigest()[:32]}'
+
+    def is_rejected(self, username, password):
+        return bool(self.timeout) and self.cache.get(self._key(username, password)) is not None
+
+    def remember(self, username, password):
+        if self.timeout:
+            self.cache.set(self._key(username, password), 1, self.timeout)
+
+
+class LoginRateLimit:
+    """Не больше attempts обращений к /api/login/ на имя пользователя за окно в seconds секунд."""
+
+    def __init__(self, limit=LOGIN_RATE_LIMIT, cache_alias=LOGIN_CACHE_ALIAS):
+        self.limit = limit
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def retry_after(self, username):
+        """0, если обращение разрешено, иначе через сколько секунд повторить."""
+        if not self.limit:
+            return 0
+        attempts, seconds = self.limit
+        now = time.time()
+        window = int(now // seconds)
+        key = _username_key(f'login-rate:{window}', username)
+        # add создаёт счётчик окна атомарно, incr увеличивает его во всех процессах
+        self.cache.add(key, 0, seconds)
+        try:
+            count = self.cache.incr(key)
+        except ValueError:
+            # Счётчик истёк между add и incr: окно только что сменилось
+            return 0
+        if count <= attempts:
+            return 0
+        return max(1, int((window + 1) * seconds - now))
+
+
+class LastLoginBuffer:
+    """Отметки last_login, записываемые пачкой."""
+
+    def __init__(self, flush_interval=LOGIN_LAST_LOGIN_FLUSH_INTERVAL, batch_size=LOGIN_LAST_LOGIN_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = {}
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.flushes = 0
+
+    def record(self, user_id, when):
+        if self.flush_interval <= 0:
+            User.objects.filter(id=user_id).update(last_login=when)
+            return
+        with self._lock:
+            self._pending[user_id] = when
+            due = (time.monotonic() - self._flushed_at >= self.flush_interval
+                   or len(self._pending) >= self.batch_size)
+        if due:
+            self.flush()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        items = sorted(pending.items())
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            User.objects.filter(id__in=[user_id for user_id, _ in batch]).update(last_login=Case(
+                *[When(id=user_id, then=Value(when)) for user_id, when in batch],
+                output_field=DateTimeField(),
+            ))
+        if items:
+            self.flushes += 1
+            logger.debug("Записано last_login для %s пользователей.", len(items))
+
+
+login_users = LoginUserCache()
+rejected_logins = RejectedLogins()
+login_rate_limit = LoginRateLimit()
+last_logins = LastLoginBuffer()
+
+
+def _flush_at_exit():
+    try:
+        last_logins.flush()
+    except Exception as e:
+        logger.error("Не удалось записать last_login при завершении процесса: %s", e)
+
+
+atexit.register(_flush_at_exit)
+
+
+def record_last_login(sender, user, **kwargs):
+    last_logins.record(user.pk, timezone.now())
+
+
+def replace_last_login_handler():
+    """Подменяет django.contrib.auth.models.update_last_login (user.save() на каждый вход) на last_logins."""
+    user_logged_in.disconnect(dispatch_uid='update_last_login')
+    user_logged_in.connect(record_last_login, dispatch_uid='mi_django_record_last_login')
+
+
+@receiver(post_init, sender=User, dispatch_uid='logins_user_loaded')
+def _user_loaded(sender, instance, **kwargs):
+    # Прежнее имя: после переименования запись под ним тоже нужно сбросить
+    instance._login_username = instance.username
+
+
+@receiver([post_save, post_delete], sender=User, dispatch_uid='logins_user_changed')
+def _user_changed(sender, instance, update_fields=None, **kwargs):
+    # last_login в кэше не хранится
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    login_users.invalidate(instance.username)
+    if instance._login_username and instance._login_username != instance.username:
+        login_users.invalidate(instance._login_username)
+    instance._login_username = instance.username
@@ -0,0 +1,131 @@
+"""
+Неблокирующая запись логов.
+
+QueueListenerHandler ставится в LOGGING вместо файлового и консольного
+обработчиков: поток запроса только кладёт запись в очередь, а
+форматирование и запись на диск (RotatingFileHandler, JSON по строке на
+запись) и в консоль выполняет отдельный поток QueueListener. Сообщения
+форматируются там же, поэтому logger.debug("... %s", value) на
+отключённом уровне ничего не стоит, а на включённом не форматируется в
+потоке запроса. Аргументы сообщения превращаются в строку позже, в потоке
+записи: передавайте значения, а не объекты, чей str() обращается к БД.
+
+Если очередь переполнена (диск не успевает), записи отбрасываются и
+считаются в dropped — запрос не ждёт логирования.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Атрибуты LogRecord; всё остальное — поля из extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON."""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            data['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Очередь записей с фоновым потоком, пишущим в ротируемый файл (JSON)
+    и в консоль.
+
+    Создаётся из LOGGING через '()': 'mi_django.logs.QueueListenerHandler'.
+    После fork() (воркеры gunicorn) очередь и поток создаются заново.
+
+    max_bytes — приблизительный предел: RotatingFileHandler сравнивает длину
+    записи в символах, а файл пишется в UTF-8, поэтому с кириллицей файл
+    может оказаться больше max_bytes байт.
+    """
+
+    def __init__(self, filename=None, max_bytes=10 * 1024 * 1024, backup_count=5, console=True,
+                 console_json=False, queue_size=10000):
+        self.targets = []
+        if filename:
+            file_handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                               encoding='utf-8', delay=True)
+            file_handler.setFormatter(JsonFormatter())
+            self.targets.append(file_handler)
+        if console:
+            console_handler = logging.StreamHandler(sys.stderr)
+            console_handler.setFormatter(JsonFormatter() if console_json else logging.Formatter(
+                '%(asctime)s %(levelname)s %(name)s: %(message)s'
+            ))
+            self.targets.append(console_handler)
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        super().__init__(queue.Queue(queue_size))
+        self.listener = None
+        self._closed = False
+        self._start()
+        atexit.register(self.stop)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def _start(self):
+        self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+        self.listener.start()
+
+    def _restart_in_child(self):
+        if self._closed:
+            return
+        # Поток записи родителя в дочернем процессе не существует, а замки очереди могли остаться захваченными
+        self.queue = queue.Queue(self.queue_size)
+        self._dropped_lock = threading.Lock()
+        self._start()
+
+    def prepare(self, record):
+        # Стандартный QueueHandler форматирует запись здесь, в потоке запроса; форматирует поток записи
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def flush(self):
+        """Дожидается записи всего, что уже в очереди (для тестов и завершения команд)."""
+        listener = self.listener
+        if listener is not None and listener._thread is not None:
+            listener.stop()
+            self._start()
+
+    def stop(self):
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+        for target in self.targets:
+            target.close()
+
+    def close(self):
+        self._closed = True
+        self.stop()
+        super().close()
@@ -0,0 +1,262 @@
+import json
+import tempfile
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from mi_django.deletions import unlink_files
+from mi_django.fragments import fragment_cache
+from mi_django.media_store import DOC_REF_FIELDS, doc_dependents, lock_files, raw_delete, release_refs
+from mi_django.models import BackendDeletion, Cart, Doc, Price, UsersToDocs
+from mi_django.prices import price_table
+from mi_django.text_cache import text_cache
+
+# Таблица -> (модель, поле пользователя, путь к Doc для отбора по возрасту); None — отбор не поддерживается.
+# Порядок — порядок очистки: строки, ссылающиеся на docs, раньше самих документов.
+TABLES = {
+    'cart': (Cart, 'user', 'doc'),
+    'user_to_docs': (UsersToDocs, 'username', 'docs_id'),
+    'docs': (Doc, 'user', ''),
+    'price': (Price, None, None),
+}
+# Сколько строк файлов и документов FastAPI обрабатывать за раз после TRUNCATE
+TRUNCATE_RELEASE_BATCH = 10000
+
+
+def _format_seconds(seconds):
+    if seconds < 60:
+        return f"{seconds:.1f} с"
+    return f"{seconds / 60:.1f} мин"
+
+
+class Command(BaseCommand):
+    help = (
+        "Массовая очистка таблиц docs, cart, user_to_docs и price: TRUNCATE ... CASCADE, где можно, "
+        "иначе удаление пачками по id с отчётом о ходе. Прерванную очистку продолжает повторный запуск."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tables', nargs='*', metavar='table',
+                            help=f"Какие таблицы очищать: {', '.join(TABLES)} (по умолчанию все).")
+        parser.add_argument('--user', help="Только строки этого пользователя (username).")
+        parser.add_argument('--older-than', type=int, metavar='DAYS',
+                            help="Только документы, загруженные раньше стольких дней назад "
+                                 "(и строки, ссылающиеся на них). Документы без даты загрузки не затрагиваются.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Строк в одной транзакции.")
+        parser.add_argument('--sleep', type=float, default=0.0, help="Пауза между пачками, с.")
+        parser.add_argument('--no-truncate', action='store_true',
+                            help="Удалять пачками и без отбора (TRUNCATE блокирует таблицу целиком).")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Только посчитать строки и оценить время (пробная пачка с откатом).")
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help="Не спрашивать подтверждение.")
+
+    def handle(self, *args, **options):
+        unknown = set(options['tables']) - set(TABLES)
+        if unknown:
+            raise CommandError(f"Неизвестные таблицы: {', '.join(sorted(unknown))}.")
+        tables = [name for name in TABLES if name in (options['tables'] or TABLES)]
+        self.chunk_size = options['chunk_size']
+        self.sleep = options['sleep']
+        scopes = self._scopes(tables, options)
+        truncate = (connection.vendor == 'postgresql' and not options['no_truncate']
+                    and not options['user'] and options['older_than'] is None)
+
+        if options['dry_run']:
+            for name, scope in scopes.items():
+                self._estimate(name, scope, truncate)
+            return
+
+        if options['interactive']:
+            confirm = input(f"Удалить строки из таблиц {', '.join(scopes)}? (yes/no): ")
+            if confirm.lower() != 'yes':
+                self.stdout.write("Операция удаления отменена.")
+                return
+
+        for name, scope in scopes.items():
+            if truncate:
+                self._truncate(name)
+            else:
+                self._purge(name, scope)
+        if 'price' in scopes:
+            price_table.invalidate()
+
+    def _scopes(self, tables, options):
+        """Фильтр QuerySet для каждой таблицы; таблицы, где отбор невозможен, пропускаются."""
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"Пользователь {options['user']} не найден.")
+        cutoff = None
+        if options['older_than'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['older_than'])
+
+        scopes = {}
+        for name in tables:
+            model, user_field, doc_path = TABLES[name]
+            scope = {}
+            if user is not None:
+                if user_field is None:
+                    self.stdout.write(f"{name}: строки не принадлежат пользователям, пропускаем.")
+                    continue
+                scope[user_field] = user
+            if cutoff is not None:
+                if doc_path is None:
+                    self.stdout.write(f"{name}: строки не связаны с документами, пропускаем.")
+                    continue
+                scope[f'{doc_path}__created_at__lt' if doc_path else 'created_at__lt'] = cutoff
+            scopes[name] = scope
+        return scopes
+
+    def _delete_chunk(self, name, queryset, last_id):
+        """
+        Удаляет следующую пачку строк с id > last_id в текущей транзакции.
+
+        Возвращает (id строк, {файл без ссылок: миниатюры}, id документов FastAPI, id пользователей).
+        """
+        model, user_field, _ = TABLES[name]
+        queryset = queryset.filter(id__gt=last_id).order_by('id')
+        if model is not Doc:
+            rows = list(queryset.values_list('id', user_field or 'id')[:self.chunk_size])
+            ids = [row[0] for row in rows]
+            raw_delete(model, 'id', ids)
+            return ids, {}, [], {row[1] for row in rows} if user_field else set()
+
+        rows = list(queryset.select_for_update().values_list(*DOC_REF_FIELDS, 'user_id')[:self.chunk_size])
+        ids = [row[0] for row in rows]
+        if not ids:
+            return ids, {}, [], set()
+        refs = [row[:len(DOC_REF_FIELDS)] for row in rows]
+        lock_files(refs)
+        for dependent, field in doc_dependents():
+            raw_delete(dependent, field.column, ids)
+        raw_delete(Doc, 'id', ids)
+        files, fastapi_ids = release_refs(refs)
+        return ids, files, fastapi_ids, {row[-1] for row in rows}
+
+    def _purge(self, name, scope):
+        """Удаление пачками по возрастанию id; повторный запуск продолжает с оставшихся строк."""
+        model = TABLES[name][0]
+        queryset = model.objects.filter(**scope)
+        total = queryset.count()
+        self.stdout.write(f"{name}: к удалению {total} строк, пачками по {self.chunk_size}.")
+        deleted, last_id, user_ids = 0, 0, set()
+        started = time.monotonic()
+        while True:
+            with transaction.atomic():
+                ids, files, fastapi_ids, chunk_users = self._delete_chunk(name, queryset, last_id)
+            if not ids:
+                break
+            # Файлы — только после фиксации: при откате строки остаются и ссылаются на них
+            unlink_files(files)
+            for fastapi_doc_id in fastapi_ids:
+                text_cache.invalidate(fastapi_doc_id)
+            user_ids |= chunk_users
+            deleted += len(ids)
+            last_id = ids[-1]
+            elapsed = max(time.monotonic() - started, 1e-6)
+            remaining = max(total - deleted, 0) * elapsed / deleted
+            self.stdout.write(
+                f"{name}: удалено {deleted} из {total} ({deleted / max(total, 1):.0%}), до id {last_id}, "
+                f"{deleted / elapsed:.0f} строк/с, осталось ~{_format_seconds(remaining)}"
+            )
+            if self.sleep:
+                time.sleep(self.sleep)
+
+        for user_id in user_ids:
+            fragment_cache.bump(user_id)
+        self.stdout.write(self.style.SUCCESS(
+            f"{name}: готово, удалено {deleted} строк за {_format_seconds(time.monotonic() - started)}."
+        ))
+
+    def _truncate(self, name):
+        model = TABLES[name][0]
+        tables = [model] + ([dependent for dependent, _ in doc_dependents()] if model is Doc else [])
+        quote = connection.ops.quote_name
+        started = time.monotonic()
+        with tempfile.TemporaryFile('w+') as released:
+            with transaction.atomic(), connection.cursor() as cursor:
+                if model is Doc:
+                    # Новые документы не появятся между выборкой файлов и TRUNCATE
+                    cursor.execute(f'LOCK TABLE {quote(Doc._meta.db_table)} IN EXCLUSIVE MODE')
+                    now = timezone.now()
+                    cursor.execute(
+                        f'INSERT INTO {quote(BackendDeletion._meta.db_table)} '
+                        f'(fastapi_doc_id, attempts, run_after, last_error, created_at) '
+                        f'SELECT DISTINCT fastapi_doc_id, 0, %s, %s, %s FROM {quote(Doc._meta.db_table)} '
+                        f'WHERE fastapi_doc_id IS NOT NULL',
+                        [now, '', now],
+                    )
+                    self.stdout.write(f"{name}: в outbox удалений FastAPI поставлено {cursor.rowcount} документов.")
+                    # Пути файлов — во временный файл, а не в память: строк может быть много
+                    docs = Doc.objects.values_list('file_path', 'thumbnails', 'fastapi_doc_id')
+                    for row in docs.iterator(chunk_size=self.chunk_size):
+                        released.write(json.dumps(row) + '\n')
+                cursor.execute(f"TRUNCATE {', '.join(quote(table._meta.db_table) for table in tables)} CASCADE")
+            # Файлы — только после фиксации
+            if model is Doc:
+                released.seek(0)
+                self._release_truncated(released)
+        if model in (Doc, Cart):
+            for user_id in User.objects.values_list('id', flat=True).iterator():
+                fragment_cache.bump(user_id)
+        self.stdout.write(self.style.SUCCESS(
+            f"{name}: TRUNCATE выполнен за {_format_seconds(time.monotonic() - started)}."
+        ))
+
+    def _release_truncated(self, released):
+        """Удаляет файлы и кэш текстов документов, записанные перед TRUNCATE."""
+        removed = 0
+        while True:
+            files, fastapi_ids = {}, set()
+            for line in released:
+                file_path, thumbnails, fastapi_doc_id = json.loads(line)
+                if file_path:
+                    files[file_path] = thumbnails
+                if fastapi_doc_id is not None:
+                    fastapi_ids.add(fastapi_doc_id)
+                if len(files) >= TRUNCATE_RELEASE_BATCH:
+                    break
+            if not files and not fastapi_ids:
+                break
+            removed += unlink_files(files)
+            for fastapi_doc_id in fastapi_ids:
+                text_cache.invalidate(fastapi_doc_id)
+        self.stdout.write(f"docs: удалено файлов {removed}.")
+
+    def _estimate(self, name, scope, truncate):
+        model = TABLES[name][0]
+        queryset = model.objects.filter(**scope)
+        total = queryset.count()
+        line = f"{name}: {total} строк"
+        if model is Doc:
+            dependents = ', '.join(
+                f"{dependent._meta.db_table}: {dependent.objects.filter(**{f'{field.name}__in': queryset}).count()}"
+                for dependent, field in doc_dependents()
+            )
+            files = queryset.exclude(file_path='').values('file_path').distinct().count()
+            line += f" (и ссылающиеся на них — {dependents}; файлов: до {files})"
+        self.stdout.write(line)
+        if truncate:
+            self.stdout.write(f"{name}: TRUNCATE ... CASCADE, время не зависит от числа строк.")
+            return
+        if not total:
+            return
+
+        # Пробная пачка в транзакции с откатом: время на строку на этой базе
+        with transaction.atomic():
+            started = time.monotonic()
+            ids = self._delete_chunk(name, queryset, 0)[0]
+            elapsed = time.monotonic() - started
+            transaction.set_rollback(True)
+        chunks = -(-total // self.chunk_size)
+        expected = elapsed / len(ids) * total + self.sleep * (chunks - 1)
+        self.stdout.write(
+            f"{name}: пачками по {self.chunk_size} ({chunks} пачек), пробная пачка из {len(ids)} строк — "
+            f"{_format_seconds(elapsed)}, ожидаемое время ~{_format_seconds(expected)} (без удаления файлов)."
+        )
@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mi_django.fragments import fragment_cache
+from mi_django.models import Doc
+from mi_django.thumbnails import THUMBNAIL_FORMAT, THUMBNAIL_QUALITY, THUMBNAIL_SIZES, make_thumbnails
+
+
+def _render(doc_id, file_path, media_root, sizes, fmt, quality):
+    # Выполняется в дочернем процессе: только Pillow и файловая система
+    try:
+        return doc_id, make_thumbnails(media_root, file_path, sizes, fmt, quality), None
+    except Exception as e:
+        return doc_id, None, str(e)
+
+
+class Command(BaseCommand):
+    help = "Создаёт миниатюры для уже загруженных документов в пуле процессов."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Число процессов.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Документов в одной пачке обновления БД.")
+        parser.add_argument('--force', action='store_true', help="Пересоздать миниатюры, даже если они уже есть.")
+
+    def handle(self, *args, **options):
+        docs = Doc.objects.exclude(file_path='').order_by('id')
+        if not options['force']:
+            docs = docs.filter(thumbnails={})
+
+        batch_size = options['batch_size']
+        done = failed = 0
+        last_id = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                batch = list(docs.filter(id__gt=last_id).only('id', 'user_id', 'file_path')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                futures = [
+                    pool.submit(_render, doc.id, doc.file_path, settings.MEDIA_ROOT,
+                                THUMBNAIL_SIZES, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY)
+                    for doc in batch
+                ]
+                by_id = {doc.id: doc for doc in batch}
+                updated = []
+                for future in as_completed(futures):
+                    doc_id, thumbnails, error = future.result()
+                    if error:
+                        failed += 1
+                        self.stderr.write(f"Документ {doc_id}: {error}")
+                        continue
+                    by_id[doc_id].thumbnails = thumbnails
+                    updated.append(by_id[doc_id])
+
+                Doc.objects.bulk_update(updated, ['thumbnails'])
+                for user_id in {doc.user_id for doc in updated}:
+                    fragment_cache.bump(user_id)
+                done += len(updated)
+                self.stdout.write(f"Обработано {done} документов, ошибок: {failed}")
+
+        self.stdout.write(self.style.SUCCESS(f"Готово: миниатюры созданы для {done} документов, ошибок: {failed}."))
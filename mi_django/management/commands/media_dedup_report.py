@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max, Sum
+
+from mi_django.models import Doc
+
+
+def _format_kb(size_kb):
+    for unit in ('КБ', 'МБ', 'ГБ'):
+        if size_kb < 1024:
+            return f"{size_kb:.1f} {unit}"
+        size_kb /= 1024
+    return f"{size_kb:.1f} ТБ"
+
+
+class Command(BaseCommand):
+    help = "Отчёт о дедупликации медиафайлов: сколько места сэкономлено за счёт общих файлов."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help="Сколько самых переиспользуемых файлов показать.")
+
+    def handle(self, *args, **options):
+        totals = Doc.objects.aggregate(docs=Count('id'), logical_kb=Sum('size'))
+        # Размер каждого физического файла учитывается один раз
+        files = Doc.objects.values('file_path').annotate(refs=Count('id'), size_kb=Max('size'))
+        physical_kb = 0.0
+        stored_files = 0
+        for row in files.iterator():
+            physical_kb += row['size_kb'] or 0
+            stored_files += 1
+
+        logical_kb = totals['logical_kb'] or 0
+        reclaimed_kb = logical_kb - physical_kb
+        ratio = reclaimed_kb / logical_kb if logical_kb else 0.0
+
+        self.stdout.write(f"Документов: {totals['docs']}")
+        self.stdout.write(f"Файлов в хранилище: {stored_files}")
+        self.stdout.write(f"Объём без дедупликации: {_format_kb(logical_kb)}")
+        self.stdout.write(f"Фактический объём: {_format_kb(physical_kb)}")
+        self.stdout.write(self.style.SUCCESS(f"Сэкономлено: {_format_kb(reclaimed_kb)} ({ratio:.1%})"))
+
+        shared = files.filter(refs__gt=1).order_by('-refs')[:options['top']]
+        if shared:
+            self.stdout.write("\nСамые переиспользуемые файлы:")
+            for row in shared:
+                self.stdout.write(f"  {row['file_path']}: ссылок {row['refs']}, {_format_kb(row['size_kb'])}")
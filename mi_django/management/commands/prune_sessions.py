@@ -0,0 +1,43 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "Удаляет истёкшие сессии из БД пачками, не блокируя таблицу одним большим DELETE."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Сессий в одном DELETE.")
+        parser.add_argument('--sleep', type=float, default=0.0, help="Пауза между пачками, с.")
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать истёкшие сессии.")
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not hasattr(store, 'get_model_class'):
+            # cache, signed_cookies, file: истёкшие записи удаляет само хранилище или clearsessions
+            self.stdout.write(f"{settings.SESSION_ENGINE} не хранит сессии в БД, удалять нечего.")
+            return
+        model = store.get_model_class()
+        now = timezone.now()
+        expired = model.objects.filter(expire_date__lt=now)
+
+        if options['dry_run']:
+            self.stdout.write(f"Истёкших сессий: {expired.count()}.")
+            return
+
+        deleted = 0
+        while True:
+            # Пачка по индексу expire_date; записи в кэше истекают сами по тому же сроку
+            keys = list(expired.order_by('expire_date').values_list('session_key', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            count, _ = model.objects.filter(session_key__in=keys, expire_date__lt=now).delete()
+            deleted += count
+            self.stdout.write(f"Удалено {deleted} сессий")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Готово: удалено {deleted} истёкших сессий."))
@@ -0,0 +1,36 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from mi_django.analysis_queue import run_once
+
+
+class Command(BaseCommand):
+    help = "Воркер очереди анализа: запускает анализ в FastAPI и опрашивает его до готовности текста."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10, help="Сколько задач захватывать за раз.")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Пауза в секундах, когда очередь пуста.")
+        parser.add_argument('--once', action='store_true', help="Обработать одну пачку задач и выйти.")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write("Воркер очереди анализа запущен.")
+        while not self.stopping:
+            close_old_connections()
+            processed = run_once(options['batch_size'])
+            if options['once']:
+                self.stdout.write(f"Обработано задач: {processed}")
+                break
+            if not processed:
+                time.sleep(options['sleep'])
+        self.stdout.write("Воркер очереди анализа остановлен.")
+
+    def _stop(self, signum, frame):
+        # Текущая пачка дорабатывается до конца
+        self.stopping = True
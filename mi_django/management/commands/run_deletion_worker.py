@@ -0,0 +1,36 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from mi_django.deletions import run_once
+
+
+class Command(BaseCommand):
+    help = "Воркер outbox удалений: удаляет в FastAPI документы, на которые больше нет ссылок."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Сколько записей захватывать за раз.")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Пауза в секундах, когда outbox пуст.")
+        parser.add_argument('--once', action='store_true', help="Обработать одну пачку записей и выйти.")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write("Воркер outbox удалений запущен.")
+        while not self.stopping:
+            close_old_connections()
+            processed = run_once(options['batch_size'])
+            if options['once']:
+                self.stdout.write(f"Обработано записей: {processed}")
+                break
+            if not processed:
+                time.sleep(options['sleep'])
+        self.stdout.write("Воркер outbox удалений остановлен.")
+
+    def _stop(self, signum, frame):
+        # Текущая пачка дорабатывается до конца
+        self.stopping = True
@@ -0,0 +1,63 @@
+"""
+Отдача медиафайлов (документы и миниатюры из MEDIA_ROOT).
+
+Способ задаёт настройка MEDIA_DELIVERY:
+
+    'django'     — файл читает и отправляет сам Django (django.views.static.serve);
+                   только для разработки;
+    'x-accel'    — ответ с заголовком X-Accel-Redirect, файл отдаёт nginx из
+                   internal-location MEDIA_ACCEL_PREFIX (см. nginx/nginx.conf);
+    'x-sendfile' — заголовок X-Sendfile с абсолютным путём (Apache mod_xsendfile,
+                   lighttpd).
+
+В двух последних режимах воркер приложения не занят передачей байтов: он
+проверяет вход пользователя и путь и сразу освобождается.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse
+from django.utils._os import safe_join
+from django.views.static import serve
+
+MEDIA_DELIVERY = getattr(settings, 'MEDIA_DELIVERY', 'django')
+MEDIA_ACCEL_PREFIX = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+
+# Файлы с адресацией по содержимому и их миниатюры под тем же именем не меняются
+IMMUTABLE_PREFIXES = ('cas/', 'thumbs/')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+DEFAULT_MAX_AGE = 3600
+
+
+def media_response(request, path, delivery=None):
+    """Ответ с файлом MEDIA_ROOT/path; Http404, если файла нет или путь выходит за MEDIA_ROOT."""
+    delivery = delivery or MEDIA_DELIVERY
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Файл не найден")
+    if not os.path.isfile(full_path):
+        raise Http404("Файл не найден")
+
+    if delivery == 'django':
+        response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    else:
+        content_type, encoding = mimetypes.guess_type(full_path)
+        response = HttpResponse(content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if delivery == 'x-accel':
+            response.headers['X-Accel-Redirect'] = MEDIA_ACCEL_PREFIX + quote(path)
+        elif delivery == 'x-sendfile':
+            response.headers['X-Sendfile'] = full_path
+        else:
+            raise ValueError(f"Неизвестный способ отдачи медиафайлов: {delivery}")
+
+    max_age = IMMUTABLE_MAX_AGE if path.startswith(IMMUTABLE_PREFIXES) else DEFAULT_MAX_AGE
+    immutable = ', immutable' if max_age == IMMUTABLE_MAX_AGE else ''
+    # private: файлы пользователей не должны оседать в общих кэшах
+    response.headers['Cache-Control'] = f'private, max-age={max_age}{immutable}'
+    return response
@@ -0,0 +1,207 @@
+"""
+Учёт ссылок на файлы в хранилище с адресацией по содержимому.
+
+Ссылки считаются по строкам Doc: файл (Doc.file_path) и документ в FastAPI
+(Doc.fastapi_doc_id) удаляются только вместе с последним документом,
+который на них ссылается. Строки, ссылающиеся на один файл, блокируются
+(SELECT ... FOR UPDATE), чтобы удаление и повторная загрузка того же
+содержимого не разошлись.
+
+Документ FastAPI без ссылок ставится в outbox (BackendDeletion) в той же
+транзакции, что и удаление последнего Doc: даже если обращение к FastAPI
+не удалось, его повторит воркер run_deletion_worker.
+"""
+import logging
+import os
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BackendDeletion, Doc
+from .thumbnails import delete_thumbnails
+
+logger = logging.getLogger(__name__)
+
+# Кому можно переиспользовать документ FastAPI (и его анализ) при повторной загрузке:
+# 'user' — только тому же пользователю, 'all' — любому, 'none' — никому
+DEDUP_REUSE_ANALYSIS = getattr(settings, 'DEDUP_REUSE_ANALYSIS', 'user')
+
+
+def create_from_existing(user, sha256, size_kb):
+    """
+    Создаёт Doc для повторно загруженного содержимого без отправки в FastAPI.
+
+    Возвращает None, если переиспользовать нечего или не разрешено настройкой.
+    """
+    if DEDUP_REUSE_ANALYSIS == 'none':
+        return None
+    with transaction.atomic():
+        candidates = Doc.objects.select_for_update().filter(content_hash=sha256, fastapi_doc_id__isnull=False)
+        if DEDUP_REUSE_ANALYSIS == 'user':
+            candidates = candidates.filter(user=user)
+        source = candidates.order_by('id').first()
+        if source is None:
+            return None
+        doc = Doc.objects.create(
+            user=user,
+            file_path=source.file_path,
+            size=size_kb,
+            fastapi_doc_id=source.fastapi_doc_id,
+            content_hash=sha256,
+            thumbnails=source.thumbnails,
+        )
+    logger.info("Документ %s переиспользует файл и документ FastAPI %s документа %s.",
+                doc.id, source.fastapi_doc_id, source.id)
+    return doc
+
+
+def shared_thumbnails(file_path):
+    """Миниатюры, уже созданные для этого файла другим документом."""
+    thumbnails = (
+        Doc.objects.filter(file_path=file_path)
+        .exclude(thumbnails={})
+        .values_list('thumbnails', flat=True)
+        .first()
+    )
+    return thumbnails or {}
+
+
+def discard_unreferenced(file_path, thumbnails=None):
+    """
+    Удаляет сохранённую копию загрузки, для которой не удалось создать Doc,
+    если на файл не ссылается ни один документ. Возвращает True, если файл удалён.
+    """
+    if Doc.objects.filter(file_path=file_path).exists():
+        return False
+    try:
+        os.remove(os.path.join(settings.MEDIA_ROOT, file_path))
+    except FileNotFoundError:
+        return False
+    delete_thumbnails(thumbnails)
+    logger.info("Файл %s без документа удалён.", file_path)
+    return True
+
+
+def doc_dependents():
+    """Модели и их внешние ключи на docs; ORM удалял эти строки каскадом, raw_delete — нет."""
+    return [(rel.related_model, rel.field) for rel in Doc._meta.related_objects]
+
+
+def raw_delete(model, column, ids):
+    """DELETE без сбора объектов в память и без сигналов."""
+    if not ids:
+        return 0
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN ({placeholders})', ids
+        )
+        return cursor.rowcount
+
+
+DOC_REF_FIELDS = ('id', 'file_path', 'fastapi_doc_id', 'thumbnails')
+
+
+def lock_files(rows):
+    """
+    Блокирует строки rows (кортежи DOC_REF_FIELDS) и все строки Doc,
+    ссылающиеся на те же файлы и документы FastAPI. Вызывается в транзакции
+    до удаления rows: пока блокировка держится, create_from_existing не
+    добавит новую ссылку, и подсчёт в release_refs не устареет.
+    """
+    paths = {file_path for _, file_path, _, _ in rows if file_path}
+    fastapi_ids = {fastapi_doc_id for _, _, fastapi_doc_id, _ in rows if fastapi_doc_id is not None}
+    list(
+        Doc.objects.select_for_update()
+        .filter(Q(id__in=[doc_id for doc_id, _, _, _ in rows]) | Q(file_path__in=paths)
+                | Q(fastapi_doc_id__in=fastapi_ids))
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+
+
+def delete_doc(doc):
+    """
+    Удаляет строку Doc и сообщает, была ли она последней ссылкой.
+
+    Возвращает (удалить_файл, удалить_в_fastapi); документ FastAPI без
+    ссылок уже поставлен в outbox.
+    """
+    rows = [(doc.id, doc.file_path, doc.fastapi_doc_id, doc.thumbnails)]
+    with transaction.atomic():
+        lock_files(rows)
+        doc.delete()
+        files, fastapi_ids = release_refs(rows)
+    return bool(files), bool(fastapi_ids)
+
+
+def release_refs(rows):
+    """
+    Вызывается в транзакции после удаления строк Doc rows: ставит в outbox
+    документы FastAPI, на которые больше никто не ссылается.
+
+    Возвращает ({файл без ссылок: миниатюры}, id документов FastAPI в outbox).
+    """
+    paths = {file_path for _, file_path, _, _ in rows if file_path}
+    shared_paths = set(Doc.objects.filter(file_path__in=paths).values_list('file_path', flat=True))
+    candidates = {fastapi_doc_id for _, _, fastapi_doc_id, _ in rows if fastapi_doc_id is not None}
+    shared_ids = set(Doc.objects.filter(fastapi_doc_id__in=candidates).values_list('fastapi_doc_id', flat=True))
+    orphaned = sorted(candidates - shared_ids)
+    now = timezone.now()
+    BackendDeletion.objects.bulk_create(
+        BackendDeletion(fastapi_doc_id=fastapi_doc_id, run_after=now) for fastapi_doc_id in orphaned
+    )
+    files = {file_path: thumbnails for _, file_path, _, thumbnails in rows
+             if file_path and file_path not in shared_paths}
+    return files, orphaned
+
+
+def delete_docs(user, doc_ids=None, batch_size=1000):
+    """
+    Удаляет документы пользователя (все, если doc_ids не задан) пачками по
+    batch_size строк, каждая пачка — в своей транзакции.
+
+    Строки удаляются без сигналов post_delete (сбросили бы кэш фрагментов
+    на каждую строку): вызывающий сбрасывает его один раз для возвращённых
+    пользователей.
+
+    Возвращает (число удалённых документов, {файл без ссылок: миниатюры},
+    id документов FastAPI, поставленных в outbox, id пользователей, чьи
+    данные изменились).
+    """
+    docs = Doc.objects.filter(user=user)
+    if doc_ids is None:
+        ids = list(docs.order_by('id').values_list('id', flat=True))
+    else:
+        ids = []
+        for start in range(0, len(doc_ids), batch_size):
+            ids += docs.filter(id__in=doc_ids[start:start + batch_size]).values_list('id', flat=True)
+        ids.sort()
+
+    deleted, files, fastapi_ids, user_ids = 0, {}, [], {user.id}
+    for start in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            rows = list(
+                Doc.objects.select_for_update()
+                .filter(id__in=ids[start:start + batch_size], user=user)
+                .values_list(*DOC_REF_FIELDS)
+            )
+            if not rows:
+                continue
+            lock_files(rows)
+            batch = [doc_id for doc_id, _, _, _ in rows]
+            for dependent, field in doc_dependents():
+                if any(f.name == 'user' for f in dependent._meta.concrete_fields):
+                    user_ids.update(
+                        dependent.objects.filter(**{f'{field.name}__in': batch}).values_list('user_id', flat=True)
+                    )
+                raw_delete(dependent, field.column, batch)
+            raw_delete(Doc, 'id', batch)
+            released_files, released_ids = release_refs(rows)
+        deleted += len(rows)
+        files.update(released_files)
+        fastapi_ids += released_ids
+    return deleted, files, fastapi_ids, user_ids
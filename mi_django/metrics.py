@@ -0,0 +1,298 @@
+"""
+Метрики производительности запросов по представлениям.
+
+RequestMetricsMiddleware для доли запросов METRICS_SAMPLE_RATE замеряет
+время ответа, число и время запросов к БД, число и время обращений к
+прокси-серверу и FastAPI (через http_client) и размер ответа, и
+складывает их в гистограммы в памяти процесса. Счётчик запросов
+django_view_requests_total ведётся для всех запросов, гистограммы — только
+по выборке.
+
+Метрики отдаются в текстовом формате Prometheus по /metrics/. Каждый
+процесс-воркер хранит свои значения, поэтому под gunicorn Prometheus
+должен опрашивать каждый воркер или результаты нужно складывать на стороне
+сборщика.
+
+Запросы к БД считаются обёрткой execute_wrapper, которая ставится на
+каждое новое соединение (сигнал connection_created) и без замера текущего
+запроса сразу передаёт управление дальше. Текущий замер хранится в
+contextvars, поэтому он доступен и в потоках sync_to_async.
+"""
+import bisect
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+METRICS_SAMPLE_RATE = getattr(settings, 'METRICS_SAMPLE_RATE', 0.1)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestStats:
+    """Счётчики одного замеряемого запроса."""
+
+    __slots__ = ('db_queries', 'db_time', 'backend_requests', 'backend_time', '_lock')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.backend_requests = 0
+        self.backend_time = 0.0
+        # Обращения к сервисам могут идти из нескольких потоков (пакетная загрузка)
+        self._lock = threading.Lock()
+
+    def add_query(self, elapsed):
+        with self._lock:
+            self.db_queries += 1
+            self.db_time += elapsed
+
+    def add_backend_request(self, elapsed):
+        with self._lock:
+            self.backend_requests += 1
+            self.backend_time += elapsed
+
+
+class Histogram:
+    """Гистограмма Prometheus с метками: накопительные корзины, сумма и число наблюдений."""
+
+    def __init__(self, name, documentation, buckets, label='view'):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                # Последняя корзина — +Inf
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, label_value):
+        with self._lock:
+            series = self._series.get(label_value)
+            return series[2] if series else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for label_value, (counts, total, count) in sorted(series.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{self.name}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label}}} {total:g}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    """Счётчик Prometheus с метками."""
+
+    def __init__(self, name, documentation, labels=('view',)):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + 1
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def items(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            labels = ','.join(f'{name}="{_escape(v)}"' for name, v in zip(self.labels, label_values))
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestMetrics:
+    """Набор метрик запросов процесса."""
+
+    def __init__(self, sample_rate=METRICS_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.requests = Counter('django_view_requests_total', 'Запросы по представлениям (все, без выборки).',
+                                labels=('view', 'status'))
+        self.duration = Histogram('django_view_duration_seconds', 'Время ответа представления.',
+                                  DURATION_BUCKETS)
+        self.db_queries = Histogram('django_view_db_queries', 'Запросов к БД за один ответ.', COUNT_BUCKETS)
+        self.db_duration = Histogram('django_view_db_duration_seconds', 'Время запросов к БД за один ответ.',
+                                     DURATION_BUCKETS)
+        self.backend_requests = Histogram('django_view_backend_requests',
+                                          'Обращений к прокси-серверу и FastAPI за один ответ.', COUNT_BUCKETS)
+        self.backend_duration = Histogram('django_view_backend_duration_seconds',
+                                          'Время обращений к прокси-серверу и FastAPI за один ответ.',
+                                          DURATION_BUCKETS)
+        self.response_size = Histogram('django_view_response_bytes', 'Размер ответа.', SIZE_BUCKETS)
+
+    @property
+    def histograms(self):
+        return (self.duration, self.db_queries, self.db_duration,
+                self.backend_requests, self.backend_duration, self.response_size)
+
+    def sampled(self):
+        return self.sample_rate >= 1 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def observe(self, view, elapsed, stats, size):
+        self.duration.observe(view, elapsed)
+        self.db_queries.observe(view, stats.db_queries)
+        self.db_duration.observe(view, stats.db_time)
+        self.backend_requests.observe(view, stats.backend_requests)
+        self.backend_duration.observe(view, stats.backend_time)
+        if size is not None:
+            self.response_size.observe(view, size)
+
+    def render(self):
+        lines = ['# HELP django_view_sample_rate Доля запросов, попадающих в гистограммы.',
+                 '# TYPE django_view_sample_rate gauge',
+                 f'django_view_sample_rate {self.sample_rate:g}']
+        lines += self.requests.render()
+        for histogram in self.histograms:
+            lines += histogram.render()
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        self.requests.reset()
+        for histogram in self.histograms:
+            histogram.reset()
+
+
+request_metrics = RequestMetrics()
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def _instrument_connection(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+@contextmanager
+def backend_call():
+    """Замер одного обращения к прокси-серверу или FastAPI (используется в http_client)."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_backend_request(time.perf_counter() - started)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name or match._func_path) if match else 'unresolved'
+
+
+def _response_size(response):
+    if response.streaming:
+        length = response.get('Content-Length')
+        return int(length) if length else None
+    return len(response.content)
+
+
+class RequestMetricsMiddleware:
+    """Замеряет запросы для request_metrics; ставится первым в MIDDLEWARE."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response, metrics=None):
+        self.get_response = get_response
+        self.metrics = metrics or request_metrics
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.metrics.sampled():
+            response = self.get_response(request)
+            self.metrics.requests.inc(_view_name(request), str(response.status_code))
+            return response
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, started, stats)
+        return response
+
+    async def __acall__(self, request):
+        if not self.metrics.sampled():
+            response = await self.get_response(request)
+            self.metrics.requests.inc(_view_name(request), str(response.status_code))
+            return response
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, started, stats)
+        return response
+
+    def _finish(self, request, response, started, stats):
+        view = _view_name(request)
+        self.metrics.requests.inc(view, str(response.status_code))
+        self.metrics.observe(view, time.perf_counter() - started, stats, _response_size(response))
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_django', '0006_doc_fastapi_doc_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('texts', models.JSONField(default=list)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('fetched_at', models.DateTimeField()),
+                ('doc', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='text', to='mi_django.doc')),
+            ],
+            options={
+                'db_table': 'doc_texts',
+            },
+        ),
+    ]
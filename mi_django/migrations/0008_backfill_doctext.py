@@ -0,0 +1,88 @@
+# Заполнение DocText для уже загруженных документов.
+# Текст запрашивается у FastAPI пачками по BATCH_SIZE документов; если FastAPI
+# недоступен (нет соединения, не отвечает за REQUEST_TIMEOUT или MAX_FAILURES
+# ошибок подряд), миграция завершается без ошибки, а текст сохранится при
+# первом открытии страницы. Отключается переменной окружения DOC_TEXT_BACKFILL=0.
+
+import hashlib
+import json
+import os
+
+import requests
+from django.db import migrations
+from django.utils import timezone
+
+BATCH_SIZE = 100
+REQUEST_TIMEOUT = 5  # с
+MAX_FAILURES = 10  # ошибок FastAPI подряд, после которых заполнение прекращается
+
+
+def backfill_doc_texts(apps, schema_editor):
+    if os.environ.get('DOC_TEXT_BACKFILL', '1') != '1':
+        return
+
+    Doc = apps.get_model('mi_django', 'Doc')
+    DocText = apps.get_model('mi_django', 'DocText')
+    base_url = os.environ.get('FASTAPI_BASE_URL', 'http://web:8000')
+    session = requests.Session()
+
+    last_id = 0
+    failures = 0
+    while True:
+        batch = list(
+            Doc.objects.filter(id__gt=last_id, fastapi_doc_id__isnull=False, text__isnull=True)
+            .order_by('id')
+            .values_list('id', 'fastapi_doc_id')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        rows = []
+        for doc_id, fastapi_doc_id in batch:
+            try:
+                response = session.get(f"{base_url}/get_text/{fastapi_doc_id}", timeout=REQUEST_TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout):
+                # Зависший FastAPI иначе задержал бы migrate на REQUEST_TIMEOUT на каждый документ
+                print(f"\n  FastAPI ({base_url}) недоступен, заполнение DocText прервано на документе {doc_id}.")
+                DocText.objects.bulk_create(rows, ignore_conflicts=True)
+                return
+            except requests.RequestException:
+                response = None
+            if response is None or response.status_code >= 500:
+                failures += 1
+                if failures >= MAX_FAILURES:
+                    print(f"\n  FastAPI ({base_url}) отвечает ошибками, заполнение DocText прервано на документе {doc_id}.")
+                    DocText.objects.bulk_create(rows, ignore_conflicts=True)
+                    return
+                continue
+            failures = 0
+            if response.status_code != 200:
+                continue
+            try:
+                texts = response.json().get('texts', [])
+            except ValueError:
+                continue
+            if not texts:
+                continue
+            payload = json.dumps(texts, ensure_ascii=False, sort_keys=True).encode('utf-8')
+            rows.append(DocText(
+                doc_id=doc_id,
+                texts=texts,
+                content_hash=hashlib.sha256(payload).hexdigest(),
+                fetched_at=timezone.now(),
+            ))
+        DocText.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    # Каждая пачка фиксируется отдельно, а не одной транзакцией на всю таблицу
+    atomic = False
+
+    dependencies = [
+        ('mi_django', '0007_doctext'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_doc_texts, migrations.RunPython.noop),
+    ]
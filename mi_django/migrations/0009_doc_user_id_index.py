@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_django', '0008_backfill_doctext'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doc',
+            index=models.Index(fields=['user', 'id'], name='docs_user_id_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_django', '0009_doc_user_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doc',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
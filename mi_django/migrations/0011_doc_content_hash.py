@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_django', '0010_doc_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doc',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Уникальный индекс на Price.file_type. Перед созданием индекса удаляются
+# дубликаты расширений (с ними Price.objects.get и так падал с
+# MultipleObjectsReturned): остаётся последняя добавленная запись.
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_prices(apps, schema_editor):
+    Price = apps.get_model('mi_django', 'Price')
+    duplicates = Price.objects.values('file_type').annotate(n=Count('id'), keep=Max('id')).filter(n__gt=1)
+    for row in duplicates:
+        Price.objects.filter(file_type=row['file_type']).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_django', '0012_analysis_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='price',
+            name='file_type',
+            field=models.CharField(max_length=10, unique=True),
+        ),
+    ]
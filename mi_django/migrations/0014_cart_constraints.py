@@ -0,0 +1,42 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:40
+# Перед уникальным ограничением (user, doc) дубли строк корзины, созданные
+# гонкой get_or_create, сводятся к одной: оплаченной, если такая есть,
+# иначе самой ранней.
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_carts(apps, schema_editor):
+    Cart = apps.get_model('mi_django', 'Cart')
+    duplicates = (
+        Cart.objects.values('user_id', 'doc_id')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+        .values_list('user_id', 'doc_id')
+    )
+    for user_id, doc_id in duplicates.iterator():
+        rows = Cart.objects.filter(user_id=user_id, doc_id=doc_id)
+        keep = rows.order_by('-payment', 'id').values_list('id', flat=True).first()
+        rows.exclude(id=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_django', '0013_price_file_type_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_carts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(condition=models.Q(('payment', True)), fields=['user', 'doc'], name='cart_paid_user_doc_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'doc'), name='cart_user_doc_uniq'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_django', '0014_cart_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackendDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fastapi_doc_id', models.IntegerField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField()),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'backend_deletions',
+                'indexes': [models.Index(fields=['run_after'], name='backend_deletions_run_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_django', '0015_backend_deletions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doc',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+    ]
@@ -1,18 +1,115 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
 
+from .thumbnails import THUMBNAIL_SIZES
+
+class AnalysisStatus(models.TextChoices):
+    QUEUED = 'queued', 'В очереди'
+    RUNNING = 'running', 'Выполняется'
+    DONE = 'done', 'Завершён'
+    FAILED = 'failed', 'Ошибка'
+
 class Doc(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     fastapi_doc_id = models.IntegerField(null=True)
     size = models.FloatField()
     file_path = models.CharField(max_length=255, default='')
     fastapi_doc_url = models.URLField(null=True, blank=True)
+    thumbnails = models.JSONField(default=dict, blank=True)  # {размер: путь миниатюры в MEDIA_ROOT}
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)  # sha256 файла
+    # Время загрузки; у документов, загруженных до появления поля, — NULL
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
+    # Состояние последнего анализа (обновляет воркер run_analysis_worker)
+    analysis_status = models.CharField(max_length=10, choices=AnalysisStatus.choices, blank=True, default='')
+    analysis_queued_at = models.DateTimeField(null=True, blank=True)
+    analysis_started_at = models.DateTimeField(null=True, blank=True)
+    analysis_finished_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"Doc {self.id} - {self.file_path if self.file_path else 'No File'}"
 
+    @property
+    def thumbnail_path(self):
+        """Миниатюра для карточки на главной; оригинал, если миниатюр ещё нет."""
+        if not self.thumbnails:
+            return self.file_path
+        largest = max(self.thumbnails, key=lambda name: THUMBNAIL_SIZES.get(name, 0))
+        return self.thumbnails[largest]
+
+    @property
+    def thumbnail_srcset(self):
+        return ', '.join(
+            f"{settings.MEDIA_URL}{path} {THUMBNAIL_SIZES[name]}w"
+            for name, path in self.thumbnails.items()
+            if name in THUMBNAIL_SIZES
+        )
+
     class Meta:
         db_table = 'docs'
+        indexes = [
+            # Keyset-пагинация главной страницы: WHERE user_id = ? AND id < ? ORDER BY id DESC
+            models.Index(fields=['user', 'id'], name='docs_user_id_id_idx'),
+        ]
+
+class DocText(models.Model):
+    doc = models.OneToOneField(Doc, on_delete=models.CASCADE, related_name='text')
+    texts = models.JSONField(default=list)  # список 'texts' из ответа FastAPI /get_text/
+    content_hash = models.CharField(max_length=64)  # sha256 от texts
+    fetched_at = models.DateTimeField()  # когда текст последний раз получен из FastAPI
+
+    def __str__(self):
+        return f"Text of Doc {self.doc_id} ({self.content_hash[:8]})"
+
+    class Meta:
+        db_table = 'doc_texts'
+
+class AnalysisJob(models.Model):
+    """Задача очереди анализа: запуск /doc_analyse/ и опрос /get_text/ до готовности текста."""
+    doc = models.ForeignKey(Doc, on_delete=models.CASCADE, related_name='analysis_jobs')
+    status = models.CharField(max_length=10, choices=AnalysisStatus.choices, default=AnalysisStatus.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)  # неудачных попыток подряд
+    run_after = models.DateTimeField()  # не раньше этого времени воркер возьмёт задачу
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"AnalysisJob {self.id} - Doc {self.doc_id} - {self.status}"
+
+    class Meta:
+        db_table = 'analysis_jobs'
+        indexes = [
+            # Выборка воркера: WHERE status IN (queued, running) AND run_after <= now() ORDER BY run_after
+            models.Index(
+                fields=['run_after'],
+                name='analysis_jobs_pending_idx',
+                condition=models.Q(status__in=['queued', 'running']),
+            ),
+        ]
+
+class BackendDeletion(models.Model):
+    """
+    Документ FastAPI, который нужно удалить (outbox). Строка создаётся в одной
+    транзакции с удалением последнего Doc, ссылающегося на документ, и
+    удаляется, когда FastAPI подтвердит удаление (mi_django/deletions.py).
+    """
+    fastapi_doc_id = models.IntegerField()
+    attempts = models.PositiveIntegerField(default=0)  # неудачных попыток подряд
+    run_after = models.DateTimeField()  # не раньше этого времени воркер возьмёт запись
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"BackendDeletion {self.id} - FastAPI doc {self.fastapi_doc_id}"
+
+    class Meta:
+        db_table = 'backend_deletions'
+        indexes = [
+            # Выборка воркера: WHERE run_after <= now() ORDER BY run_after
+            models.Index(fields=['run_after'], name='backend_deletions_run_idx'),
+        ]
 
 class UsersToDocs(models.Model):
     username = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -25,7 +122,7 @@ class UsersToDocs(models.Model):
         db_table = 'user_to_docs'
 
 class Price(models.Model):
-    file_type = models.CharField(max_length=10)  # расширение файла
+    file_type = models.CharField(max_length=10, unique=True)  # расширение файла
     price = models.FloatField()  # цена анализа 1 Кб данных
 
     def str(self):
@@ -44,4 +141,12 @@ class Cart(models.Model):
         return f"Cart for User {self.user_id} - Doc {self.doc_id} - Paid: {self.payment}"
 
     class Meta:
-        db_table = 'cart'
\ No newline at end of file
+        db_table = 'cart'
+        constraints = [
+            # Одна строка корзины на документ пользователя: одновременные get_or_create не создадут дубль
+            models.UniqueConstraint(fields=['user', 'doc'], name='cart_user_doc_uniq'),
+        ]
+        indexes = [
+            # Проверка оплаты: WHERE user_id = ? AND doc_id = ? AND payment — индекс только по оплаченным строкам
+            models.Index(fields=['user', 'doc'], name='cart_paid_user_doc_idx', condition=models.Q(payment=True)),
+        ]
\ No newline at end of file
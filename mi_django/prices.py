@@ -0,0 +1,102 @@
+"""
+Таблица цен анализа в памяти процесса.
+
+Таблица Price маленькая, поэтому целиком загружается в словарь
+{расширение: цена за КБ}, и расчёт стоимости не обращается к БД. При
+изменении или удалении Price (сигналы post_save/post_delete) в кэше Django
+записывается новая метка версии; каждый процесс сверяет свою копию с меткой
+не чаще раза в PRICE_VERSION_CHECK_INTERVAL секунд и перечитывает таблицу,
+если метка сменилась. Для работы между процессами нужен общий кэш
+(Redis, Memcached, база данных), а не LocMemCache.
+
+Изменения через QuerySet.update() и bulk_create сигналов не вызывают —
+после них нужно вызвать price_table.invalidate().
+"""
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Price
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRICE_PER_KB = getattr(settings, 'DEFAULT_PRICE_PER_KB', 1.0)
+PRICE_CACHE_ALIAS = getattr(settings, 'PRICE_CACHE_ALIAS', 'default')
+PRICE_VERSION_CHECK_INTERVAL = getattr(settings, 'PRICE_VERSION_CHECK_INTERVAL', 1.0)  # секунд
+
+_VERSION_KEY = 'price-table:version'
+
+
+class PriceTable:
+    """Копия таблицы Price в памяти процесса, сверяемая с меткой версии в кэше."""
+
+    def __init__(self, cache_alias=PRICE_CACHE_ALIAS, check_interval=PRICE_VERSION_CHECK_INTERVAL):
+        self.cache_alias = cache_alias
+        self.check_interval = check_interval
+        self._prices = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _current_version(self):
+        version = self.cache.get(_VERSION_KEY)
+        if version is None:
+            # Кэш очищен или перезапущен: заводим метку, копии всех процессов перечитаются
+            self.cache.add(_VERSION_KEY, uuid.uuid4().hex, None)
+            version = self.cache.get(_VERSION_KEY)
+        return version
+
+    def prices(self):
+        """Словарь {расширение: цена за КБ}."""
+        now = time.monotonic()
+        prices = self._prices
+        if prices is not None and now - self._checked_at < self.check_interval:
+            return prices
+        with self._lock:
+            version = self._current_version()
+            if self._prices is None or version != self._version:
+                self._prices = dict(Price.objects.values_list('file_type', 'price'))
+                self._version = version
+                self.loads += 1
+                logger.debug("Таблица цен загружена: %s записей, версия %s.", len(self._prices), version)
+            self._checked_at = now
+            return self._prices
+
+    def get(self, file_type, default=None):
+        return self.prices().get(file_type, default)
+
+    def price_for(self, file_path):
+        """Цена за КБ по расширению файла и признак того, что это цена по умолчанию."""
+        file_type = file_path.rsplit('.', 1)[-1].lower()
+        price = self.get(file_type)
+        if price is None:
+            return DEFAULT_PRICE_PER_KB, True
+        return price, False
+
+    def invalidate(self):
+        """Сбрасывает копию во всех процессах (через новую метку версии)."""
+        self.cache.set(_VERSION_KEY, uuid.uuid4().hex, None)
+        with self._lock:
+            self._prices = None
+
+
+price_table = PriceTable()
+
+
+@receiver(post_save, sender=Price)
+@receiver(post_delete, sender=Price)
+def _price_changed(sender, **kwargs):
+    # После фиксации транзакции: иначе другой процесс успеет перечитать старые цены
+    transaction.on_commit(price_table.invalidate)
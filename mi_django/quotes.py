@@ -0,0 +1,123 @@
+"""
+Пакетный расчёт стоимости анализа и оформление заказа на много документов.
+
+Документы пакета читаются одним запросом, цены берутся из таблицы цен
+в памяти процесса (prices.price_table), строки Cart создаются и обновляются
+через bulk_create/bulk_update. Число запросов к БД не зависит от размера
+пакета.
+"""
+import logging
+
+from django.db import transaction
+
+from .fragments import fragment_cache
+from .models import Cart, Doc
+from .prices import price_table
+
+logger = logging.getLogger(__name__)
+
+BATCH_QUOTE_MAX_DOCS = 1000
+
+
+class QuoteError(Exception):
+    """Пакет не может быть рассчитан (пустой, слишком большой, неверные id)."""
+
+
+def parse_doc_ids(values, max_docs=BATCH_QUOTE_MAX_DOCS):
+    """Список id документов из формы (doc_ids=1&doc_ids=2) или строки "1,2,3"."""
+    doc_ids = []
+    for value in values:
+        for part in str(value).split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if not part.isdigit():
+                raise QuoteError(f"Неверный id документа: {part}")
+            doc_ids.append(int(part))
+    # Порядок сохраняется, повторы отбрасываются
+    doc_ids = list(dict.fromkeys(doc_ids))
+    if not doc_ids:
+        raise QuoteError("Документы не выбраны.")
+    if len(doc_ids) > max_docs:
+        raise QuoteError(f"Не больше {max_docs} документов за раз.")
+    return doc_ids
+
+
+def quote_documents(user, doc_ids):
+    """
+    Стоимость анализа документов пользователя.
+
+    Возвращает {'items': [...], 'total': ..., 'missing': [...]}; в missing —
+    id, которых нет среди документов пользователя.
+    """
+    docs = {
+        doc.id: doc
+        for doc in Doc.objects.filter(user=user, id__in=doc_ids).only('id', 'file_path', 'size')
+    }
+    items = []
+    for doc_id in doc_ids:
+        doc = docs.get(doc_id)
+        if doc is None:
+            continue
+        price_per_kb, is_default = price_table.price_for(doc.file_path)
+        items.append({
+            'doc_id': doc.id,
+            'file_path': doc.file_path,
+            'size': doc.size,
+            'price_per_kb': price_per_kb,
+            'default_price': is_default,
+            'order_price': doc.size * price_per_kb,
+        })
+    return {
+        'items': items,
+        'total': sum(item['order_price'] for item in items),
+        'missing': [doc_id for doc_id in doc_ids if doc_id not in docs],
+    }
+
+
+def order_documents(user, doc_ids):
+    """
+    Оформляет и оплачивает анализ документов пакетом.
+
+    Уже оплаченные документы пропускаются. Возвращает расчёт, дополненный
+    списком 'already_paid' и суммой фактически оплаченного 'charged'.
+    """
+    quote = quote_documents(user, doc_ids)
+    prices = {item['doc_id']: item['order_price'] for item in quote['items']}
+
+    with transaction.atomic():
+        # Недостающие строки — неоплаченными; строку того же документа мог только что
+        # создать и оплатить параллельный заказ (уникальность user, doc): её не трогаем
+        Cart.objects.bulk_create(
+            [Cart(user=user, doc_id=doc_id, order_price=order_price, payment=False)
+             for doc_id, order_price in prices.items()],
+            ignore_conflicts=True,
+        )
+        carts = {
+            cart.doc_id: cart
+            for cart in Cart.objects.select_for_update()
+            .filter(user=user, doc_id__in=prices)
+            .only('id', 'doc_id', 'order_price', 'payment')
+        }
+
+        # Оплачиваются только строки, которые этот заказ перевёл из неоплаченных в оплаченные
+        to_update, already_paid = [], []
+        for doc_id, order_price in prices.items():
+            cart = carts[doc_id]
+            if cart.payment:
+                already_paid.append(doc_id)
+            else:
+                cart.order_price = order_price
+                cart.payment = True
+                to_update.append(cart)
+
+        if to_update:
+            Cart.objects.bulk_update(to_update, ['order_price', 'payment'])
+    # bulk_create/bulk_update не вызывают post_save
+    fragment_cache.bump(user.id)
+
+    quote['already_paid'] = already_paid
+    quote['charged'] = sum(cart.order_price for cart in to_update)
+    logger.info("Пользователь %s оплатил анализ %s документов на сумму %.2f руб.",
+                user.username, len(to_update), quote['charged'])
+    return quote
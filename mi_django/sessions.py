@@ -0,0 +1,131 @@
+"""
+Хранилище сессий для большого числа запросов (SESSION_ENGINE = 'mi_django.sessions').
+
+В сессии лежат JWT прокси-сервера (access_token, refresh_token), и её
+читает каждый запрос вошедшего пользователя. Уровни чтения:
+
+    память процесса (SESSION_LOCAL_TTL секунд) -> кэш Django -> django_session
+
+Запись идёт в БД и в кэш, как у стандартного cached_db, и обновляет копию
+в памяти процесса. Копия в памяти живёт не дольше SESSION_LOCAL_TTL:
+запись, сделанная другим воркером (обновление токена, выход), видна здесь
+с этой задержкой. Устаревший access-токен не страшен — TokenManager берёт
+уже обновлённые токены из общего кэша по старому refresh-токену. Для
+SESSION_LOCAL_TTL = 0 уровень в памяти отключён.
+
+Кэш (SESSION_CACHE_ALIAS) должен быть общим для всех воркеров — Redis
+(REDIS_URL) или Memcached: с LocMemCache каждый процесс видел бы свою,
+возможно устаревшую, копию до истечения сессии.
+
+Подписанные cookie (signed_cookies) не подходят: содержимое cookie
+подписано, но не зашифровано, и refresh-токен был бы виден в браузере.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+SESSION_LOCAL_TTL = getattr(settings, 'SESSION_LOCAL_TTL', 2.0)  # секунд
+SESSION_LOCAL_MAX_ENTRIES = getattr(settings, 'SESSION_LOCAL_MAX_ENTRIES', 10000)
+
+
+class LocalSessionTier:
+    """LRU сессий в памяти процесса: session_key -> (данные, момент устаревания)."""
+
+    def __init__(self, ttl=SESSION_LOCAL_TTL, max_entries=SESSION_LOCAL_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_key):
+        if self.ttl <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[session_key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_key)
+            self.hits += 1
+            data = entry[0]
+        # Сессия меняет свой словарь на месте: отдаём копию, чтобы несохранённые изменения не попали в общий уровень
+        return copy.deepcopy(data)
+
+    def set(self, session_key, data):
+        if self.ttl <= 0 or session_key is None:
+            return
+        data = copy.deepcopy(data)
+        with self._lock:
+            self._entries[session_key] = (data, time.monotonic() + self.ttl)
+            self._entries.move_to_end(session_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, session_key):
+        with self._lock:
+            self._entries.pop(session_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+
+local_sessions = LocalSessionTier()
+
+
+class SessionStore(CachedDBStore):
+    """cached_db с копией сессии в памяти процесса."""
+
+    def load(self):
+        data = local_sessions.get(self.session_key)
+        if data is not None:
+            return data
+        data = super().load()
+        if data:
+            local_sessions.set(self.session_key, data)
+        return data
+
+    async def aload(self):
+        data = local_sessions.get(self.session_key)
+        if data is not None:
+            return data
+        data = await super().aload()
+        if data:
+            local_sessions.set(self.session_key, data)
+        return data
+
+    def save(self, must_create=False):
+        super().save(must_create)
+        local_sessions.set(self.session_key, self._session)
+
+    async def asave(self, must_create=False):
+        await super().asave(must_create)
+        local_sessions.set(self.session_key, self._session)
+
+    def delete(self, session_key=None):
+        local_sessions.delete(session_key or self.session_key)
+        super().delete(session_key)
+
+    async def adelete(self, session_key=None):
+        local_sessions.delete(session_key or self.session_key)
+        await super().adelete(session_key)
@@ -1,9 +1,72 @@
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.urls import reverse
-from django.test import TestCase
+from django.urls import path, reverse
+from django.test import Client, TestCase, override_settings
 from django.contrib.auth.models import User
-from .models import Doc, Cart
-from unittest.mock import patch
+from .models import AnalysisJob, AnalysisStatus, BackendDeletion, Doc, DocText, Cart, Price, UsersToDocs
+from .uploads import MultipartFileStream
+from .media_store import delete_doc
+from .http_client import FASTAPI_BASE_URL, BackendClient, pool_stats, token_manager
+from .tokens import token_expiry
+from .text_cache import LRUTextCache, TextCache, text_cache
+from .analysis_queue import claim_jobs, enqueue_analysis, run_once
+from .prices import PriceTable, price_table
+from .metrics import request_metrics
+from .fragments import fragment_cache
+from .sessions import SessionStore, local_sessions
+from .logins import last_logins, login_rate_limit, login_users
+from .circuit import Budget, BudgetExceeded, CircuitBreakers, CircuitOpen, circuit_breakers
+from . import circuit
+from .quotes import order_documents
+from . import deletions
+from .logs import QueueListenerHandler
+from . import async_views, urls as mi_urls
+from unittest.mock import AsyncMock, Mock, PropertyMock, patch
+from asgiref.sync import async_to_sync
+import requests
+from django.utils import timezone
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import io
+import os
+import tempfile
+import hashlib
+import base64
+import json
+import time
+import itertools
+import zipfile
+import logging
+from PIL import Image
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import re
+import importlib
+from django.apps import apps as django_apps
+
+
+class StubBackendHandler(BaseHTTPRequestHandler):
+    """Локальная заглушка прокси/FastAPI с поддержкой keep-alive."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{"texts": []}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_backend(handler=StubBackendHandler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
 
 class ModelsTestCase(TestCase):
     def setUp(self):
@@ -103,6 +166,7 @@ class DocumentActionsTestCase(TestCase):
             fastapi_doc_id='1234',
             size=123.45
         )
+        text_cache.invalidate(self.doc.fastapi_doc_id)
         # Логиним пользователя
         self.client.login(username='testuser', password='testpassword')
 
@@ -122,12 +186,14 @@ class DocumentActionsTestCase(TestCase):
         """Тест доступа суперпользователя к анализу документа"""
         superuser = User.objects.create_superuser(username='admin', password='adminpassword')
         self.client.login(username='admin', password='adminpassword')
-        with patch('mi_django.views.requests.put') as mock_put:
-            mock_put.return_value.status_code = 200
+        with patch('mi_django.analysis_queue.backend.put') as mock_put:
             response = self.client.post(reverse('analyze_document', args=[self.doc.id]))
             self.assertEqual(response.status_code, 302)
+            # Представление только ставит задачу в очередь, FastAPI вызывает воркер
+            mock_put.assert_not_called()
+        self.assertTrue(AnalysisJob.objects.filter(doc=self.doc, status=AnalysisStatus.QUEUED).exists())
 
-    @patch("mi_django.views.requests.delete")
+    @patch("mi_django.views.backend.delete")
     def test_delete_document(self, mock_delete):
         """Тест удаления документа"""
         mock_delete.return_value.status_code = 200
@@ -135,7 +201,7 @@ class DocumentActionsTestCase(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertFalse(Doc.objects.filter(id=self.doc.id).exists())
 
-    @patch("mi_django.views.requests.get")
+    @patch("mi_django.views.backend.get")
     def test_get_document_text(self, mock_get):
         """Тест успешного получения текста документа"""
         mock_get.return_value.status_code = 200
@@ -152,6 +218,7 @@ class GetDocumentTextTestCase(TestCase):
             fastapi_doc_id='1234',
             size=123.45
         )
+        text_cache.invalidate(self.doc.fastapi_doc_id)
         self.url = reverse('get_document_text', args=[self.doc.id])
 
     def test_document_not_found(self):
@@ -163,7 +230,7 @@ class GetDocumentTextTestCase(TestCase):
     def test_successful_text_retrieval(self):
         """Успешное получение текста"""
         self.client.login(username='testuser', password='testpassword')
-        with patch('mi_django.views.requests.get') as mock_get:
+        with patch('mi_django.views.backend.get') as mock_get:
             mock_get.return_value.status_code = 200
             mock_get.return_value.json.return_value = {'texts': ['Текст 1']}
             response = self.client.get(self.url)
@@ -172,7 +239,7 @@ class GetDocumentTextTestCase(TestCase):
     def test_fastapi_error(self):
         """Ошибка от FastAPI"""
         self.client.login(username='testuser', password='testpassword')
-        with patch('mi_django.views.requests.get') as mock_get:
+        with patch('mi_django.views.backend.get') as mock_get:
             mock_get.return_value.status_code = 500
             response = self.client.get(self.url)
             self.assertEqual(response.status_code, 500)
@@ -188,8 +255,13 @@ class UploadDocumentTestCase(TestCase):
         """Создаём тестового пользователя и авторизуем его"""
         self.user = User.objects.create_user(username="testuser", password="testpassword")
         self.client.force_login(self.user)  # Аутентификация пользователя
+        # Токены прокси-сервера, которые login_view кладёт в сессию
+        session = self.client.session
+        session['access_token'] = 'access'
+        session['refresh_token'] = 'refresh'
+        session.save()
 
-    @patch('mi_django.views.requests.post')
+    @patch('mi_django.views.backend.post')
     def test_successful_image_upload(self, mock_post):
         """Тест успешной загрузки изображения"""
         mock_post.return_value.status_code = 200
@@ -202,4 +274,1737 @@ class UploadDocumentTestCase(TestCase):
 
         # Ожидаем редирект на главную страницу (index)
         self.assertRedirects(response, reverse('index'))
-        self.assertTrue(Doc.objects.filter(fastapi_doc_id='1234').exists())
\ No newline at end of file
+        self.assertTrue(Doc.objects.filter(fastapi_doc_id='1234').exists())
+
+class MultipartFileStreamTestCase(TestCase):
+    def test_body_is_streamed_in_chunks(self):
+        """Тело multipart собирается по кускам, копия файла уходит в sinks"""
+        content = b"x" * 1000 + b"y" * 1000
+        upload = SimpleUploadedFile("scan.jpg", content, content_type="image/jpeg")
+        copy = []
+        body = MultipartFileStream(upload, filename="scan.jpg", content_type="image/jpeg",
+                                   sinks=[copy.append], chunk_size=256)
+
+        chunks = list(body)
+        data = b"".join(chunks)
+
+        # Ни один кусок не превышает размер чанка, длина совпадает с Content-Length
+        self.assertTrue(all(len(chunk) <= 256 for chunk in chunks))
+        self.assertEqual(len(data), len(body))
+        self.assertIn(b'filename="scan.jpg"', data)
+        self.assertIn(content, data)
+        self.assertTrue(data.endswith(f"--{body.boundary}--\r\n".encode()))
+        self.assertEqual(b"".join(copy), content)
+
+    def test_drain_completes_sinks(self):
+        """drain() дописывает остаток файла, если тело прочитано не полностью"""
+        content = b"z" * 5000
+        upload = SimpleUploadedFile("scan.jpg", content, content_type="image/jpeg")
+        copy = []
+        body = MultipartFileStream(upload, sinks=[copy.append], chunk_size=512)
+        body.read(512)
+        body.read(512)
+        self.assertFalse(body.finished)
+
+        body.drain()
+        self.assertTrue(body.finished)
+        self.assertEqual(b"".join(copy), content)
+
+    def test_async_chunks(self):
+        """Асинхронный итератор отдаёт всё тело и передаёт копию файла в sinks"""
+        content = b"a" * 3000
+        copy = []
+        body = MultipartFileStream(SimpleUploadedFile("scan.jpg", content), sinks=[copy.append], chunk_size=512)
+
+        async def collect():
+            return [chunk async for chunk in body.aiter_chunks()]
+
+        data = b"".join(async_to_sync(collect)())
+        self.assertEqual(len(data), len(body))
+        self.assertIn(content, data)
+        self.assertTrue(data.endswith(f"--{body.boundary}--\r\n".encode()))
+        self.assertEqual(b"".join(copy), content)
+
+
+class BackendClientTestCase(TestCase):
+    def setUp(self):
+        self.server = start_stub_backend()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/get_text/1"
+        pool_stats.reset()
+
+    def test_connection_is_reused(self):
+        """Повторные запросы идут через одно keep-alive соединение"""
+        client = BackendClient()
+        for _ in range(3):
+            self.assertEqual(client.get(self.url).status_code, 200)
+
+        stats = client.stats()[f"127.0.0.1:{self.server.server_port}"]
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 2)
+
+    def test_default_timeout(self):
+        """Таймаут из настроек подставляется во все запросы"""
+        client = BackendClient(timeout=(1, 2))
+        with patch.object(client.session, 'request') as mock_request:
+            client.delete(self.url)
+        self.assertEqual(mock_request.call_args.kwargs['timeout'], (1, 2))
+
+
+class AsyncViewsUrls:
+    """URLconf, в котором обращения к бэкенду обслуживают асинхронные представления."""
+    urlpatterns = [
+        path('upload-document/', async_views.upload_document, name='upload_document'),
+        path('analyze-document/<int:doc_id>/', async_views.analyze_document, name='analyze_document'),
+        path('get-document-text/<int:doc_id>/', async_views.get_document_text, name='get_document_text'),
+        path('delete-document/<int:doc_id>/', async_views.delete_document, name='delete_document'),
+    ] + mi_urls.urlpatterns
+
+
+@override_settings(ROOT_URLCONF=AsyncViewsUrls)
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.doc = Doc.objects.create(user=self.user, file_path='test_path', fastapi_doc_id=1234, size=123.45)
+        text_cache.invalidate(self.doc.fastapi_doc_id)
+        self.client.force_login(self.user)
+
+    @patch('mi_django.async_views.async_backend.get', new_callable=AsyncMock)
+    def test_get_document_text(self, mock_get):
+        """Асинхронное получение текста документа"""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json = lambda: {'texts': [{'text': 'Текст 1'}]}
+        response = self.client.get(reverse('get_document_text', args=[self.doc.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Текст 1')
+
+    @patch('mi_django.async_views.async_backend.get', new_callable=AsyncMock)
+    def test_get_document_text_invalid_json(self, mock_get):
+        """Ответ FastAPI не в JSON — ошибка получения текста, а не исключение"""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.text = '<html>Bad Gateway</html>'
+        mock_get.return_value.json = Mock(side_effect=ValueError('Expecting value'))
+        response = self.client.get(reverse('get_document_text', args=[self.doc.id]))
+        self.assertContains(response, 'Ошибка при получении текста', status_code=500)
+
+    def test_get_document_text_not_found(self):
+        """Чужой или несуществующий документ — 404"""
+        response = self.client.get(reverse('get_document_text', args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_analyze_without_payment(self):
+        """Без оплаты асинхронный анализ перенаправляет на страницу оплаты"""
+        response = self.client.post(reverse('analyze_document', args=[self.doc.id]))
+        self.assertRedirects(response, reverse('order_analysis', args=[self.doc.id]), fetch_redirect_response=False)
+
+    @patch('mi_django.async_views.async_backend.delete', new_callable=AsyncMock)
+    def test_delete_document(self, mock_delete):
+        """Асинхронное удаление документа"""
+        response = self.client.post(reverse('delete_document', args=[self.doc.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Doc.objects.filter(id=self.doc.id).exists())
+        mock_delete.assert_awaited_once()
+
+    @patch('mi_django.async_views.async_backend.delete', new_callable=AsyncMock)
+    def test_delete_document_without_analysis(self, mock_delete):
+        """Документ без fastapi_doc_id удаляется без обращения к FastAPI"""
+        doc = Doc.objects.create(user=self.user, file_path='no_analysis_path', size=1)
+        response = self.client.post(reverse('delete_document', args=[doc.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Doc.objects.filter(id=doc.id).exists())
+        mock_delete.assert_not_awaited()
+
+    @patch('mi_django.async_views.async_backend.post', new_callable=AsyncMock)
+    def test_upload_document(self, mock_post):
+        """Асинхронная загрузка документа на прокси-сервер"""
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.raise_for_status = lambda: None
+        mock_post.return_value.json = lambda: {'id': 4321}
+        session = self.client.session
+        session['access_token'] = 'access'
+        session['refresh_token'] = 'refresh'
+        session.save()
+
+        test_image = SimpleUploadedFile("test.jpg", b"fake_image_content", content_type="image/jpeg")
+        response = self.client.post(reverse('upload_document'), {'document': test_image})
+
+        self.assertRedirects(response, reverse('index'))
+        self.assertTrue(Doc.objects.filter(fastapi_doc_id=4321).exists())
+
+    @patch('mi_django.async_views.Doc.objects.acreate', new_callable=AsyncMock)
+    @patch('mi_django.async_views.async_backend.post', new_callable=AsyncMock)
+    def test_upload_failure_leaves_no_file(self, mock_post, mock_acreate):
+        """Ошибка сохранения Doc при асинхронной загрузке не оставляет файл без документа"""
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.raise_for_status = lambda: None
+        mock_post.return_value.json = lambda: {'id': 4321}
+        mock_acreate.side_effect = RuntimeError("БД недоступна")
+        session = self.client.session
+        session['access_token'] = 'access'
+        session['refresh_token'] = 'refresh'
+        session.save()
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            test_image = SimpleUploadedFile("test.jpg", b"other_image_content", content_type="image/jpeg")
+            response = self.client.post(reverse('upload_document'), {'document': test_image})
+            self.assertRedirects(response, reverse('upload_document'), fetch_redirect_response=False)
+            self.assertEqual([name for _, _, files in os.walk(media_root) for name in files], [])
+
+
+class TextCacheTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.doc = Doc.objects.create(user=self.user, file_path='test_path', fastapi_doc_id=555, size=1)
+        text_cache.invalidate(self.doc.fastapi_doc_id)
+        self.client.force_login(self.user)
+        self.url = reverse('get_document_text', args=[self.doc.id])
+
+    def test_lru_evicts_by_size(self):
+        """LRU вытесняет давно не использованные записи при превышении размера"""
+        cache = LRUTextCache(max_bytes=80)
+        cache.set(1, [{'text': 'a' * 20}])
+        cache.set(2, [{'text': 'b' * 20}])
+        cache.get(1)
+        cache.set(3, [{'text': 'c' * 20}])
+        self.assertIsNotNone(cache.get(1))
+        self.assertIsNone(cache.get(2))
+        self.assertLessEqual(cache.current_bytes, 80)
+
+    def test_unfinished_analysis_is_not_cached(self):
+        """Пустой ответ (анализ не завершён) не попадает в кэш"""
+        cache = TextCache(LRUTextCache())
+        cache.set(1, [])
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    @patch('mi_django.views.backend.get')
+    def test_second_request_served_from_cache(self, mock_get):
+        """Повторное открытие страницы не обращается к FastAPI"""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'texts': [{'text': 'Текст 1'}]}
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Текст 1')
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('mi_django.views.backend.get')
+    def test_new_analysis_invalidates(self, mock_get):
+        """Запуск нового анализа сбрасывает закэшированный текст"""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'texts': [{'text': 'Текст 1'}]}
+        self.client.get(self.url)
+        Cart.objects.create(user=self.user, doc=self.doc, order_price=1, payment=True)
+        self.client.post(reverse('analyze_document', args=[self.doc.id]))
+        self.client.get(self.url)
+        self.assertEqual(mock_get.call_count, 2)
+
+
+class DocTextTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.doc = Doc.objects.create(user=self.user, file_path='test_path', fastapi_doc_id=777, size=1)
+        text_cache.invalidate(self.doc.fastapi_doc_id)
+        self.client.force_login(self.user)
+        self.url = reverse('get_document_text', args=[self.doc.id])
+
+    @patch('mi_django.views.backend.get')
+    def test_text_persisted_after_first_fetch(self, mock_get):
+        """После первого получения текст сохраняется в БД и не требует FastAPI"""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'texts': [{'text': 'Текст 1'}]}
+        self.client.get(self.url)
+
+        stored = DocText.objects.get(doc=self.doc)
+        self.assertEqual(stored.texts, [{'text': 'Текст 1'}])
+        self.assertEqual(len(stored.content_hash), 64)
+
+        # FastAPI перезапускается, кэш процесса пуст — страница всё равно работает
+        text_cache.invalidate(self.doc.fastapi_doc_id)
+        mock_get.side_effect = requests.ConnectionError()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Текст 1')
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('mi_django.views.backend.get')
+    def test_unfinished_analysis_not_persisted(self, mock_get):
+        """Пустой список текстов не сохраняется"""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'texts': []}
+        self.client.get(self.url)
+        self.assertFalse(DocText.objects.filter(doc=self.doc).exists())
+
+    def test_new_analysis_forgets_text(self):
+        """Новый анализ удаляет сохранённый текст"""
+        DocText.objects.create(doc=self.doc, texts=[{'text': 'old'}], content_hash='x', fetched_at=timezone.now())
+        Cart.objects.create(user=self.user, doc=self.doc, order_price=1, payment=True)
+        self.client.post(reverse('analyze_document', args=[self.doc.id]))
+        self.assertFalse(DocText.objects.filter(doc=self.doc).exists())
+
+    def test_backfill_stops_on_timeout(self):
+        """Зависший FastAPI прерывает заполнение DocText в миграции после первого таймаута"""
+        backfill = importlib.import_module('mi_django.migrations.0008_backfill_doctext')
+        Doc.objects.create(user=self.user, file_path='other_path', fastapi_doc_id=778, size=1)
+        with patch('requests.Session.get', side_effect=requests.Timeout()) as mock_get, \
+                patch('builtins.print'):
+            backfill.backfill_doc_texts(django_apps, None)
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertFalse(DocText.objects.exists())
+
+
+class IndexPaginationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        self.docs = Doc.objects.bulk_create(
+            Doc(user=self.user, file_path=f'doc_{i}.png', size=i) for i in range(5)
+        )
+
+    @patch('mi_django.views.INDEX_PAGE_SIZE', 2)
+    def test_keyset_pages(self):
+        """Страницы идут от новых документов к старым по курсору after"""
+        ids = sorted((doc.id for doc in Doc.objects.filter(user=self.user)), reverse=True)
+
+        response = self.client.get(reverse('index'))
+        self.assertEqual([doc.id for doc in response.context['docs']], ids[:2])
+        self.assertEqual(response.context['next_cursor'], ids[1])
+
+        response = self.client.get(reverse('index'), {'after': ids[1]})
+        self.assertEqual([doc.id for doc in response.context['docs']], ids[2:4])
+
+        response = self.client.get(reverse('index'), {'after': ids[3]})
+        self.assertEqual([doc.id for doc in response.context['docs']], ids[4:])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_other_users_docs_hidden(self):
+        """Документы других пользователей не попадают на страницу"""
+        other = User.objects.create_user(username='other', password='otherpassword')
+        Doc.objects.create(user=other, file_path='other.png', size=1)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(len(response.context['docs']), 5)
+
+    def test_invalid_cursor_shows_first_page(self):
+        """Некорректный курсор открывает первую страницу"""
+        response = self.client.get(reverse('index'), {'after': 'abc'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['is_first_page'])
+
+
+class ThumbnailsTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        Image.new('RGB', (2000, 1000), 'white').save(os.path.join(self.media_root.name, 'scan.jpg'))
+        self.doc = Doc.objects.create(user=self.user, file_path='scan.jpg', size=1)
+
+    def test_backfill_command(self):
+        """Команда создаёт миниатюры всех размеров для существующих документов"""
+        call_command('generate_thumbnails', workers=1, stdout=io.StringIO())
+        self.doc.refresh_from_db()
+        self.assertEqual(set(self.doc.thumbnails), {'sm', 'md'})
+        with Image.open(os.path.join(self.media_root.name, self.doc.thumbnails['sm'])) as thumb:
+            self.assertEqual(thumb.size, (320, 160))
+            self.assertEqual(thumb.format, 'WEBP')
+
+    def test_index_uses_lazy_thumbnails(self):
+        """Главная страница показывает миниатюру с loading=lazy вместо оригинала"""
+        call_command('generate_thumbnails', workers=1, stdout=io.StringIO())
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'thumbs/md/scan.webp')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertNotContains(response, 'src="/media/scan.jpg"')
+
+
+class DeduplicatedStorageTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        session = self.client.session
+        session['access_token'] = 'access'
+        session['refresh_token'] = 'refresh'
+        session.save()
+        self.content = b"same_scan_bytes"
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+
+    def upload(self):
+        test_image = SimpleUploadedFile("scan.JPG", self.content, content_type="image/jpeg")
+        return self.client.post(reverse('upload_document'), {'document': test_image})
+
+    @patch('mi_django.views.backend.post')
+    def test_reupload_reuses_file_and_analysis(self, mock_post):
+        """Повторная загрузка тех же байтов не отправляет файл в FastAPI повторно"""
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {'id': 42}
+        self.upload()
+        self.upload()
+
+        self.assertEqual(mock_post.call_count, 1)
+        docs = list(Doc.objects.filter(user=self.user))
+        self.assertEqual(len(docs), 2)
+        expected_path = f'cas/{self.sha256[:2]}/{self.sha256[2:4]}/{self.sha256}.jpg'
+        self.assertEqual({doc.file_path for doc in docs}, {expected_path})
+        self.assertEqual({doc.fastapi_doc_id for doc in docs}, {42})
+        self.assertEqual({doc.content_hash for doc in docs}, {self.sha256})
+
+    @patch('mi_django.views.backend.delete')
+    @patch('mi_django.views.backend.post')
+    def test_file_removed_with_last_reference(self, mock_post, mock_delete):
+        """Файл и документ FastAPI удаляются только вместе с последней ссылкой"""
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {'id': 42}
+        self.upload()
+        self.upload()
+        first, second = Doc.objects.filter(user=self.user).order_by('id')
+        path = os.path.join(self.media_root.name, first.file_path)
+
+        self.client.post(reverse('delete_document', args=[first.id]))
+        self.assertTrue(os.path.exists(path))
+        mock_delete.assert_not_called()
+
+        self.client.post(reverse('delete_document', args=[second.id]))
+        self.assertFalse(os.path.exists(path))
+        mock_delete.assert_called_once()
+
+    def media_files(self):
+        return [name for _, _, files in os.walk(self.media_root.name) for name in files]
+
+    @patch('mi_django.views.backend.post')
+    def test_failed_upload_leaves_no_file(self, mock_post):
+        """Неверный ответ прокси-сервера или ошибка сохранения Doc не оставляют файл без документа"""
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.side_effect = ValueError("не JSON")
+        self.upload()
+        self.assertEqual(self.media_files(), [])
+
+        mock_post.return_value.json.side_effect = None
+        mock_post.return_value.json.return_value = {'id': 42}
+        with patch('mi_django.views.Doc.objects.create', side_effect=RuntimeError("БД недоступна")):
+            response = self.upload()
+        self.assertRedirects(response, reverse('upload_document'))
+        self.assertFalse(Doc.objects.exists())
+        self.assertEqual(self.media_files(), [])
+
+    def test_delete_doc_counts_fastapi_refs(self):
+        """Документ FastAPI, общий для разных файлов, уходит в outbox только с последней ссылкой"""
+        first = Doc.objects.create(user=self.user, file_path='cas/aa/bb/x.jpg', size=1, fastapi_doc_id=42)
+        second = Doc.objects.create(user=self.user, file_path='cas/aa/bb/y.jpg', size=1, fastapi_doc_id=42)
+        no_analysis = Doc.objects.create(user=self.user, file_path='cas/aa/bb/z.jpg', size=1)
+
+        self.assertEqual(delete_doc(first), (True, False))
+        self.assertFalse(BackendDeletion.objects.exists())
+        self.assertEqual(delete_doc(second), (True, True))
+        self.assertEqual(list(BackendDeletion.objects.values_list('fastapi_doc_id', flat=True)), [42])
+        self.assertEqual(delete_doc(no_analysis), (True, False))
+        self.assertEqual(BackendDeletion.objects.count(), 1)
+
+    def test_report_command(self):
+        """Отчёт показывает сэкономленное место"""
+        Doc.objects.create(user=self.user, file_path='cas/aa/bb/x.jpg', size=100, content_hash='x')
+        Doc.objects.create(user=self.user, file_path='cas/aa/bb/x.jpg', size=100, content_hash='x')
+        out = io.StringIO()
+        call_command('media_dedup_report', stdout=out)
+        self.assertIn('Сэкономлено: 100.0 КБ (50.0%)', out.getvalue())
+
+
+class AnalysisQueueTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', password='adminpassword')
+        self.doc = Doc.objects.create(user=self.user, file_path='test_path', fastapi_doc_id=555, size=1)
+        text_cache.invalidate(self.doc.fastapi_doc_id)
+        self.client.force_login(self.user)
+
+    def enqueue(self):
+        self.client.post(reverse('analyze_document', args=[self.doc.id]))
+        return AnalysisJob.objects.get(doc=self.doc)
+
+    def make_due(self, job):
+        AnalysisJob.objects.filter(id=job.id).update(run_after=timezone.now())
+
+    def test_enqueue_is_idempotent(self):
+        """Повторный запуск активного анализа не создаёт вторую задачу"""
+        self.enqueue()
+        self.client.post(reverse('analyze_document', args=[self.doc.id]))
+        self.assertEqual(AnalysisJob.objects.filter(doc=self.doc).count(), 1)
+        self.doc.refresh_from_db()
+        self.assertEqual(self.doc.analysis_status, AnalysisStatus.QUEUED)
+        self.assertIsNotNone(self.doc.analysis_queued_at)
+
+    @patch('mi_django.analysis_queue.backend.get')
+    @patch('mi_django.analysis_queue.backend.put')
+    def test_dispatch_poll_done(self, mock_put, mock_get):
+        """Воркер запускает анализ, опрашивает FastAPI и сохраняет готовый текст"""
+        mock_put.return_value.status_code = 200
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'texts': []}
+        job = self.enqueue()
+
+        self.assertEqual(run_once(), 1)
+        mock_put.assert_called_once()
+        self.doc.refresh_from_db()
+        self.assertEqual(self.doc.analysis_status, AnalysisStatus.RUNNING)
+        # Задача отложена до следующего опроса
+        self.assertEqual(run_once(), 0)
+
+        self.make_due(job)
+        run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisStatus.RUNNING)
+
+        mock_get.return_value.json.return_value = {'texts': [{'text': 'Готово'}]}
+        self.make_due(job)
+        run_once()
+        job.refresh_from_db()
+        self.doc.refresh_from_db()
+        self.assertEqual(job.status, AnalysisStatus.DONE)
+        self.assertEqual(self.doc.analysis_status, AnalysisStatus.DONE)
+        self.assertIsNotNone(self.doc.analysis_finished_at)
+        self.assertEqual(DocText.objects.get(doc=self.doc).texts, [{'text': 'Готово'}])
+
+    @patch('mi_django.analysis_queue.ANALYSIS_MAX_ATTEMPTS', 2)
+    @patch('mi_django.analysis_queue.backend.put')
+    def test_retries_then_fails(self, mock_put):
+        """Ошибки FastAPI повторяются с задержкой, затем задача помечается failed"""
+        mock_put.side_effect = requests.ConnectionError('нет соединения')
+        job = self.enqueue()
+
+        run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisStatus.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now())
+
+        self.make_due(job)
+        run_once()
+        job.refresh_from_db()
+        self.doc.refresh_from_db()
+        self.assertEqual(job.status, AnalysisStatus.FAILED)
+        self.assertIn('нет соединения', job.last_error)
+        self.assertEqual(self.doc.analysis_status, AnalysisStatus.FAILED)
+
+    @patch('mi_django.analysis_queue.backend.get')
+    @patch('mi_django.analysis_queue.backend.put')
+    def test_invalid_poll_response_is_retried(self, mock_put, mock_get):
+        """Ответ опроса не в JSON считается неудачной попыткой, а не роняет воркер"""
+        mock_put.return_value.status_code = 200
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.side_effect = ValueError('Expecting value')
+        job = self.enqueue()
+        run_once()
+
+        self.make_due(job)
+        self.assertEqual(run_once(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisStatus.RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('Неверный ответ FastAPI', job.last_error)
+
+    def test_claimed_job_hidden_from_other_workers(self):
+        """Захваченная задача не выдаётся другому воркеру до конца аренды"""
+        self.enqueue()
+        self.assertEqual(len(claim_jobs()), 1)
+        self.assertEqual(claim_jobs(), [])
+
+    def test_worker_command_once(self):
+        """Команда воркера с --once обрабатывает одну пачку и завершается"""
+        out = io.StringIO()
+        call_command('run_analysis_worker', once=True, stdout=out)
+        self.assertIn('Обработано задач: 0', out.getvalue())
+
+
+class BulkUploadTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        session = self.client.session
+        session['access_token'] = 'access'
+        session['refresh_token'] = 'refresh'
+        session.save()
+
+    def mock_proxy(self, mock_post, fail_names=()):
+        ids = itertools.count(100)
+
+        def post(url, data=None, headers=None, **kwargs):
+            response = requests.Response()
+            response._content = b'{}'
+            response.status_code = 200
+            if url.endswith('/api/upload_doc/'):
+                body = b''.join(iter(lambda: data.read(1024), b''))
+                if any(name.encode() in body for name in fail_names):
+                    response.status_code = 500
+                else:
+                    response._content = f'{{"id": {next(ids)}}}'.encode()
+            return response
+
+        mock_post.side_effect = post
+
+    def post(self, files):
+        return self.client.post(
+            reverse('bulk_upload_documents'), {'documents': files}, HTTP_ACCEPT='application/json'
+        )
+
+    @patch('mi_django.bulk_upload.backend.post')
+    def test_many_files(self, mock_post):
+        """Несколько файлов загружаются одним запросом, повторы отправляются один раз"""
+        self.mock_proxy(mock_post, fail_names=('broken.jpg',))
+        files = [
+            SimpleUploadedFile('a.jpg', b'page a', content_type='image/jpeg'),
+            SimpleUploadedFile('b.jpg', b'page b', content_type='image/jpeg'),
+            SimpleUploadedFile('a_copy.jpg', b'page a', content_type='image/jpeg'),
+            SimpleUploadedFile('broken.jpg', b'page c', content_type='image/jpeg'),
+        ]
+        # Сессия, пользователь, поиск дубликатов и один INSERT (в точке сохранения)
+        with self.assertNumQueries(6):
+            response = self.post(files)
+        data = response.json()
+
+        self.assertEqual([r['status'] for r in data['results']], ['created', 'created', 'reused', 'error'])
+        self.assertEqual(data['summary'], {'total': 4, 'created': 2, 'reused': 1, 'failed': 1})
+        self.assertEqual(mock_post.call_count, 3)
+        docs = Doc.objects.filter(user=self.user)
+        self.assertEqual(docs.count(), 3)
+        a, _, a_copy, _ = data['results']
+        self.assertEqual(Doc.objects.get(id=a['doc_id']).file_path, Doc.objects.get(id=a_copy['doc_id']).file_path)
+        for doc in docs:
+            self.assertTrue(os.path.exists(os.path.join(self.media_root.name, doc.file_path)))
+
+    @patch('mi_django.bulk_upload.backend.post')
+    def test_zip_archive(self, mock_post):
+        """Файлы из zip-архива загружаются как отдельные документы"""
+        self.mock_proxy(mock_post)
+        Doc.objects.create(user=self.user, file_path='cas/old.jpg', size=1, fastapi_doc_id=7,
+                           content_hash=hashlib.sha256(b'old page').hexdigest())
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('scans/1.jpg', b'page 1')
+            zf.writestr('scans/2.jpg', b'page 2')
+            zf.writestr('scans/old.jpg', b'old page')
+            zf.writestr('__MACOSX/scans/._1.jpg', b'junk')
+        upload = SimpleUploadedFile('scans.zip', archive.getvalue(), content_type='application/zip')
+        data = self.post([upload]).json()
+
+        self.assertEqual([r['name'] for r in data['results']], ['1.jpg', '2.jpg', 'old.jpg'])
+        self.assertEqual([r['status'] for r in data['results']], ['created', 'created', 'reused'])
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(Doc.objects.get(id=data['results'][2]['doc_id']).fastapi_doc_id, 7)
+
+    @patch('mi_django.bulk_upload.BULK_UPLOAD_MAX_FILES', 1)
+    def test_too_many_files(self):
+        """Пакет больше BULK_UPLOAD_MAX_FILES отклоняется целиком"""
+        files = [SimpleUploadedFile(f'{i}.jpg', b'x', content_type='image/jpeg') for i in range(2)]
+        response = self.post(files)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Doc.objects.exists())
+
+    @patch('mi_django.bulk_upload.BULK_UPLOAD_MAX_TOTAL_SIZE', 1000)
+    def test_total_size_limit(self):
+        """Архив, который после распаковки больше BULK_UPLOAD_MAX_TOTAL_SIZE, отклоняется до отправки"""
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('1.jpg', b'0' * 600)
+            zf.writestr('2.jpg', b'0' * 600)
+        upload = SimpleUploadedFile('scans.zip', archive.getvalue(), content_type='application/zip')
+        with patch('mi_django.bulk_upload.backend.post') as mock_post:
+            response = self.post([upload])
+        self.assertEqual(response.status_code, 400)
+        mock_post.assert_not_called()
+        self.assertFalse(Doc.objects.exists())
+
+
+def make_jwt(exp, sub='testuser'):
+    def part(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b'=').decode()
+    return f"{part({'alg': 'HS256'})}.{part({'exp': int(exp), 'sub': sub})}.signature"
+
+
+def json_response(status_code, data, url='http://proxy/', headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(data).encode()
+    response.request = requests.Request('GET', url, headers=headers).prepare()
+    return response
+
+
+class TokenManagerTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        self.fresh_token = make_jwt(time.time() + 3600)
+        self.sent = []
+        patcher = patch('mi_django.http_client.BackendClient.session', new_callable=PropertyMock)
+        self.http = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.http.request.side_effect = self.fake_request
+
+    def fake_request(self, method, url, headers=None, data=None, **kwargs):
+        """Прокси-сервер: выдаёт новый токен и принимает загрузки только с ним."""
+        if url.endswith('/api/token/refresh/'):
+            time.sleep(0.05)
+            self.sent.append(('refresh', None))
+            return json_response(200, {'access': self.fresh_token})
+        authorization = (headers or {}).get('Authorization')
+        if hasattr(data, 'read'):
+            data.read(-1)
+        self.sent.append((url.rsplit('/', 2)[-2], authorization))
+        if authorization != f'Bearer {self.fresh_token}':
+            return json_response(401, {'detail': 'Token is invalid or expired'}, url, headers)
+        return json_response(200, {'id': 1, 'texts': [{'text': 'Текст'}]}, url, headers)
+
+    def set_tokens(self, access_token):
+        session = self.client.session
+        session['access_token'] = access_token
+        session['refresh_token'] = 'refresh'
+        session.save()
+
+    def test_token_expiry(self):
+        """exp читается из JWT, у непрозрачного токена срока нет"""
+        self.assertEqual(token_expiry(make_jwt(1700000000)), 1700000000)
+        self.assertIsNone(token_expiry('opaque-token'))
+
+    def test_upload_refreshes_before_sending(self):
+        """Истекающий токен обновляется до загрузки: файл отправляется один раз"""
+        self.set_tokens(make_jwt(time.time() + 10))
+        test_image = SimpleUploadedFile("scan.jpg", b"file_content", content_type="image/jpeg")
+        response = self.client.post(reverse('upload_document'), {'document': test_image})
+
+        self.assertRedirects(response, reverse('index'), fetch_redirect_response=False)
+        self.assertEqual(self.sent, [('refresh', None), ('upload_doc', f'Bearer {self.fresh_token}')])
+        self.assertEqual(self.client.session['access_token'], self.fresh_token)
+
+    def test_rejected_small_request_is_replayed(self):
+        """Запрос без тела после 401 повторяется с новым токеном"""
+        self.set_tokens(make_jwt(time.time() + 3600, sub='revoked'))
+        doc = Doc.objects.create(user=self.user, file_path='test_path', fastapi_doc_id=321, size=1)
+        text_cache.invalidate(doc.fastapi_doc_id)
+        response = self.client.get(reverse('get_document_text', args=[doc.id]))
+
+        self.assertContains(response, 'Текст')
+        self.assertEqual([kind for kind, _ in self.sent], ['get_text', 'refresh', 'get_text'])
+
+    def test_concurrent_refreshes_coalesced(self):
+        """Одновременные обновления одной сессии выполняются один раз"""
+        expiring = make_jwt(time.time() + 10)
+        sessions = [{'access_token': expiring, 'refresh_token': 'refresh'} for _ in range(8)]
+        tokens = []
+        threads = [threading.Thread(target=lambda s=s: tokens.append(token_manager.access_token(s)))
+                   for s in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(tokens, [self.fresh_token] * 8)
+        self.assertEqual(self.sent, [('refresh', None)])
+
+    @patch.object(token_manager, 'lock_timeout', 0.1)
+    def test_foreign_lock_not_released(self):
+        """Не дождавшись чужого обновления, процесс обновляет сам, но блокировку владельца не снимает"""
+        lock_key = f"jwt-refresh:lock:{hashlib.sha256(b'refresh').hexdigest()[:32]}"
+        cache.add(lock_key, 1, 60)
+        session = {'access_token': make_jwt(time.time() + 10), 'refresh_token': 'refresh'}
+
+        self.assertEqual(token_manager.access_token(session), self.fresh_token)
+        self.assertEqual(self.sent, [('refresh', None)])
+        self.assertEqual(cache.get(lock_key), 1)
+
+
+class PriceTableTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        price_table.invalidate()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.doc = Doc.objects.create(user=self.user, file_path='cas/aa/bb/scan.jpg', size=10)
+        self.client.force_login(self.user)
+        Price.objects.create(file_type='jpg', price=2.5)
+
+    def test_order_page_does_not_query_prices(self):
+        """Страница заказа берёт цену из памяти процесса"""
+        url = reverse('order_analysis', args=[self.doc.id])
+        self.client.get(url)
+        # Сессия, пользователь, документ, проверка оплаты — запроса к price нет
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.context['order_price'], 25.0)
+
+    def test_price_change_invalidates(self):
+        """Изменение цены видно сразу в этом процессе и после сверки версии — в других"""
+        other_process = PriceTable(check_interval=0)
+        self.assertEqual(other_process.get('jpg'), 2.5)
+        with self.captureOnCommitCallbacks(execute=True):
+            Price.objects.filter(file_type='jpg').get().delete()
+            Price.objects.create(file_type='jpg', price=3.0)
+        self.assertEqual(price_table.get('jpg'), 3.0)
+        self.assertEqual(other_process.get('jpg'), 3.0)
+        self.assertEqual(other_process.loads, 2)
+
+    def test_default_price(self):
+        """Для неизвестного расширения используется цена по умолчанию"""
+        self.assertEqual(price_table.price_for('scan.tiff'), (1.0, True))
+        self.assertEqual(price_table.price_for('scan.JPG'), (2.5, False))
+
+
+class BatchQuoteTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        price_table.invalidate()
+        Price.objects.create(file_type='jpg', price=2.0)
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+
+    def make_docs(self, count):
+        return Doc.objects.bulk_create(
+            Doc(user=self.user, file_path=f'cas/{i}.jpg', size=10) for i in range(count)
+        )
+
+    def order(self, docs):
+        return self.client.post(
+            reverse('batch_order'), {'doc_ids': [doc.id for doc in docs]}, HTTP_ACCEPT='application/json'
+        )
+
+    def test_quote(self):
+        """Расчёт по нескольким документам; чужие документы не учитываются"""
+        docs = self.make_docs(2)
+        other = User.objects.create_user(username='other', password='otherpassword')
+        foreign = Doc.objects.create(user=other, file_path='x.jpg', size=10)
+        ids = f'{docs[0].id},{docs[1].id},{foreign.id}'
+        data = self.client.get(reverse('batch_quote'), {'doc_ids': ids}, HTTP_ACCEPT='application/json').json()
+
+        self.assertEqual([item['doc_id'] for item in data['items']], [docs[0].id, docs[1].id])
+        self.assertEqual(data['total'], 40.0)
+        self.assertEqual(data['missing'], [foreign.id])
+
+    def test_order_creates_and_updates_carts(self):
+        """Заказ создаёт недостающие строки корзины, дооплачивает неоплаченные и не трогает оплаченные"""
+        new, unpaid, paid = self.make_docs(3)
+        Cart.objects.create(user=self.user, doc=unpaid, order_price=1, payment=False)
+        Cart.objects.create(user=self.user, doc=paid, order_price=1, payment=True)
+        data = self.order([new, unpaid, paid]).json()
+
+        self.assertEqual(data['already_paid'], [paid.id])
+        self.assertEqual(data['charged'], 40.0)
+        self.assertEqual(Cart.objects.filter(user=self.user, payment=True).count(), 3)
+        self.assertEqual(Cart.objects.get(doc=unpaid).order_price, 20.0)
+        self.assertEqual(Cart.objects.get(doc=paid).order_price, 1)
+
+    def test_parallel_paid_row_not_charged_twice(self):
+        """Строку, которую параллельный заказ вставил и оплатил, заказ не перезаписывает и не учитывает"""
+        new, parallel = self.make_docs(2)
+        bulk_create = Cart.objects.bulk_create
+
+        def insert_parallel_first(objs, **kwargs):
+            Cart.objects.create(user=self.user, doc=parallel, order_price=5, payment=True)
+            return bulk_create(objs, **kwargs)
+
+        with patch.object(Cart.objects, 'bulk_create', side_effect=insert_parallel_first):
+            data = self.order([new, parallel]).json()
+
+        self.assertEqual(data['already_paid'], [parallel.id])
+        self.assertEqual(data['charged'], 20.0)
+        self.assertEqual(Cart.objects.get(doc=parallel).order_price, 5)
+        self.assertTrue(Cart.objects.get(doc=new).payment)
+
+    def test_query_count_does_not_grow(self):
+        """Число запросов не зависит от размера пакета"""
+        price_table.prices()
+        for count in (2, 200):
+            docs = self.make_docs(count)
+            Cart.objects.bulk_create(Cart(user=self.user, doc=doc, order_price=1) for doc in docs[::2])
+            # Сессия, пользователь, документы, bulk_create, корзина (с блокировкой), bulk_update, точка сохранения
+            with self.assertNumQueries(8):
+                response = self.order(docs)
+            self.assertEqual(len(response.json()['items']), count)
+
+
+class CartPagesTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+
+    def make_cart(self, count):
+        docs = Doc.objects.bulk_create(
+            Doc(user=self.user, file_path=f'cas/{i}.jpg', size=10) for i in range(count)
+        )
+        return Cart.objects.bulk_create(
+            Cart(user=self.user, doc=doc, order_price=2, payment=i % 2 == 0) for i, doc in enumerate(docs)
+        )
+
+    def test_cart_list_query_count(self):
+        """Число запросов страницы корзины не зависит от числа строк"""
+        for count in (1, 1000):
+            Cart.objects.all().delete()
+            self.make_cart(count)
+            # Сессия, пользователь, строки корзины с документами, итоги
+            with self.assertNumQueries(4):
+                response = self.client.get(reverse('cart_list'))
+            totals = response.context['totals']
+            self.assertEqual(totals['count'], count)
+            self.assertEqual(totals['paid'], (count + 1) // 2)
+            self.assertEqual(totals['unpaid'], count // 2)
+            self.assertEqual(totals['total'], 2.0 * count)
+
+    def test_cart_detail_query_count(self):
+        """Детали заказа и документ читаются одним запросом"""
+        cart, = self.make_cart(1)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('cart_detail', args=[cart.id]))
+        self.assertContains(response, 'cas/0.jpg')
+
+
+class RequestMetricsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        sample_rate = request_metrics.sample_rate
+        self.addCleanup(setattr, request_metrics, 'sample_rate', sample_rate)
+        request_metrics.sample_rate = 1
+        request_metrics.reset()
+        self.addCleanup(request_metrics.reset)
+
+    def test_view_queries_and_size(self):
+        """Замеряются время, запросы к БД и размер ответа представления"""
+        Doc.objects.create(user=self.user, file_path='cas/a.jpg', size=10)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(request_metrics.requests.value('index', '200'), 1)
+        self.assertEqual(request_metrics.duration.count('index'), 1)
+        series = request_metrics.db_queries._series['index']
+        # Сессия, пользователь, страница документов и подсчёт
+        self.assertGreaterEqual(series[1], 3)
+        self.assertEqual(request_metrics.response_size._series['index'][1], len(response.content))
+        self.assertEqual(request_metrics.backend_requests._series['index'][1], 0)
+
+    def test_backend_requests_counted(self):
+        """Обращения к FastAPI через http_client попадают в метрики представления"""
+        doc = Doc.objects.create(user=self.user, file_path='cas/a.jpg', size=10, fastapi_doc_id=987654)
+        with patch('mi_django.http_client.BackendClient.session', new_callable=PropertyMock) as session:
+            session.return_value.request.return_value = json_response(200, {'texts': [{'text': 'Текст'}]})
+            self.client.get(reverse('get_document_text', args=[doc.id]))
+        self.addCleanup(text_cache.invalidate, 987654)
+        self.assertEqual(request_metrics.backend_requests._series['get_document_text'][1], 1)
+
+    def test_sampling(self):
+        """Без выборки гистограммы не пополняются, а счётчик запросов — да"""
+        request_metrics.sample_rate = 0
+        with patch('mi_django.metrics._record_query') as record_query:
+            self.client.get(reverse('index'))
+        record_query.assert_not_called()
+        self.assertEqual(request_metrics.requests.value('index', '200'), 1)
+        self.assertEqual(request_metrics.duration.count('index'), 0)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_prometheus_endpoint(self):
+        """Метрики в формате Prometheus доступны сотрудникам и сборщику с токеном"""
+        self.client.get(reverse('index'))
+        self.assertEqual(self.client.get(reverse('prometheus_metrics')).status_code, 403)
+
+        self.client.logout()
+        response = self.client.get(reverse('prometheus_metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE django_view_duration_seconds histogram', body)
+        self.assertIn('django_view_duration_seconds_bucket{view="index",le="+Inf"} 1', body)
+        self.assertIn('django_view_requests_total{view="index",status="200"} 1', body)
+        self.assertEqual(
+            self.client.get(reverse('prometheus_metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403
+        )
+
+
+class QueueLoggingTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'app.log')
+        self.logger = logging.getLogger('mi_django.tests.queue_logging')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.addCleanup(setattr, self.logger, 'propagate', True)
+
+    def make_handler(self, **kwargs):
+        handler = QueueListenerHandler(filename=self.path, console=False, **kwargs)
+        self.logger.addHandler(handler)
+        self.addCleanup(handler.close)
+        self.addCleanup(self.logger.removeHandler, handler)
+        return handler
+
+    def read_records(self):
+        with open(self.path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_json_lines(self):
+        """Записи пишутся в файл строками JSON с полями extra и трассировкой"""
+        handler = self.make_handler()
+        self.logger.info("Документ %s загружен", 5, extra={'doc_id': 5})
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            self.logger.exception("Ошибка")
+        handler.flush()
+        first, second = self.read_records()
+        self.assertEqual(first['message'], "Документ 5 загружен")
+        self.assertEqual(first['level'], 'INFO')
+        self.assertEqual(first['doc_id'], 5)
+        self.assertIn('ZeroDivisionError', second['exc_info'])
+
+    def test_formatting_off_request_thread(self):
+        """Сообщение форматируется в потоке записи, а не в вызывающем"""
+        handler = self.make_handler()
+        threads = []
+
+        class Value:
+            def __str__(self):
+                threads.append(threading.current_thread())
+                return 'значение'
+
+        self.logger.info("Аргумент %s", Value())
+        handler.flush()
+        self.assertEqual(self.read_records()[0]['message'], "Аргумент значение")
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_full_queue_drops(self):
+        """При переполненной очереди записи отбрасываются без ожидания"""
+        handler = self.make_handler(queue_size=1)
+        handler.listener.stop()
+        for i in range(5):
+            self.logger.info("Запись %s", i)
+        self.assertEqual(handler.dropped, 4)
+
+    def test_rotation(self):
+        """Файл ротируется по размеру, хранится не больше backup_count старых файлов"""
+        handler = self.make_handler(max_bytes=1024, backup_count=2)
+        for i in range(100):
+            self.logger.info("Запись %s", i)
+        handler.flush()
+        self.assertTrue(os.path.exists(f'{self.path}.1'))
+        self.assertTrue(os.path.exists(f'{self.path}.2'))
+        self.assertFalse(os.path.exists(f'{self.path}.3'))
+
+
+class MediaDeliveryTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media_root.name, 'cas', 'ab'))
+        with open(os.path.join(self.media_root.name, 'cas', 'ab', 'scan.jpg'), 'wb') as f:
+            f.write(b'jpeg-bytes')
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        self.url = reverse('media', args=['cas/ab/scan.jpg'])
+
+    def test_django_streams_file(self):
+        """В режиме разработки файл отдаёт Django"""
+        with patch('mi_django.media_delivery.MEDIA_DELIVERY', 'django'):
+            response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), b'jpeg-bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_x_accel_redirect(self):
+        """Для nginx ответ без тела с внутренним адресом файла"""
+        with patch('mi_django.media_delivery.MEDIA_DELIVERY', 'x-accel'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/cas/ab/scan.jpg')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response.content, b'')
+
+    def test_x_sendfile(self):
+        """Для Apache/lighttpd — абсолютный путь в X-Sendfile"""
+        with patch('mi_django.media_delivery.MEDIA_DELIVERY', 'x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root.name, 'cas', 'ab', 'scan.jpg'))
+
+    def test_missing_and_outside_media_root(self):
+        """Несуществующий файл и путь за пределами MEDIA_ROOT — 404"""
+        self.assertEqual(self.client.get(reverse('media', args=['cas/ab/none.jpg'])).status_code, 404)
+        self.assertEqual(self.client.get('/media/..%2F..%2Fetc/passwd').status_code, 404)
+
+    def test_login_required(self):
+        """Файлы пользователей доступны только после входа"""
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+
+class FragmentCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        fragment_cache.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        self.doc = Doc.objects.create(user=self.user, file_path='cas/first.jpg', size=10)
+
+    def doc_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        tables = (f'"{Doc._meta.db_table}"', f'"{Cart._meta.db_table}"')
+        return response, [q['sql'] for q in queries if any(table in q['sql'] for table in tables)]
+
+    def test_repeat_visit_hits_cache(self):
+        """Повторный визит берёт сетку документов из кэша без запросов к Doc"""
+        response, queries = self.doc_queries(reverse('index'))
+        self.assertTrue(queries)
+        response, queries = self.doc_queries(reverse('index'))
+        self.assertEqual(queries, [])
+        self.assertContains(response, 'cas/first.jpg')
+        stats = fragment_cache.stats()['fragments']['index_docs']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_doc_save_and_delete_invalidate(self):
+        """Создание и удаление документа сбрасывают сетку его владельца"""
+        self.client.get(reverse('index'))
+        Doc.objects.create(user=self.user, file_path='cas/second.jpg', size=10)
+        self.assertContains(self.client.get(reverse('index')), 'cas/second.jpg')
+        self.doc.delete()
+        self.assertNotContains(self.client.get(reverse('index')), 'cas/first.jpg')
+
+    def test_other_users_changes_keep_cache(self):
+        """Изменения другого пользователя не сбрасывают чужие фрагменты"""
+        self.client.get(reverse('index'))
+        other = User.objects.create_user(username='other', password='otherpassword')
+        Doc.objects.create(user=other, file_path='cas/other.jpg', size=10)
+        _, queries = self.doc_queries(reverse('index'))
+        self.assertEqual(queries, [])
+
+    def test_queryset_update_paths_invalidate(self):
+        """Изменения без сигналов (очередь анализа, пакетный заказ) тоже сбрасывают фрагменты"""
+        self.assertNotContains(self.client.get(reverse('index')), 'Анализ:')
+        self.assertContains(self.client.get(reverse('cart_list')), 'Ваша корзина пуста')
+        with patch('mi_django.analysis_queue.forget_texts'):
+            enqueue_analysis(self.doc)
+        self.assertContains(self.client.get(reverse('index')), 'Анализ:')
+        order_documents(self.user, [self.doc.id])
+        self.assertContains(self.client.get(reverse('cart_list')), 'Статус оплаты: Оплачено')
+
+    def test_cart_payment_invalidates_cart_list(self):
+        """Оплата заказа обновляет список корзины"""
+        cart = Cart.objects.create(user=self.user, doc=self.doc, order_price=5)
+        self.assertContains(self.client.get(reverse('cart_list')), 'Не оплачено')
+        self.client.post(reverse('make_payment', args=[cart.id]))
+        response = self.client.get(reverse('cart_list'))
+        self.assertContains(response, 'Статус оплаты: Оплачено')
+
+    def test_cached_csrf_token_accepted(self):
+        """Токен CSRF из закэшированной сетки принимается при отправке формы"""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        client.get(reverse('index'))
+        html = client.get(reverse('index')).content.decode()
+        self.assertEqual(fragment_cache.stats()['hits'], 1)
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', html).group(1)
+        with patch('mi_django.views.delete_doc', return_value=(False, False)):
+            response = client.post(reverse('delete_document', args=[self.doc.id]), {'csrfmiddlewaretoken': token})
+        self.assertNotEqual(response.status_code, 403)
+
+    def test_new_csrf_secret_renders_again(self):
+        """Другой секрет CSRF (новый вход) не получает чужие токены из кэша"""
+        self.client.get(reverse('index'))
+        client = Client()
+        client.force_login(self.user)
+        _, queries = self.doc_queries(reverse('index'))
+        self.assertEqual(queries, [])
+        client.get(reverse('index'))
+        self.assertEqual(fragment_cache.stats()['misses'], 2)
+
+    def test_stats_endpoint(self):
+        """Статистика кэша фрагментов доступна сотрудникам и в метриках Prometheus"""
+        self.client.get(reverse('index'))
+        self.assertEqual(self.client.get(reverse('fragment_cache_stats')).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('fragment_cache_stats')).json()['misses'], 1)
+        self.assertContains(self.client.get(reverse('prometheus_metrics')),
+                            'django_fragment_cache_lookups_total{fragment="index_docs",result="miss"} 1')
+
+
+class SessionStoreTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_sessions.clear()
+
+    def make_session(self, **data):
+        session = SessionStore()
+        session.update(data)
+        session.save()
+        return session.session_key
+
+    def test_read_from_process_memory(self):
+        """Повторное чтение сессии не обращается ни к БД, ни к кэшу"""
+        key = self.make_session(access_token='a', refresh_token='r')
+        with self.assertNumQueries(0), patch.object(cache, 'get') as cache_get:
+            self.assertEqual(SessionStore(key)['access_token'], 'a')
+        cache_get.assert_not_called()
+        self.assertEqual(local_sessions.stats()['hits'], 1)
+
+    def test_fallback_to_cache_and_db(self):
+        """Без копии в памяти сессия читается из кэша, без кэша — из БД"""
+        key = self.make_session(access_token='a')
+        local_sessions.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(SessionStore(key)['access_token'], 'a')
+        local_sessions.clear()
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(SessionStore(key)['access_token'], 'a')
+
+    def test_unsaved_changes_not_shared(self):
+        """Несохранённые изменения одного запроса не видны следующему"""
+        key = self.make_session(tokens=['a'])
+        session = SessionStore(key)
+        session['tokens'].append('b')
+        self.assertEqual(SessionStore(key)['tokens'], ['a'])
+
+    def test_save_and_delete_update_local_copy(self):
+        """Обновление токена и выход сразу видны в этом процессе"""
+        key = self.make_session(access_token='old')
+        session = SessionStore(key)
+        session['access_token'] = 'new'
+        session.save()
+        self.assertEqual(SessionStore(key)['access_token'], 'new')
+        session.flush()
+        self.assertNotIn('access_token', SessionStore(key))
+
+    def test_local_copy_expires(self):
+        """Запись другого процесса видна после SESSION_LOCAL_TTL"""
+        key = self.make_session(access_token='old')
+        cache.clear()
+        Session = SessionStore.get_model_class()
+        Session.objects.filter(session_key=key).update(
+            session_data=SessionStore().encode({'access_token': 'other-worker'})
+        )
+        self.assertEqual(SessionStore(key)['access_token'], 'old')
+        with patch('mi_django.sessions.time.monotonic', return_value=time.monotonic() + 60):
+            self.assertEqual(SessionStore(key)['access_token'], 'other-worker')
+
+    @override_settings(SESSION_ENGINE='mi_django.sessions')
+    def test_prune_sessions(self):
+        """Команда удаляет только истёкшие сессии, пачками"""
+        Session = SessionStore.get_model_class()
+        expired = timezone.now() - timedelta(days=1)
+        for i in range(5):
+            Session.objects.create(session_key=f'expired{i}', session_data='', expire_date=expired)
+        live = self.make_session(access_token='a')
+        out = io.StringIO()
+        call_command('prune_sessions', '--batch-size', '2', stdout=out)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [live])
+        self.assertIn('Удалено 4 сессий', out.getvalue())
+        self.assertIn('удалено 5 истёкших сессий', out.getvalue())
+
+
+def proxy_response(status_code, body):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode()
+    return response
+
+
+@patch('mi_django.views.backend.post')
+class LoginFastPathTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        last_logins.flush()
+        login_users.hits = login_users.misses = 0
+        self.tokens = proxy_response(200, {'access': 'access', 'refresh': 'refresh'})
+
+    def login(self, username='storm', password='secret'):
+        return self.client.post(reverse('login'), {'username': username, 'password': password})
+
+    def test_repeat_login_skips_user_table(self, mock_post):
+        """Повторный вход не читает и не пишет auth_user"""
+        mock_post.return_value = self.tokens
+        self.assertRedirects(self.login(), reverse('index'), fetch_redirect_response=False)
+        user = User.objects.get(username='storm')
+        self.client.logout()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertRedirects(self.login(), reverse('index'), fetch_redirect_response=False)
+        self.assertFalse([q['sql'] for q in queries if 'auth_user' in q['sql']])
+        self.assertEqual(login_users.stats()['hits'], 1)
+        self.assertEqual(int(self.client.session['_auth_user_id']), user.id)
+        self.assertEqual(self.client.session['access_token'], 'access')
+
+    def test_last_login_written_in_batches(self, mock_post):
+        """last_login копится и записывается одним UPDATE для всех вошедших"""
+        mock_post.return_value = self.tokens
+        for username in ('first', 'second', 'third'):
+            self.login(username)
+        self.assertFalse(User.objects.filter(last_login__isnull=False).exists())
+        self.assertEqual(last_logins.pending(), 3)
+        with self.assertNumQueries(1):
+            last_logins.flush()
+        self.assertEqual(User.objects.filter(last_login__isnull=False).count(), 3)
+
+    def test_rejected_password_cached(self, mock_post):
+        """Отклонённая пара имя/пароль не отправляется на прокси-сервер повторно"""
+        mock_post.return_value = proxy_response(401, {'detail': 'invalid'})
+        self.login(password='wrong')
+        response = self.login(password='wrong')
+        self.assertContains(response, 'Проверьте имя пользователя и пароль')
+        self.assertEqual(mock_post.call_count, 1)
+        mock_post.return_value = self.tokens
+        self.assertRedirects(self.login(password='right'), reverse('index'), fetch_redirect_response=False)
+        self.assertEqual(mock_post.call_count, 2)
+
+    def test_rate_limit(self, mock_post):
+        """Сверх лимита попыток на имя прокси-сервер не вызывается, ответ 429"""
+        mock_post.return_value = self.tokens
+        with patch.object(login_rate_limit, 'limit', (2, 60)):
+            self.login()
+            self.login()
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertRedirects(self.login('other'), reverse('index'), fetch_redirect_response=False)
+
+    def test_rename_invalidates_cache(self, mock_post):
+        """После переименования прежнее имя не ведёт к тому же пользователю"""
+        mock_post.return_value = self.tokens
+        self.login()
+        user = User.objects.get(username='storm')
+        user.username = 'renamed'
+        user.save()
+        self.client.logout()
+        self.login()
+        self.assertNotEqual(int(self.client.session['_auth_user_id']), user.id)
+
+
+class FaultyBackendHandler(BaseHTTPRequestHandler):
+    """Заглушка сервиса с внесением отказов: mode — ok, 503, slow или drop (обрыв соединения)."""
+    protocol_version = 'HTTP/1.1'
+    mode = 'ok'
+    hits = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        if self.mode == 'drop':
+            self.close_connection = True
+            return
+        if self.mode == 'slow':
+            time.sleep(1)
+        status = 503 if self.mode == '503' else 200
+        body = b'{"texts": []}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CircuitBreakerTestCase(TestCase):
+    def setUp(self):
+        FaultyBackendHandler.mode = 'ok'
+        FaultyBackendHandler.hits = 0
+        self.server = start_stub_backend(FaultyBackendHandler)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.host = f"127.0.0.1:{self.server.server_port}"
+        self.url = f"http://{self.host}/get_text/1"
+        self.breakers = CircuitBreakers(failure_threshold=3, recovery_timeout=0.2)
+        self.client_ = BackendClient(retries=0, timeout=(1, 5), breakers=self.breakers)
+
+    def open_circuit(self):
+        FaultyBackendHandler.mode = '503'
+        for _ in range(3):
+            self.assertEqual(self.client_.get(self.url).status_code, 503)
+
+    def test_opens_after_threshold(self):
+        """После порога неудач обращения к хосту завершаются сразу, без сети"""
+        self.open_circuit()
+        with self.assertRaises(CircuitOpen):
+            self.client_.get(self.url)
+        self.assertEqual(FaultyBackendHandler.hits, 3)
+        self.assertEqual(self.breakers.stats()[self.host]['state'], 'open')
+        self.assertEqual(self.breakers.rejected.value(self.host, 'open'), 1)
+        self.assertEqual(self.breakers.opened.value(self.host), 1)
+
+    def test_connection_errors_count(self):
+        """Обрыв соединения — неудача; успех сбрасывает счётчик неудач"""
+        FaultyBackendHandler.mode = 'drop'
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectionError):
+                self.client_.get(self.url)
+        FaultyBackendHandler.mode = 'ok'
+        self.client_.get(self.url)
+        self.assertEqual(self.breakers.stats()[self.host], {'state': 'closed', 'failures': 0})
+
+    def test_half_open_probe(self):
+        """После паузы пробный запрос замыкает автомат при успехе и размыкает при неудаче"""
+        self.open_circuit()
+        time.sleep(0.25)
+        FaultyBackendHandler.mode = 'ok'
+        self.assertEqual(self.client_.get(self.url).status_code, 200)
+        self.assertEqual(self.breakers.stats()[self.host]['state'], 'closed')
+
+        self.open_circuit()
+        time.sleep(0.25)
+        self.assertEqual(self.client_.get(self.url).status_code, 503)
+        self.assertEqual(self.breakers.stats()[self.host]['state'], 'open')
+        hits = FaultyBackendHandler.hits
+        with self.assertRaises(CircuitOpen):
+            self.client_.get(self.url)
+        self.assertEqual(FaultyBackendHandler.hits, hits)
+
+    def test_half_open_allows_single_probe(self):
+        """В полуоткрытом состоянии пропускается только один запрос"""
+        breaker = self.breakers.get(self.host)
+        for _ in range(3):
+            breaker.record(False)
+        time.sleep(0.25)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record(None)
+        self.assertTrue(breaker.allow())
+
+    def test_budget_caps_timeout(self):
+        """Таймаут обращения урезается до остатка бюджета, исчерпанный бюджет отклоняет без сети"""
+        FaultyBackendHandler.mode = 'slow'
+        token = circuit._budget.set(Budget(0.3))
+        self.addCleanup(circuit._budget.reset, token)
+        started = time.monotonic()
+        # С retries=0 urllib3 оборачивает таймаут чтения в MaxRetryError, и requests даёт ConnectionError
+        with self.assertRaises(requests.RequestException):
+            self.client_.get(self.url)
+        self.assertLess(time.monotonic() - started, 0.9)
+
+        time.sleep(0.1)
+        with self.assertRaises(BudgetExceeded):
+            self.client_.get(self.url)
+        self.assertEqual(FaultyBackendHandler.hits, 1)
+        self.assertEqual(self.breakers.rejected.value(self.host, 'budget'), 1)
+
+    def test_budget_per_view(self):
+        """Бюджет представления берётся по имени маршрута"""
+        with patch.dict(circuit.BACKEND_LATENCY_BUDGETS, {'upload_document': 60}), \
+                patch.object(circuit, 'BACKEND_LATENCY_BUDGET', 5):
+            self.assertEqual(circuit.budget_for('upload_document'), 60)
+            self.assertEqual(circuit.budget_for('get_document_text'), 5)
+
+
+class CircuitBreakerViewsTestCase(TestCase):
+    def setUp(self):
+        circuit_breakers.reset()
+        self.addCleanup(circuit_breakers.reset)
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+
+    def test_view_fails_fast(self):
+        """При разомкнутом автомате FastAPI представление отвечает ошибкой без обращения к сервису"""
+        doc = Doc.objects.create(user=self.user, file_path='cas/a.jpg', size=10, fastapi_doc_id=987655)
+        breaker = circuit_breakers.get(circuit.host_of(FASTAPI_BASE_URL))
+        for _ in range(breaker.failure_threshold):
+            circuit_breakers.record(breaker, False)
+
+        with patch('mi_django.http_client.BackendClient.session', new_callable=PropertyMock) as session:
+            response = self.client.get(reverse('get_document_text', args=[doc.id]))
+        session.return_value.request.assert_not_called()
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('недоступен', response.content.decode())
+
+    def test_metrics(self):
+        """Состояние автоматов есть в метриках Prometheus и в JSON для сотрудников"""
+        breaker = circuit_breakers.get('web:8000')
+        for _ in range(breaker.failure_threshold):
+            circuit_breakers.record(breaker, False)
+        self.user.is_staff = True
+        self.user.save()
+
+        body = self.client.get(reverse('prometheus_metrics')).content.decode()
+        self.assertIn('backend_circuit_state{host="web:8000"} 2', body)
+        self.assertIn('backend_circuit_opened_total{host="web:8000"} 1', body)
+        stats = self.client.get(reverse('backend_circuit_stats')).json()
+        self.assertEqual(stats['web:8000']['state'], 'open')
+
+
+class BulkDeletionTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media_root.name, 'cas'))
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.other = User.objects.create_user(username='other', password='testpassword')
+        self.client.force_login(self.user)
+
+    def make_doc(self, name, fastapi_doc_id, user=None):
+        file_path = f'cas/{name}.jpg'
+        thumbnail = f'cas/{name}_small.webp'
+        for path in (file_path, thumbnail):
+            with open(os.path.join(self.media_root.name, path), 'wb') as f:
+                f.write(b'scan')
+        return Doc.objects.create(user=user or self.user, file_path=file_path, size=1,
+                                  fastapi_doc_id=fastapi_doc_id, thumbnails={'small': thumbnail})
+
+    def exists(self, doc):
+        return os.path.exists(os.path.join(self.media_root.name, doc.file_path))
+
+    def outbox(self):
+        return set(BackendDeletion.objects.values_list('fastapi_doc_id', flat=True))
+
+    def test_delete_selected(self):
+        """Выбранные документы удаляются, их документы FastAPI попадают в outbox"""
+        first, second, kept = self.make_doc('a', 1), self.make_doc('b', 2), self.make_doc('c', 3)
+        foreign = self.make_doc('d', 4, user=self.other)
+        response = self.client.post(reverse('delete_documents'),
+                                    {'doc_ids': [first.id, second.id, foreign.id]})
+        self.assertRedirects(response, reverse('index'))
+        self.assertEqual(set(Doc.objects.values_list('id', flat=True)), {kept.id, foreign.id})
+        self.assertFalse(self.exists(first))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root.name, first.thumbnails['small'])))
+        self.assertTrue(self.exists(kept))
+        self.assertTrue(self.exists(foreign))
+        self.assertEqual(self.outbox(), {1, 2})
+
+    def test_delete_all_in_batches(self):
+        """Удаление всех документов идёт пачками, чужие документы не затрагиваются"""
+        docs = [self.make_doc(str(i), 100 + i) for i in range(5)]
+        self.make_doc('foreign', 200, user=self.other)
+        with patch.object(deletions, 'DELETION_BATCH_SIZE', 2), \
+                CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('delete_documents'), {'all': '1'})
+        self.assertFalse(Doc.objects.filter(user=self.user).exists())
+        self.assertTrue(Doc.objects.filter(user=self.other).exists())
+        self.assertFalse(any(self.exists(doc) for doc in docs))
+        self.assertEqual(self.outbox(), {100, 101, 102, 103, 104})
+        # По одному DELETE документов на пачку из двух строк
+        doc_deletes = [q for q in queries.captured_queries
+                       if q['sql'].startswith(f'DELETE FROM "{Doc._meta.db_table}"')]
+        self.assertEqual(len(doc_deletes), 3)
+
+    def test_delete_without_per_row_signals(self):
+        """Документы и строки корзины удаляются без сигналов: кэш фрагментов сбрасывается раз на пользователя"""
+        docs = [self.make_doc(str(i), 300 + i) for i in range(4)]
+        for doc in docs:
+            Cart.objects.create(user=self.user, doc=doc, order_price=1, payment=True)
+        Cart.objects.create(user=self.other, doc=docs[0], order_price=1, payment=False)
+        with patch.object(fragment_cache, 'bump') as mock_bump, self.captureOnCommitCallbacks(execute=True):
+            deletions.delete_documents(self.user)
+        self.assertFalse(Doc.objects.filter(user=self.user).exists())
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(sorted(call.args[0] for call in mock_bump.call_args_list),
+                         sorted([self.user.id, self.other.id]))
+
+    def test_shared_references_kept(self):
+        """Файл и документ FastAPI, на которые ссылается чужой документ, не удаляются"""
+        doc = self.make_doc('shared', 7)
+        shared = Doc.objects.create(user=self.other, file_path=doc.file_path, size=1, fastapi_doc_id=7)
+        self.client.post(reverse('delete_documents'), {'all': '1'})
+        self.assertTrue(self.exists(shared))
+        self.assertEqual(self.outbox(), set())
+
+    def test_nothing_selected(self):
+        """Без выбранных документов ничего не удаляется"""
+        self.make_doc('a', 1)
+        response = self.client.post(reverse('delete_documents'))
+        self.assertRedirects(response, reverse('index'))
+        self.assertEqual(Doc.objects.count(), 1)
+
+    def test_worker_retries_failures(self):
+        """Воркер удаляет записи после ответа FastAPI и откладывает неудачные"""
+        for fastapi_doc_id in (1, 2, 3):
+            BackendDeletion.objects.create(fastapi_doc_id=fastapi_doc_id, run_after=timezone.now())
+
+        def delete(url, **kwargs):
+            if url.endswith('/doc_delete/2'):
+                raise requests.ConnectionError("нет соединения")
+            return proxy_response(404 if url.endswith('/3') else 200, {})
+
+        with patch('mi_django.deletions.backend.delete', side_effect=delete):
+            self.assertEqual(deletions.run_once(), 3)
+            entry = BackendDeletion.objects.get()
+            self.assertEqual(entry.fastapi_doc_id, 2)
+            self.assertEqual(entry.attempts, 1)
+            self.assertGreater(entry.run_after, timezone.now())
+            # Отложенная запись не берётся до срока
+            self.assertEqual(deletions.run_once(), 0)
+
+        BackendDeletion.objects.update(run_after=timezone.now())
+        with patch('mi_django.deletions.backend.delete', return_value=proxy_response(204, {})):
+            self.assertEqual(deletions.run_once(), 1)
+        self.assertFalse(BackendDeletion.objects.exists())
+
+    def test_worker_skips_referenced(self):
+        """Документ FastAPI, на который снова ссылается Doc, не удаляется"""
+        self.make_doc('again', 5)
+        BackendDeletion.objects.create(fastapi_doc_id=5, run_after=timezone.now())
+        with patch('mi_django.deletions.backend.delete') as mock_delete:
+            deletions.run_once()
+        mock_delete.assert_not_called()
+        self.assertFalse(BackendDeletion.objects.exists())
+
+    @patch('mi_django.views.backend.delete')
+    def test_single_delete_uses_outbox(self, mock_delete):
+        """Удаление одного документа убирает запись outbox только после подтверждения FastAPI"""
+        mock_delete.side_effect = requests.ConnectionError("нет соединения")
+        doc = self.make_doc('single', 11)
+        self.client.post(reverse('delete_document', args=[doc.id]))
+        self.assertEqual(self.outbox(), {11})
+
+        mock_delete.side_effect = None
+        mock_delete.return_value = proxy_response(200, {})
+        doc = self.make_doc('confirmed', 12)
+        self.client.post(reverse('delete_document', args=[doc.id]))
+        self.assertEqual(self.outbox(), {11})
+
+    @patch('mi_django.views.backend.delete')
+    def test_single_delete_without_analysis(self, mock_delete):
+        """Документ без fastapi_doc_id удаляется без обращения к FastAPI и записи outbox"""
+        doc = self.make_doc('no_analysis', None)
+        self.client.post(reverse('delete_document', args=[doc.id]))
+        self.assertFalse(Doc.objects.filter(id=doc.id).exists())
+        self.assertFalse(self.exists(doc))
+        mock_delete.assert_not_called()
+        self.assertEqual(self.outbox(), set())
+
+    def test_worker_command(self):
+        """Команда воркера с --once обрабатывает одну пачку"""
+        BackendDeletion.objects.create(fastapi_doc_id=1, run_after=timezone.now())
+        out = io.StringIO()
+        with patch('mi_django.deletions.backend.delete', return_value=proxy_response(200, {})):
+            call_command('run_deletion_worker', '--once', stdout=out)
+        self.assertIn('Обработано записей: 1', out.getvalue())
+
+
+class ClearTableCommandTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media_root.name, 'cas'))
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.other = User.objects.create_user(username='other', password='testpassword')
+        self.docs = [self.make_doc(self.user, i) for i in range(5)]
+        self.other_doc = self.make_doc(self.other, 99)
+        Price.objects.create(file_type='jpg', price=1.0)
+
+    def make_doc(self, user, number):
+        file_path = f'cas/{number}.jpg'
+        with open(os.path.join(self.media_root.name, file_path), 'wb') as f:
+            f.write(b'scan')
+        doc = Doc.objects.create(user=user, file_path=file_path, size=1, fastapi_doc_id=number)
+        Cart.objects.create(user=user, doc=doc, order_price=1)
+        UsersToDocs.objects.create(username=user, docs_id=doc)
+        DocText.objects.create(doc=doc, texts=[], content_hash='x', fetched_at=timezone.now())
+        AnalysisJob.objects.create(doc=doc, run_after=timezone.now())
+        return doc
+
+    def clear(self, *args):
+        out = io.StringIO()
+        call_command('clear_table', '--noinput', '--chunk-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def exists(self, doc):
+        return os.path.exists(os.path.join(self.media_root.name, doc.file_path))
+
+    def test_clear_all_in_chunks(self):
+        """Без отбора очищаются все таблицы пачками, документы FastAPI попадают в outbox"""
+        with patch('mi_django.fragments.fragment_cache.bump') as bump:
+            output = self.clear()
+        for model in (Doc, Cart, UsersToDocs, DocText, AnalysisJob, Price):
+            self.assertFalse(model.objects.exists(), model.__name__)
+        self.assertFalse(any(self.exists(doc) for doc in self.docs + [self.other_doc]))
+        self.assertEqual(set(BackendDeletion.objects.values_list('fastapi_doc_id', flat=True)), {0, 1, 2, 3, 4, 99})
+        self.assertIn('docs: удалено 2 из 6', output)
+        # Сигналы не отправляются построчно: метка фрагментов — раз на пользователя в cart, user_to_docs и docs
+        self.assertEqual(bump.call_count, 6)
+
+    def test_user_scope(self):
+        """С --user удаляются только строки пользователя; общий файл остаётся"""
+        shared = Doc.objects.create(user=self.other, file_path=self.docs[0].file_path, size=1, fastapi_doc_id=0)
+        output = self.clear('--user', 'testuser')
+        self.assertEqual(set(Doc.objects.values_list('id', flat=True)), {self.other_doc.id, shared.id})
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(UsersToDocs.objects.count(), 1)
+        self.assertTrue(Price.objects.exists())
+        self.assertIn('price: строки не принадлежат пользователям', output)
+        self.assertTrue(self.exists(shared))
+        self.assertFalse(self.exists(self.docs[1]))
+        self.assertEqual(set(BackendDeletion.objects.values_list('fastapi_doc_id', flat=True)), {1, 2, 3, 4})
+
+    def test_older_than(self):
+        """С --older-than удаляются только документы старше срока; без даты загрузки — остаются"""
+        Doc.objects.filter(id__in=[self.docs[0].id, self.docs[1].id]).update(
+            created_at=timezone.now() - timedelta(days=40)
+        )
+        Doc.objects.filter(id=self.docs[2].id).update(created_at=None)
+        self.clear('docs', '--older-than', '30')
+        remaining = set(Doc.objects.values_list('id', flat=True))
+        self.assertEqual(remaining, {doc.id for doc in self.docs[2:]} | {self.other_doc.id})
+        self.assertEqual(Cart.objects.count(), 4)
+
+    def test_dry_run(self):
+        """--dry-run считает строки и оценивает время, ничего не удаляя"""
+        output = self.clear('--dry-run')
+        self.assertIn('docs: 6 строк', output)
+        self.assertIn('cart: 6', output)
+        self.assertIn('ожидаемое время', output)
+        self.assertEqual(Doc.objects.count(), 6)
+        self.assertEqual(DocText.objects.count(), 6)
+        self.assertTrue(all(self.exists(doc) for doc in self.docs))
+        self.assertFalse(BackendDeletion.objects.exists())
+
+    def test_resume_after_failure(self):
+        """Прерванная очистка сохраняет готовые пачки, повторный запуск удаляет остальное"""
+        from .management.commands import clear_table
+        release_refs = clear_table.release_refs
+        calls = itertools.count()
+
+        def failing(rows):
+            if next(calls) == 1:
+                raise RuntimeError("соединение потеряно")
+            return release_refs(rows)
+
+        with patch.object(clear_table, 'release_refs', side_effect=failing), self.assertRaises(RuntimeError):
+            self.clear('docs')
+        self.assertEqual(Doc.objects.count(), 4)
+        self.assertTrue(self.exists(self.docs[2]))
+
+        self.clear('docs')
+        self.assertFalse(Doc.objects.exists())
+        self.assertFalse(DocText.objects.exists())
+
+    def test_truncate_on_postgresql(self):
+        """На PostgreSQL без отбора используется TRUNCATE, с отбором — пачки"""
+        from .management.commands.clear_table import Command
+        with patch.object(connection, 'vendor', 'postgresql'), \
+                patch.object(Command, '_truncate') as truncate, patch.object(Command, '_purge') as purge:
+            self.clear('docs', 'price')
+            self.assertEqual([c.args[0] for c in truncate.call_args_list], ['docs', 'price'])
+            purge.assert_not_called()
+            truncate.reset_mock()
+            self.clear('docs', '--user', 'testuser')
+            truncate.assert_not_called()
+            purge.assert_called_once()
@@ -0,0 +1,176 @@
+"""
+Кэш извлечённого текста документов (ответ FastAPI /get_text/).
+
+Текст завершённого анализа не меняется, поэтому get_document_text берёт его
+из кэша по Doc.fastapi_doc_id. Хранилище подключается через настройку
+DOC_TEXT_CACHE:
+
+    DOC_TEXT_CACHE = {
+        'BACKEND': 'mi_django.text_cache.DjangoTextCache',  # или FileTextCache / LRUTextCache
+        'OPTIONS': {'alias': 'default'},
+    }
+
+Кэш сбрасывается при новом анализе и удалении документа, поэтому при
+нескольких процессах хранилище должно быть общим: LRUTextCache сбросит
+запись только в том процессе, который обработал запрос.
+"""
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class LRUTextCache:
+    """Кэш в памяти процесса с вытеснением по суммарному размеру текстов."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            self._data.move_to_end(key)
+            return item[0]
+
+    def set(self, key, texts):
+        size = len(json.dumps(texts, ensure_ascii=False).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self.current_bytes -= self._data.pop(key)[1]
+            self._data[key] = (texts, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def delete(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is not None:
+                self.current_bytes -= item[1]
+
+
+class FileTextCache:
+    """Кэш в JSON-файлах, общий для всех процессов на одном хосте."""
+
+    def __init__(self, location=None):
+        self.location = location or os.path.join(settings.BASE_DIR, 'cache', 'doc_text')
+        os.makedirs(self.location, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.location, f'{key}.json')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def set(self, key, texts):
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(texts, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class DjangoTextCache:
+    """Кэш через кэш-фреймворк Django (например, общий Redis/Memcached)."""
+
+    def __init__(self, alias='default', timeout=None, key_prefix='doc_text'):
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    def _key(self, key):
+        return f'{self.key_prefix}:{key}'
+
+    def get(self, key):
+        return self.cache.get(self._key(key))
+
+    def set(self, key, texts):
+        self.cache.set(self._key(key), texts, timeout=self.timeout)
+
+    def delete(self, key):
+        self.cache.delete(self._key(key))
+
+
+class TextCache:
+    """Обёртка над хранилищем: счётчики попаданий и правила кэширования."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, fastapi_doc_id):
+        texts = self.backend.get(fastapi_doc_id) if fastapi_doc_id is not None else None
+        with self._lock:
+            if texts is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return texts
+
+    def set(self, fastapi_doc_id, texts):
+        # Пустой список означает, что анализ ещё не завершён: такой ответ не кэшируем
+        if fastapi_doc_id is None or not texts:
+            return
+        self.backend.set(fastapi_doc_id, texts)
+
+    def invalidate(self, fastapi_doc_id):
+        if fastapi_doc_id is not None:
+            self.backend.delete(fastapi_doc_id)
+            logger.debug("Текст документа %s удалён из кэша.", fastapi_doc_id)
+
+    # Файловое хранилище и кэш-фреймворк обращаются к диску и сети синхронно
+    async def aget(self, fastapi_doc_id):
+        return await sync_to_async(self.get)(fastapi_doc_id)
+
+    async def aset(self, fastapi_doc_id, texts):
+        await sync_to_async(self.set)(fastapi_doc_id, texts)
+
+    async def ainvalidate(self, fastapi_doc_id):
+        await sync_to_async(self.invalidate)(fastapi_doc_id)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+
+def create_text_cache():
+    config = getattr(settings, 'DOC_TEXT_CACHE', {})
+    backend_class = import_string(config.get('BACKEND', 'mi_django.text_cache.DjangoTextCache'))
+    return TextCache(backend_class(**config.get('OPTIONS', {})))
+
+
+text_cache = create_text_cache()
@@ -0,0 +1,73 @@
+"""
+Миниатюры загруженных изображений для сетки документов на главной странице.
+
+Миниатюры создаются при загрузке документа (или командой generate_thumbnails
+для уже загруженных) в нескольких размерах и сохраняются в
+MEDIA_ROOT/thumbs/<размер>/. Относительные пути хранятся в Doc.thumbnails.
+"""
+import logging
+import os
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Имя размера -> наибольшая сторона миниатюры в пикселях
+THUMBNAIL_SIZES = getattr(settings, 'THUMBNAIL_SIZES', {'sm': 320, 'md': 640})
+THUMBNAIL_FORMAT = getattr(settings, 'THUMBNAIL_FORMAT', 'WEBP')  # WEBP или JPEG
+THUMBNAIL_QUALITY = getattr(settings, 'THUMBNAIL_QUALITY', 80)
+
+_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def thumbnail_name(file_path, size_name, fmt=THUMBNAIL_FORMAT):
+    stem = os.path.splitext(file_path)[0]
+    return os.path.join('thumbs', size_name, f'{stem}.{_EXTENSIONS[fmt]}')
+
+
+def make_thumbnails(media_root, file_path, sizes=None, fmt=THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY):
+    """
+    Создаёт миниатюры файла MEDIA_ROOT/file_path и возвращает {размер: путь}.
+
+    Не обращается к БД и настройкам Django, поэтому подходит для запуска
+    в пуле процессов.
+    """
+    sizes = sizes or THUMBNAIL_SIZES
+    result = {}
+    with Image.open(os.path.join(media_root, file_path)) as image:
+        # Для JPEG декодер сразу уменьшает изображение в 2/4/8 раз — это быстрее полного декодирования
+        image.draft('RGB', (max(sizes.values()),) * 2)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA') or (fmt == 'JPEG' and image.mode != 'RGB'):
+            image = image.convert('RGB')
+        options = {'quality': quality}
+        if fmt == 'WEBP':
+            options['method'] = 4
+        else:
+            options['optimize'] = True
+        # От большего размера к меньшему: каждая следующая миниатюра уменьшается из предыдущей
+        for size_name, max_side in sorted(sizes.items(), key=lambda item: -item[1]):
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            name = thumbnail_name(file_path, size_name, fmt)
+            path = os.path.join(media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            image.save(path, fmt, **options)
+            result[size_name] = name.replace(os.sep, '/')
+    return result
+
+
+def generate_thumbnails(file_path):
+    """Миниатюры для загруженного документа; при ошибке — пустой словарь."""
+    try:
+        return make_thumbnails(settings.MEDIA_ROOT, file_path)
+    except Exception as e:
+        logger.warning("Не удалось создать миниатюры для %s: %s", file_path, e)
+        return {}
+
+
+def delete_thumbnails(thumbnails):
+    for name in (thumbnails or {}).values():
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        if os.path.exists(path):
+            os.remove(path)
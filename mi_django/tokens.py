@@ -0,0 +1,142 @@
+"""
+JWT-токены прокси-сервера, хранящиеся в сессии пользователя.
+
+Access-токен обновляется заранее — когда до истечения (поле exp) остаётся
+меньше TOKEN_REFRESH_MARGIN секунд, — поэтому запрос к сервису не получает
+401 и большой файл не приходится отправлять повторно. Одновременные
+обновления одной сессии выполняются один раз: внутри процесса через
+блокировку, между процессами через кэш Django (блокировка cache.add и
+общий результат обновления).
+"""
+import base64
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+TOKEN_REFRESH_MARGIN = getattr(settings, 'TOKEN_REFRESH_MARGIN', 60)  # секунд до exp
+TOKEN_REFRESH_LOCK_TIMEOUT = getattr(settings, 'TOKEN_REFRESH_LOCK_TIMEOUT', 10)
+TOKEN_CACHE_ALIAS = getattr(settings, 'TOKEN_CACHE_ALIAS', 'default')
+
+_CACHE_PREFIX = 'jwt-refresh:'
+
+
+def token_expiry(token):
+    """Время истечения JWT (unix time) из поля exp; подпись не проверяется."""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenManager:
+    """Выдаёт действующий access-токен сессии, обновляя его через /api/token/refresh/."""
+
+    def __init__(self, client, margin=TOKEN_REFRESH_MARGIN, lock_timeout=TOKEN_REFRESH_LOCK_TIMEOUT,
+                 cache_alias=TOKEN_CACHE_ALIAS):
+        self.client = client
+        self.margin = margin
+        self.lock_timeout = lock_timeout
+        self.cache_alias = cache_alias
+        # Блокировки по хэшу refresh-токена: число фиксировано, словарь не растёт
+        self._locks = [threading.Lock() for _ in range(64)]
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def expires_soon(self, token):
+        """Токен истекает в ближайшие margin секунд. Без exp считается действующим."""
+        exp = token_expiry(token)
+        return exp is not None and exp - time.time() < self.margin
+
+    def access_token(self, session):
+        """Действующий access-токен сессии или None, если токенов нет или обновить не удалось."""
+        access_token = session.get('access_token')
+        if not access_token or not session.get('refresh_token'):
+            return None
+        if self.expires_soon(access_token):
+            return self.refresh(session, access_token)
+        return access_token
+
+    async def aaccess_token(self, session):
+        access_token = await session.aget('access_token')
+        if not access_token or not await session.aget('refresh_token'):
+            return None
+        if self.expires_soon(access_token):
+            return await sync_to_async(self.refresh)(session, access_token)
+        return access_token
+
+    def handle_unauthorized(self, session, response):
+        """Сервис ответил 401: токен отозван или часы расходятся. Возвращает новый токен или None."""
+        used = response.request.headers.get('Authorization', '').removeprefix('Bearer ')
+        logger.warning("Сервис отклонил токен доступа (%s), обновляем токен.", response.request.url)
+        return self.refresh(session, used)
+
+    def refresh(self, session, stale_token):
+        """Обновляет stale_token; если его уже обновил другой поток или процесс, берёт их результат."""
+        refresh_token = session.get('refresh_token')
+        if not refresh_token:
+            return None
+        key = hashlib.sha256(refresh_token.encode()).hexdigest()[:32]
+        with self._locks[int(key[:8], 16) % len(self._locks)]:
+            current = session.get('access_token')
+            if current and current != stale_token and not self.expires_soon(current):
+                return current
+            tokens = self._shared_result(key, stale_token) or self._refresh_once(key, refresh_token, stale_token)
+            if tokens is None:
+                return None
+            session['access_token'] = tokens['access']
+            if tokens.get('refresh'):
+                # Прокси-сервер может выдавать новый refresh-токен при каждом обновлении
+                session['refresh_token'] = tokens['refresh']
+            return tokens['access']
+
+    def _shared_result(self, key, stale_token):
+        tokens = self.cache.get(f'{_CACHE_PREFIX}{key}')
+        if tokens and tokens['access'] != stale_token and not self.expires_soon(tokens['access']):
+            return tokens
+        return None
+
+    def _refresh_once(self, key, refresh_token, stale_token):
+        lock_key = f'{_CACHE_PREFIX}lock:{key}'
+        acquired = self.cache.add(lock_key, 1, self.lock_timeout)
+        if not acquired:
+            # Токен этой сессии обновляет другой процесс: ждём его результат
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                tokens = self._shared_result(key, stale_token)
+                if tokens:
+                    return tokens
+            logger.warning("Не дождались обновления токена другим процессом, обновляем сами.")
+        try:
+            response = self.client.post(
+                f"{settings.PROXY_BASE_URL}/api/token/refresh/",
+                data={'refresh': refresh_token}
+            )
+            data = response.json() if response.status_code == 200 else {}
+            if not data.get('access'):
+                logger.error("Не удалось обновить токен доступа. Статус ответа: %s", response.status_code)
+                return None
+            tokens = {'access': data['access'], 'refresh': data.get('refresh')}
+            # Запросы со старым refresh-токеном, пришедшие следом, получат этот же результат
+            self.cache.set(f'{_CACHE_PREFIX}{key}', tokens, max(self.margin, self.lock_timeout))
+            logger.info("Токен доступа успешно обновлён.")
+            return tokens
+        except Exception as e:
+            logger.error("Ошибка при обновлении токена доступа: %s", e)
+            return None
+        finally:
+            # Чужую блокировку не снимаем: её владелец ещё может обновлять токен
+            if acquired:
+                self.cache.delete(lock_key)
@@ -0,0 +1,226 @@
+"""
+Потоковая загрузка документов.
+
+Файл из request.FILES читается кусками фиксированного размера: каждый кусок
+одновременно уходит в тело multipart-запроса на прокси-сервер и записывается
+в локальную копию в MEDIA_ROOT. Пиковое потребление памяти на одну загрузку
+определяется размером куска, а не размером файла.
+
+Локальные копии адресуются содержимым: sha256 считается обработчиками
+загрузки ещё при приёме тела запроса, а файл хранится по пути
+cas/<2 символа>/<2 символа>/<sha256>.<расширение>. Одинаковые файлы
+хранятся один раз.
+"""
+import hashlib
+import logging
+import os
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from urllib3.fields import format_multipart_header_param
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = getattr(settings, 'UPLOAD_CHUNK_SIZE', 64 * 1024)
+
+
+class MultipartFileStream:
+    """
+    Тело запроса multipart/form-data с одним файловым полем, читаемое по частям.
+
+    requests передаёт такой объект потоково (через read()), а длина тела
+    известна заранее, поэтому Content-Length выставляется без сборки всего
+    тела в памяти. Каждый прочитанный кусок файла передаётся в sinks —
+    вызываемые объекты вида sink(chunk), например запись локальной копии.
+    """
+
+    def __init__(self, file, field_name='file', filename=None, content_type=None,
+                 sinks=(), chunk_size=UPLOAD_CHUNK_SIZE):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self.chunk_size = chunk_size
+        self.sinks = list(sinks)
+
+        filename = filename or os.path.basename(file.name)
+        head = (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; {format_multipart_header_param("name", field_name)}; '
+            f'{format_multipart_header_param("filename", filename)}\r\n'
+            f'Content-Type: {content_type or "application/octet-stream"}\r\n\r\n'
+        ).encode('utf-8')
+        tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+
+        file.seek(0)
+        self._file = file
+        self._file_size = file.size
+        self._file_read = 0
+        self._head = head
+        self._tail = tail
+        self._pos_head = 0
+        self._pos_tail = 0
+
+    def __len__(self):
+        return len(self._head) + self._file_size + len(self._tail)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    async def aiter_chunks(self):
+        """
+        Асинхронный итератор для httpx.AsyncClient (content=body.aiter_chunks()).
+        Чтение файла и запись в sinks идут в пуле потоков, не блокируя цикл событий.
+        """
+        read = sync_to_async(self.read, thread_sensitive=False)
+        while True:
+            chunk = await read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    @property
+    def finished(self):
+        """Файл прочитан целиком (все куски прошли через sinks)."""
+        return self._file_read >= self._file_size
+
+    def _read_file(self, size):
+        chunk = self._file.read(min(size, self._file_size - self._file_read))
+        if chunk:
+            self._file_read += len(chunk)
+            for sink in self.sinks:
+                sink(chunk)
+        return chunk
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.chunk_size
+        if self._pos_head < len(self._head):
+            chunk = self._head[self._pos_head:self._pos_head + size]
+            self._pos_head += len(chunk)
+            return chunk
+        if not self.finished:
+            chunk = self._read_file(size)
+            if chunk:
+                return chunk
+            # Файл оказался короче заявленного размера
+            self._file_size = self._file_read
+        chunk = self._tail[self._pos_tail:self._pos_tail + size]
+        self._pos_tail += len(chunk)
+        return chunk
+
+    def drain(self):
+        """Дочитывает остаток файла в sinks, если сервер ответил до конца передачи."""
+        while not self.finished:
+            if not self._read_file(self.chunk_size):
+                break
+
+
+class HashingMemoryFileUploadHandler(MemoryFileUploadHandler):
+    """MemoryFileUploadHandler, который считает sha256 файла по мере приёма."""
+
+    def new_file(self, *args, **kwargs):
+        self._sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.activated:
+            self._sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self._sha256.hexdigest()
+        return file
+
+
+class HashingTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """TemporaryFileUploadHandler, который считает sha256 файла по мере приёма."""
+
+    def new_file(self, *args, **kwargs):
+        self._sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self._sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self._sha256.hexdigest()
+        return file
+
+
+def upload_sha256(file, chunk_size=UPLOAD_CHUNK_SIZE):
+    """sha256 загруженного файла: из обработчика загрузки или подсчётом по кускам."""
+    sha256 = getattr(file, 'sha256', None)
+    if sha256:
+        return sha256
+    hasher = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks(chunk_size):
+        hasher.update(chunk)
+    file.seek(0)
+    file.sha256 = hasher.hexdigest()
+    return file.sha256
+
+
+def content_addressed_name(sha256, original_name):
+    """Путь в хранилище для файла с данным содержимым (расширение сохраняется для расчёта цены)."""
+    extension = os.path.splitext(original_name)[1].lower()
+    return f'cas/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+
+class LocalCopy:
+    """
+    Локальная копия загружаемого файла по адресу содержимого в default_storage.
+
+    Если файл с таким содержимым уже хранится, запись не выполняется. Иначе
+    куски пишутся во временный файл рядом с итоговым и атомарно
+    переименовываются при commit(). Если загрузка не удалась, discard()
+    удаляет частичную копию.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.path = default_storage.path(self.name)
+        self.exists = os.path.exists(self.path)
+        self._tmp_path = None
+        self._fh = None
+        if not self.exists:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._tmp_path = f'{self.path}.{uuid.uuid4().hex}.part'
+            self._fh = open(self._tmp_path, 'xb')
+
+    def write(self, chunk):
+        if self._fh is not None:
+            self._fh.write(chunk)
+
+    def commit(self, source=None):
+        if self._fh is not None:
+            self._fh.close()
+            # Параллельная загрузка того же содержимого могла успеть раньше: байты те же
+            os.replace(self._tmp_path, self.path)
+            logger.debug("Локальная копия сохранена: %s", self.path)
+        elif source is not None and not os.path.exists(self.path):
+            # Файл удалили вместе с последним ссылавшимся документом, пока шла загрузка
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f'{self.path}.{uuid.uuid4().hex}.part'
+            source.seek(0)
+            with open(tmp_path, 'xb') as fh:
+                for chunk in source.chunks(UPLOAD_CHUNK_SIZE):
+                    fh.write(chunk)
+            os.replace(tmp_path, self.path)
+        return self.name
+
+    def discard(self):
+        if self._fh is not None:
+            self._fh.close()
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
@@ -2,24 +2,35 @@ from django.urls import path
 from . import views
 from django.contrib.auth import views as auth_views
 from django.conf import settings
-from django.conf.urls.static import static
 from .views import login_view
 
+# Представления, ожидающие ответа прокси-сервера и FastAPI: под ASGI — асинхронные
+if settings.ASYNC_VIEWS:
+    from . import async_views as backend_views
+else:
+    backend_views = views
+
 urlpatterns = [
     path('', views.index, name='index'),
-    path('upload-document/', views.upload_document, name='upload_document'),
-    path('analyze-document/<int:doc_id>/', views.analyze_document, name='analyze_document'),
-    path('get-document-text/<int:doc_id>/', views.get_document_text, name='get_document_text'),
-    path('delete-document/<int:doc_id>/', views.delete_document, name='delete_document'),
+    path('upload-document/', backend_views.upload_document, name='upload_document'),
+    path('upload-documents/', views.bulk_upload_documents, name='bulk_upload_documents'),
+    path('analyze-document/<int:doc_id>/', backend_views.analyze_document, name='analyze_document'),
+    path('get-document-text/<int:doc_id>/', backend_views.get_document_text, name='get_document_text'),
+    path('delete-document/<int:doc_id>/', backend_views.delete_document, name='delete_document'),
+    path('delete-documents/', views.delete_selected_documents, name='delete_documents'),
     path('order-analysis/<int:doc_id>/', views.order_analysis, name='order_analysis'),
+    path('batch-quote/', views.batch_quote, name='batch_quote'),
+    path('batch-order/', views.batch_order, name='batch_order'),
     path('cart/', views.cart_list, name='cart_list'),  # Добавленный маршрут
     path('cart/<int:cart_id>/', views.cart_detail, name='cart_detail'),
     path('cart/<int:cart_id>/payment/', views.make_payment, name='make_payment'),
     path('cart/clear/', views.clear_cart, name='clear_cart'),
     path('register/', views.register, name='register'),
     path('accounts/login/', login_view, name='login'),
+    path('metrics/backend-pool/', views.backend_pool_stats, name='backend_pool_stats'),
+    path('metrics/backend-circuits/', views.backend_circuit_stats, name='backend_circuit_stats'),
+    path('metrics/text-cache/', views.text_cache_stats, name='text_cache_stats'),
+    path('metrics/fragment-cache/', views.fragment_cache_stats, name='fragment_cache_stats'),
+    path('metrics/', views.prometheus_metrics, name='prometheus_metrics'),
     path('logout/', auth_views.LogoutView.as_view(template_name='registration/logout.html'), name='logout'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+]
\ No newline at end of file
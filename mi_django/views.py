@@ -1,23 +1,39 @@
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_POST
 from django.shortcuts import get_object_or_404
 import os
-from .models import Doc, Cart, Price
+from .models import Doc, Cart
+from django.db.models import Count, Q, Sum
 from .forms import UserRegisterForm
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 from django.views.decorators.csrf import csrf_exempt
 import logging
-from django.contrib.auth.models import User
 from django.contrib.auth import login
 from django.contrib import messages
 from django.conf import settings
+from django.utils.crypto import constant_time_compare
 import requests
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
+from .http_client import backend, token_manager, FASTAPI_BASE_URL
+from .doc_text import load_texts, save_texts
+from .analysis_queue import enqueue_analysis
+from .deletions import DELETION_MAX_SELECTED, confirm_deleted, delete_documents
+from .text_cache import text_cache
+from .thumbnails import delete_thumbnails, generate_thumbnails
+from .media_store import create_from_existing, delete_doc, discard_unreferenced, shared_thumbnails
+from .media_delivery import media_response
+from .uploads import LocalCopy, MultipartFileStream, content_addressed_name, upload_sha256
+from .bulk_upload import BulkUploadError, expand_uploads, upload_many
+from .prices import price_table
+from .metrics import request_metrics
+from .circuit import circuit_breakers
+from .fragments import fragment_cache
+from .logins import login_rate_limit, login_users, rejected_logins
+from .quotes import QuoteError, order_documents, parse_doc_ids, quote_documents
 
 PROXY_BASE_URL = 'http://djangorest:8002'
-FASTAPI_BASE_URL = os.environ.get('FASTAPI_BASE_URL', 'http://web:8000')
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +42,7 @@ def register(request):
     """
     Представление для регистрации нового пользователя.
     """
-    logger.debug(f"Вызвано представление регистрации. Метод запроса: {request.method}")
+    logger.debug("Вызвано представление регистрации. Метод запроса: %s", request.method)
     if request.method == 'POST':
         form = UserRegisterForm(request.POST)
         if form.is_valid():
@@ -34,38 +50,37 @@ def register(request):
             username = form.cleaned_data.get('username')
             password = form.cleaned_data.get('password1')
 
-            logger.debug(f"Регистрация пользователя: {username}")
+            logger.debug("Регистрация пользователя: %s", username)
 
             # Отправляем запрос на прокси-сервер для регистрации
             try:
-                logger.debug(f"Отправка запроса на регистрацию пользователя {username} на прокси-сервер.")
-                response = requests.post(
+                logger.debug("Отправка запроса на регистрацию пользователя %s на прокси-сервер.", username)
+                response = backend.post(
                     f"{settings.PROXY_BASE_URL}/api/register/",
-                    json={'username': username, 'password': password},
-                    timeout=10
+                    json={'username': username, 'password': password}
                 )
-                logger.debug(f"Получен ответ от прокси-сервера со статусом: {response.status_code}")
+                logger.debug("Получен ответ от прокси-сервера со статусом: %s", response.status_code)
                 response.raise_for_status()
 
                 # Если регистрация успешна
-                logger.info(f"Пользователь {username} успешно зарегистрирован через прокси-сервер.")
+                logger.info("Пользователь %s успешно зарегистрирован через прокси-сервер.", username)
                 messages.success(request, f"Регистрация прошла успешно! Теперь вы можете войти.")
                 return redirect('login')  # Перенаправляем на страницу входа
 
             except requests.HTTPError as e:
-                logger.error(f"HTTPError during registration for user {username}: {e}")
+                logger.error("HTTPError during registration for user %s: %s", username, e)
                 messages.error(request, "Ошибка при регистрации на сервере. Попробуйте еще раз.")
             except requests.ConnectionError:
-                logger.error(f"ConnectionError during registration for user {username}.")
+                logger.error("ConnectionError during registration for user %s.", username)
                 messages.error(request, "Не удалось подключиться к серверу. Проверьте соединение.")
             except requests.Timeout:
-                logger.error(f"Timeout during registration for user {username}.")
+                logger.error("Timeout during registration for user %s.", username)
                 messages.error(request, "Превышено время ожидания ответа от сервера.")
             except Exception as e:
-                logger.error(f"Unexpected error during registration for user {username}: {e}")
+                logger.error("Unexpected error during registration for user %s: %s", username, e)
                 messages.error(request, "Произошла непредвиденная ошибка.")
         else:
-            logger.warning(f"Форма регистрации невалидна: {form.errors}")
+            logger.warning("Форма регистрации невалидна: %s", form.errors)
             messages.error(request, "Пожалуйста, исправьте ошибки в форме.")
     else:
         form = UserRegisterForm()
@@ -79,27 +94,40 @@ def login_view(request):
     """
     Кастомное представление для аутентификации пользователя через прокси-сервер.
     """
-    logger.debug(f"Вызвано представление входа. Метод запроса: {request.method}")
+    logger.debug("Вызвано представление входа. Метод запроса: %s", request.method)
     if request.method == 'POST':
         username = request.POST.get('username')
         password = request.POST.get('password')
 
-        logger.debug(f"Попытка входа пользователя: {username}")
+        logger.debug("Попытка входа пользователя: %s", username)
 
         if not username or not password:
             logger.warning("Имя пользователя или пароль не предоставлены.")
             messages.error(request, "Имя пользователя и пароль обязательны.")
             return render(request, 'registration/login.html')
 
+        # Та же пара имя/пароль только что отклонена прокси-сервером: не спрашиваем его снова
+        if rejected_logins.is_rejected(username, password):
+            logger.info("Повторный вход %s с отклонённым паролем, прокси-сервер не запрашивается.", username)
+            messages.error(request, "Ошибка при аутентификации. Проверьте имя пользователя и пароль.")
+            return render(request, 'registration/login.html')
+
+        retry_after = login_rate_limit.retry_after(username)
+        if retry_after:
+            logger.warning("Превышено число попыток входа для пользователя %s.", username)
+            messages.error(request, f"Слишком много попыток входа. Повторите через {retry_after} с.")
+            response = render(request, 'registration/login.html', status=429)
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+
         try:
             # Отправляем запрос на REST-сервер
-            logger.debug(f"Отправка запроса на аутентификацию пользователя {username} на прокси-сервер.")
-            response = requests.post(
+            logger.debug("Отправка запроса на аутентификацию пользователя %s на прокси-сервер.", username)
+            response = backend.post(
                 f"{settings.PROXY_BASE_URL}/api/login/",
-                json={'username': username, 'password': password},
-                timeout=10
+                json={'username': username, 'password': password}
             )
-            logger.debug(f"Получен ответ от прокси-сервера со статусом: {response.status_code}")
+            logger.debug("Получен ответ от прокси-сервера со статусом: %s", response.status_code)
             response.raise_for_status()  # Проверяем на ошибки HTTP
 
             # Получаем токены
@@ -108,38 +136,40 @@ def login_view(request):
             refresh_token = tokens.get('refresh')
 
             if not access_token or not refresh_token:
-                logger.error(f"Токены не получены для пользователя {username}. Ответ: {tokens}")
+                logger.error("Токены не получены для пользователя %s. Ответ: %s", username, tokens)
                 messages.error(request, "Ошибка аутентификации. Токены не получены.")
                 return render(request, 'registration/login.html')
 
             # Логируем токены (временно, только для отладки)
-            logger.debug(f"Access Token для {username}: {access_token}")
-            logger.debug(f"Refresh Token для {username}: {refresh_token}")
+            logger.debug("Access Token для %s: %s", username, access_token)
+            logger.debug("Refresh Token для %s: %s", username, refresh_token)
 
-            # Проверяем, существует ли пользователь
-            user, created = User.objects.get_or_create(username=username)
+            # Проверяем, существует ли пользователь (повторный вход — из кэша, без запроса к БД)
+            user, created = login_users.get_or_create(username)
             if created:
-                logger.info(f"Создан новый пользователь {username} в базе данных Django.")
+                logger.info("Создан новый пользователь %s в базе данных Django.", username)
             else:
-                logger.info(f"Пользователь {username} найден в базе данных Django.")
+                logger.info("Пользователь %s найден в базе данных Django.", username)
 
             # Устанавливаем пользовательскую сессию
             login(request, user)
-            logger.debug(f"Пользователь {username} вошел в систему.")
+            logger.debug("Пользователь %s вошел в систему.", username)
 
             # Сохраняем токены в сессии
             request.session['access_token'] = access_token
             request.session['refresh_token'] = refresh_token
-            logger.debug(f"Токены пользователя {username} сохранены в сессии.")
+            logger.debug("Токены пользователя %s сохранены в сессии.", username)
 
             messages.success(request, f"Добро пожаловать, {username}!")
             return redirect('index')
 
         except requests.HTTPError as e:
-            logger.error(f"HTTPError during login for user {username}: {e}")
+            logger.error("HTTPError during login for user %s: %s", username, e)
+            if e.response is not None and e.response.status_code in (400, 401, 403):
+                rejected_logins.remember(username, password)
             messages.error(request, "Ошибка при аутентификации. Проверьте имя пользователя и пароль.")
         except requests.RequestException as e:
-            logger.error(f"RequestException during login for user {username}: {e}")
+            logger.error("RequestException during login for user %s: %s", username, e)
             messages.error(request, "Ошибка подключения к серверу.")
 
     else:
@@ -149,17 +179,42 @@ def login_view(request):
     return render(request, 'registration/login.html')
 
 
+INDEX_PAGE_SIZE = getattr(settings, 'INDEX_PAGE_SIZE', 24)
+
+
 @login_required
 def index(request):
-    logger.debug(f"Вызвано представление index пользователем: {request.user.username}")
-    docs = Doc.objects.filter(user=request.user)
-    logger.debug(f"Найдено {docs.count()} документов для пользователя {request.user.username}.")
-    return render(request, 'mi_django/index.html', {'docs': docs})
+    logger.debug("Вызвано представление index пользователем: %s", request.user.username)
+    try:
+        after = int(request.GET['after'])
+    except (KeyError, ValueError):
+        after = None
+
+    def render_docs():
+        # Keyset-пагинация по индексу (user_id, id): новые документы первыми,
+        # ?after=<id> — последний документ предыдущей страницы. Без OFFSET и COUNT(*),
+        # поэтому время страницы не зависит от числа документов пользователя.
+        docs = Doc.objects.filter(user=request.user).only('id', 'file_path', 'size', 'thumbnails', 'analysis_status').order_by('-id')
+        if after is not None:
+            docs = docs.filter(id__lt=after)
+        docs = list(docs[:INDEX_PAGE_SIZE + 1])
+        next_cursor = docs[INDEX_PAGE_SIZE - 1].id if len(docs) > INDEX_PAGE_SIZE else None
+        docs = docs[:INDEX_PAGE_SIZE]
+        logger.debug("Показано %s документов для пользователя %s.", len(docs), request.user.username)
+        return render_to_string('mi_django/index_docs.html', {
+            'docs': docs,
+            'next_cursor': next_cursor,
+            'is_first_page': after is None,
+        }, request)
+
+    # Сетка документов отрисовывается заново только после изменения Doc/Cart пользователя
+    docs_html = fragment_cache.get_or_render(request, 'index_docs', render_docs, after)
+    return render(request, 'mi_django/index.html', {'docs_html': docs_html})
 
 
 @login_required
 def upload_document(request):
-    logger.debug(f"Вызвано представление загрузки документа пользователем: {request.user.username}")
+    logger.debug("Вызвано представление загрузки документа пользователем: %s", request.user.username)
     if request.method == "POST":
         logger.debug("Получен POST-запрос на загрузку документа.")
         # Получаем файл из формы
@@ -170,18 +225,7 @@ def upload_document(request):
             messages.error(request, "Файл не выбран.")
             return redirect('upload_document')
 
-        logger.debug(f"Получен файл: {file.name} размером {file.size} байт.")
-
-        # Сохраняем файл локально
-        try:
-            file_path = default_storage.save(file.name, ContentFile(file.read()))
-            full_file_path = os.path.join(settings.MEDIA_ROOT, file_path)
-            size_kb = file.size / 1024
-            logger.info(f"Файл {file.name} сохранён на сервере по пути {full_file_path}. Размер: {size_kb} КБ.")
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении файла {file.name}: {e}")
-            messages.error(request, "Ошибка при сохранении файла.")
-            return redirect('upload_document')
+        logger.debug("Получен файл: %s размером %s байт.", file.name, file.size)
 
         # Получаем токены из сессии
         access_token = request.session.get('access_token')
@@ -192,110 +236,115 @@ def upload_document(request):
             messages.error(request, "Ошибка аутентификации: необходимо войти в систему.")
             return redirect('login')
 
+        # Истекающий токен обновляется до отправки, чтобы файл не пришлось отправлять повторно
+        if not token_manager.access_token(request.session):
+            logger.error("Не удалось обновить токен доступа перед загрузкой документа.")
+            messages.error(request, "Сессия истекла. Пожалуйста, войдите снова.")
+            return redirect('login')
+
         logger.debug("Токены успешно извлечены из сессии.")
 
-        # Формируем заголовки с токеном
-        headers = {
-            'Authorization': f'Bearer {access_token}'
-        }
-
-        def make_upload_request():
-            # Отправляем файл на сервер
-            logger.info(f"Отправка файла {file.name} на прокси-сервер...")
-            with open(full_file_path, 'rb') as f:
-                try:
-                    response = requests.post(
-                        f"{settings.PROXY_BASE_URL}/api/upload_doc/",
-                        files={'file': (file.name, f, file.content_type)},
-                        headers=headers,
-                        timeout=10
-                    )
-                    logger.debug(f"Получен ответ от прокси-сервера со статусом: {response.status_code}")
-                    return response
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке файла {file.name} на прокси-сервер: {e}")
-                    raise
+        # sha256 посчитан обработчиком загрузки ещё при приёме файла
+        sha256 = upload_sha256(file)
+        size_kb = file.size / 1024
+
+        # Такое же содержимое уже загружено: переиспользуем файл и документ FastAPI
+        doc = create_from_existing(request.user, sha256, size_kb)
+        if doc is not None:
+            logger.info("Документ %s совпадает с уже загруженным, повторная отправка не требуется.", file.name)
+            messages.success(request, "Документ успешно загружен!")
+            return redirect('index')
 
+        # Локальная копия (по адресу содержимого) пишется по мере отправки файла на прокси-сервер
         try:
-            response = make_upload_request()
-            # Проверяем статус ответа
+            local_copy = LocalCopy(content_addressed_name(sha256, file.name))
+        except Exception as e:
+            logger.error("Ошибка при сохранении файла %s: %s", file.name, e)
+            messages.error(request, "Ошибка при сохранении файла.")
+            return redirect('upload_document')
+
+        def make_upload_request(sinks=()):
+            # Отправляем файл на сервер потоково, кусками по UPLOAD_CHUNK_SIZE
+            logger.info("Отправка файла %s на прокси-сервер...", file.name)
+            body = MultipartFileStream(file, filename=file.name, content_type=file.content_type, sinks=sinks)
+            try:
+                # Токен из сессии подставляет token_manager, истекающий — заранее обновляет
+                response = backend.post(
+                    f"{settings.PROXY_BASE_URL}/api/upload_doc/",
+                    data=body,
+                    headers={'Content-Type': body.content_type},
+                    user_session=request.session,
+                )
+                logger.debug("Получен ответ от прокси-сервера со статусом: %s", response.status_code)
+                # Сервер мог ответить, не дочитав тело: дописываем локальную копию
+                body.drain()
+                return response
+            except Exception as e:
+                logger.error("Ошибка при отправке файла %s на прокси-сервер: %s", file.name, e)
+                raise
+
+        try:
+            response = make_upload_request(sinks=[local_copy.write])
             if response.status_code == 401:
-                logger.warning("Токен доступа истёк. Пытаемся обновить токен.")
-                # Попытаемся обновить токен
-                try:
-                    refresh_response = requests.post(
-                        f"{settings.PROXY_BASE_URL}/api/token/refresh/",
-                        data={'refresh': refresh_token},
-                        timeout=10
-                    )
-                    logger.debug(f"Получен ответ от прокси-сервера при обновлении токена со статусом: {refresh_response.status_code}")
-
-                    if refresh_response.status_code == 200:
-                        new_tokens = refresh_response.json()
-                        access_token = new_tokens.get('access')
-                        if not access_token:
-                            logger.error("Не удалось получить новый токен доступа при обновлении.")
-                            messages.error(request, "Ошибка аутентификации. Пожалуйста, войдите снова.")
-                            return redirect('login')
-
-                        # Обновляем токен в сессии
-                        request.session['access_token'] = access_token
-                        headers['Authorization'] = f'Bearer {access_token}'
-
-                        logger.info("Токен доступа успешно обновлён.")
-
-                        # Повторяем запрос загрузки файла с новым токеном
-                        response = make_upload_request()
-                        response.raise_for_status()
-                    else:
-                        # Не удалось обновить токен
-                        logger.error("Не удалось обновить токен доступа. Статус ответа: {refresh_response.status_code}")
-                        messages.error(request, "Сессия истекла. Пожалуйста, войдите снова.")
-                        return redirect('login')
-
-                except Exception as e:
-                    logger.error(f"Ошибка при обновлении токена доступа: {e}")
-                    messages.error(request, "Ошибка при обновлении токена. Пожалуйста, войдите снова.")
+                # Токен отклонён до истечения срока (отозван, расходятся часы): без обновления не обойтись
+                if not token_manager.handle_unauthorized(request.session, response):
+                    messages.error(request, "Сессия истекла. Пожалуйста, войдите снова.")
+                    local_copy.discard()
                     return redirect('login')
-            else:
-                # Если статус не 401, проверяем на другие ошибки
-                response.raise_for_status()
-
+                response = make_upload_request()
+            response.raise_for_status()
         except requests.RequestException as e:
-            logger.error(f"Ошибка при загрузке документа на сервер: {e}")
+            logger.error("Ошибка при загрузке документа на сервер: %s", e)
             messages.error(request, f"Ошибка при загрузке документа: {str(e)}")
+            local_copy.discard()
             return redirect('upload_document')
         except Exception as e:
-            logger.error(f"Непредвиденная ошибка при загрузке документа: {e}")
+            logger.error("Непредвиденная ошибка при загрузке документа: %s", e)
             messages.error(request, "Произошла ошибка при загрузке документа.")
+            local_copy.discard()
             return redirect('upload_document')
 
-        # Обрабатываем успешный ответ
+        # Ответ разбираем до сохранения копии: при ошибке файл не останется без документа
         try:
             data = response.json()
-            logger.debug(f"Ответ от сервера при загрузке документа: {data}")
+            logger.debug("Ответ от сервера при загрузке документа: %s", data)
             document_id = data.get('id')  # ID документа в FastAPI
             document_url = data.get('url')  # URL изображения от FastAPI
         except ValueError:
             logger.error("Ошибка: не удалось декодировать JSON-ответ от сервера.")
             messages.error(request, "Ошибка при обработке ответа от сервера.")
+            local_copy.discard()
+            return redirect('upload_document')
+
+        try:
+            file_path = local_copy.commit(source=file)
+            logger.info("Файл %s сохранён на сервере по пути %s. Размер: %s КБ.", file.name, local_copy.path, size_kb)
+        except Exception as e:
+            logger.error("Ошибка при сохранении файла %s: %s", file.name, e)
+            messages.error(request, "Ошибка при сохранении файла.")
+            local_copy.discard()
             return redirect('upload_document')
 
         # Сохраняем информацию о документе в базе данных Django
+        thumbnails = {}
         try:
+            thumbnails = shared_thumbnails(file_path) or generate_thumbnails(file_path)
             Doc.objects.create(
                 user=request.user,
                 file_path=file_path,  # Путь к локальному файлу
                 size=size_kb,  # Размер в КБ
                 fastapi_doc_id=document_id,
+                content_hash=sha256,
+                thumbnails=thumbnails,
             )
-            logger.info(f"Документ {file.name} успешно сохранён в базе данных.")
+            logger.info("Документ %s успешно сохранён в базе данных.", file.name)
         except Exception as e:
-            logger.error(f"Ошибка при сохранении информации о документе в базе данных: {e}")
+            logger.error("Ошибка при сохранении информации о документе в базе данных: %s", e)
             messages.error(request, "Ошибка при сохранении данных документа.")
+            discard_unreferenced(file_path, thumbnails)
             return redirect('upload_document')
 
-        logger.info(f"Документ {file.name} успешно загружен. ID документа: {document_id}, URL: {document_url}")
+        logger.info("Документ %s успешно загружен. ID документа: %s, URL: %s", file.name, document_id, document_url)
         messages.success(request, "Документ успешно загружен!")
         return redirect('index')
 
@@ -305,6 +354,57 @@ def upload_document(request):
     # Если GET-запрос, отображаем форму загрузки
     return render(request, 'mi_django/upload_document.html')
 
+
+def _wants_json(request):
+    return 'application/json' in request.headers.get('Accept', '')
+
+
+@login_required
+@require_POST
+def bulk_upload_documents(request):
+    """Загрузка многих файлов или zip-архива одним запросом; отвечает сводкой по каждому файлу."""
+    wants_json = _wants_json(request)
+    uploaded = request.FILES.getlist("documents")
+    if not uploaded:
+        messages.error(request, "Файлы не выбраны.")
+        return redirect('upload_document')
+
+    access_token = request.session.get('access_token')
+    refresh_token = request.session.get('refresh_token')
+    if not access_token or not refresh_token:
+        logger.error("Ошибка аутентификации: токены отсутствуют в сессии.")
+        messages.error(request, "Ошибка аутентификации: необходимо войти в систему.")
+        return redirect('login')
+
+    # Токен обновляется заранее один раз, а не в каждом потоке отправки
+    if not token_manager.access_token(request.session):
+        messages.error(request, "Сессия истекла. Пожалуйста, войдите снова.")
+        return redirect('login')
+
+    try:
+        files = expand_uploads(uploaded)
+    except BulkUploadError as e:
+        if wants_json:
+            return JsonResponse({'error': str(e)}, status=400)
+        messages.error(request, str(e))
+        return redirect('upload_document')
+
+    try:
+        results = upload_many(request.user, files, request.session)
+    finally:
+        for file in files:
+            file.close()
+
+    summary = {
+        'total': len(results),
+        'created': sum(1 for result in results if result['status'] == 'created'),
+        'reused': sum(1 for result in results if result['status'] == 'reused'),
+        'failed': sum(1 for result in results if result['status'] == 'error'),
+    }
+    if wants_json:
+        return JsonResponse({'summary': summary, 'results': results})
+    return render(request, 'mi_django/bulk_upload_result.html', {'summary': summary, 'results': results})
+
 @login_required
 def get_document_text(request, doc_id):
     try:
@@ -312,12 +412,22 @@ def get_document_text(request, doc_id):
     except Doc.DoesNotExist:
         return HttpResponse("Документ не найден", status=404)
 
+    # Текст завершённого анализа не меняется: сначала смотрим кэш и сохранённый в БД текст
+    texts = load_texts(doc)
+    if texts is not None:
+        return render(request, 'mi_django/document_text.html', {'texts': texts, 'file_path': doc.file_path})
+
     # Отправляем запрос на получение текста
-    response = requests.get(f"{FASTAPI_BASE_URL}/get_text/{doc.fastapi_doc_id}")
+    try:
+        response = backend.get(f"{FASTAPI_BASE_URL}/get_text/{doc.fastapi_doc_id}", user_session=request.session)
+    except requests.RequestException as e:
+        logger.error("Ошибка при запросе текста документа %s из FastAPI: %s", doc.id, e)
+        return HttpResponse(f"Ошибка при получении текста: {e}", status=500)
 
     if response.status_code == 200:
         data = response.json()
         texts = data.get('texts', [])
+        save_texts(doc, texts)
         # doc.file_path содержит путь к файлу
         file_path = doc.file_path
         return render(request, 'mi_django/document_text.html', {'texts': texts, 'file_path': file_path})
@@ -331,25 +441,50 @@ def delete_document(request, doc_id):
     doc = Doc.objects.get(id=doc_id, user=request.user)
 
     # Определяем путь к файлу
-    file_path = os.path.join(settings.MEDIA_ROOT, os.path.basename(doc.file_path))
+    file_path = os.path.join(settings.MEDIA_ROOT, doc.file_path)
 
-    # Отправляем запрос на удаление документа в FastAPI
-    requests.delete(f"{FASTAPI_BASE_URL}/doc_delete/{doc.fastapi_doc_id}")
+    # Удаляем запись из базы данных Django; файл и документ FastAPI могут быть общими
+    last_file_ref, last_fastapi_ref = delete_doc(doc)
 
-    # Удаление файла из папки медиа
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    # Отправляем запрос на удаление документа в FastAPI; при неудаче его повторит воркер outbox
+    # Документ без анализа (fastapi_doc_id пуст) в FastAPI не отправлялся
+    if last_fastapi_ref and doc.fastapi_doc_id is not None:
+        try:
+            response = backend.delete(
+                f"{FASTAPI_BASE_URL}/doc_delete/{doc.fastapi_doc_id}", user_session=request.session
+            )
+            confirm_deleted(doc.fastapi_doc_id, response.status_code)
+        except requests.RequestException as e:
+            logger.error("Ошибка при удалении документа %s в FastAPI, повторит воркер: %s", doc.fastapi_doc_id, e)
+
+        text_cache.invalidate(doc.fastapi_doc_id)
+
+    # Удаление файла и миниатюр из папки медиа
+    if last_file_ref:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        delete_thumbnails(doc.thumbnails)
 
-    # Удаляем запись из базы данных Django
-    doc.delete()
     messages.success(request, "Документ и изображение успешно удалены!")
 
     return redirect('index')
 
-DEFAULT_PRICE_PER_KB = getattr(settings, 'DEFAULT_PRICE_PER_KB', 1.0)
+@login_required
+@require_POST
+def delete_selected_documents(request):
+    """Удаление выбранных документов (doc_ids) или всех документов пользователя (all=1)."""
+    if request.POST.get('all'):
+        doc_ids = None
+    else:
+        try:
+            doc_ids = parse_doc_ids(request.POST.getlist('doc_ids'), max_docs=DELETION_MAX_SELECTED)
+        except QuoteError as e:
+            messages.error(request, str(e))
+            return redirect('index')
 
-# getattr() используется для получения значения атрибута объекта.
-# getattr(object, attribute_name, default_value)
+    deleted = delete_documents(request.user, doc_ids)
+    messages.success(request, f"Удалено документов: {deleted}.")
+    return redirect('index')
 
 @login_required
 def order_analysis(request, doc_id): # заказ_анализ
@@ -365,12 +500,9 @@ def order_analysis(request, doc_id): # заказ_анализ
 
     # Извлекаем расширение файла из пути к файлу
     file_extension = doc.file_path.split('.')[-1].lower()
-    # Получаем цену за КБ для этого файла
-    try:
-        price_entry = Price.objects.get(file_type=file_extension)
-        price_per_kb = price_entry.price
-    except Price.DoesNotExist:
-        price_per_kb = DEFAULT_PRICE_PER_KB
+    # Цена за КБ для этого файла: из таблицы цен в памяти процесса, без запроса к БД
+    price_per_kb, is_default = price_table.price_for(doc.file_path)
+    if is_default:
         messages.info(request, f"Используется цена по умолчанию для файла '{file_extension}'.")
 
     # Рассчитываем общую стоимость
@@ -399,20 +531,67 @@ def order_analysis(request, doc_id): # заказ_анализ
 
     return render(request, 'mi_django/order_analysis.html', {'document': doc, 'order_price': order_price})
 
+@login_required
+def batch_quote(request):
+    """Стоимость анализа нескольких документов: ?doc_ids=1&doc_ids=2 или ?doc_ids=1,2."""
+    try:
+        doc_ids = parse_doc_ids(request.GET.getlist('doc_ids'))
+    except QuoteError as e:
+        if _wants_json(request):
+            return JsonResponse({'error': str(e)}, status=400)
+        messages.error(request, str(e))
+        return redirect('index')
+
+    quote = quote_documents(request.user, doc_ids)
+    if _wants_json(request):
+        return JsonResponse(quote)
+    return render(request, 'mi_django/batch_quote.html', {'quote': quote})
+
+
+@login_required
+@require_POST
+def batch_order(request):
+    """Оплата анализа нескольких документов одним заказом."""
+    try:
+        doc_ids = parse_doc_ids(request.POST.getlist('doc_ids'))
+    except QuoteError as e:
+        if _wants_json(request):
+            return JsonResponse({'error': str(e)}, status=400)
+        messages.error(request, str(e))
+        return redirect('index')
+
+    result = order_documents(request.user, doc_ids)
+    if _wants_json(request):
+        return JsonResponse(result)
+    paid = len(result['items']) - len(result['already_paid'])
+    messages.success(request, f"Оплачен анализ документов: {paid}, сумма {result['charged']:.2f} руб.")
+    if result['already_paid']:
+        messages.info(request, f"Уже были оплачены ранее: {len(result['already_paid'])}.")
+    return redirect('cart_list')
+
+def _cart_items(user):
+    """Строки корзины пользователя вместе с документом одним запросом (JOIN)."""
+    return (
+        Cart.objects.filter(user=user)
+        .select_related('doc')
+        .only('id', 'order_price', 'payment', 'doc__id', 'doc__file_path', 'doc__size')
+    )
+
+
 @login_required
 def cart_detail(request, cart_id): # детали корзины
-    cart_item = get_object_or_404(Cart, id=cart_id, user=request.user)
+    cart_item = get_object_or_404(_cart_items(request.user), id=cart_id)
     return render(request, 'mi_django/cart_detail.html', {'cart_item': cart_item})
 
 # Если объект с указанными параметрами не найден, она автоматически возвращает ошибку HTTP 404 (страница "Не найдено").
 
 @login_required
 def make_payment(request, cart_id): # произвести оплату
-    cart_item = get_object_or_404(Cart, id=cart_id, user=request.user)
+    cart_item = get_object_or_404(_cart_items(request.user), id=cart_id)
     if request.method == 'POST':
 
         cart_item.payment = True
-        cart_item.save()
+        cart_item.save(update_fields=['payment'])
         messages.success(request, "Оплата успешно проведена!")
         return redirect('cart_detail', cart_id=cart_item.id)
     else:
@@ -420,8 +599,20 @@ def make_payment(request, cart_id): # произвести оплату
 
 @login_required
 def cart_list(request): # список в корзине
-    cart_items = Cart.objects.filter(user=request.user)
-    return render(request, 'mi_django/cart_list.html', {'cart_items': cart_items})
+    def render_cart():
+        cart_items = _cart_items(request.user).order_by('id')
+        # Итоги считает БД, а не цикл по строкам в Python
+        totals = Cart.objects.filter(user=request.user).aggregate(
+            count=Count('id'),
+            total=Sum('order_price', default=0.0),
+            paid=Count('id', filter=Q(payment=True)),
+            unpaid=Count('id', filter=Q(payment=False)),
+            unpaid_total=Sum('order_price', filter=Q(payment=False), default=0.0),
+        )
+        return render_to_string('mi_django/cart_items.html', {'cart_items': cart_items, 'totals': totals}, request)
+
+    cart_html = fragment_cache.get_or_render(request, 'cart_items', render_cart)
+    return render(request, 'mi_django/cart_list.html', {'cart_html': cart_html})
 
 
 @login_required
@@ -458,15 +649,69 @@ def analyze_document(request, doc_id):
                 return redirect('order_analysis', doc_id=doc_id)
             # Пользователь оплатил анализ, продолжаем
 
-        # Отправляем запрос на анализ документа в FastAPI
-        response = requests.put(f"{FASTAPI_BASE_URL}/doc_analyse/{doc.fastapi_doc_id}")
-
-        if response.status_code == 200:
-            messages.success(request, "Анализ документа запущен!")
-        else:
-            messages.error(request, f"Ошибка при запуске анализа: {response.text}")
-
+        # Анализ запустит воркер очереди (run_analysis_worker), запрос не ждёт FastAPI
+        enqueue_analysis(doc)
+        messages.success(request, "Анализ документа поставлен в очередь!")
         return redirect('index')
     else:
         # показать страницу с подтверждением анализа
-        return render(request, 'mi_django/confirm_analyze.html', {'doc': doc})
\ No newline at end of file
+        return render(request, 'mi_django/confirm_analyze.html', {'doc': doc})
+
+@staff_member_required
+def backend_pool_stats(request):
+    """
+    Статистика переиспользования соединений к прокси-серверу и FastAPI
+    в текущем процессе-воркере.
+    """
+    return JsonResponse(backend.stats())
+
+
+@staff_member_required
+def text_cache_stats(request):
+    """
+    Попадания и промахи кэша извлечённого текста в текущем процессе-воркере.
+    """
+    return JsonResponse(text_cache.stats())
+
+
+@staff_member_required
+def backend_circuit_stats(request):
+    """
+    Состояние автоматов отключения прокси-сервера и FastAPI в текущем
+    процессе-воркере.
+    """
+    return JsonResponse(circuit_breakers.stats())
+
+
+@staff_member_required
+def fragment_cache_stats(request):
+    """
+    Попадания и промахи кэша фрагментов страниц (главная, корзина) и среднее
+    время отрисовки фрагмента при промахе в текущем процессе-воркере.
+    """
+    return JsonResponse(fragment_cache.stats())
+
+
+def prometheus_metrics(request):
+    """
+    Метрики запросов текущего процесса-воркера в текстовом формате Prometheus.
+    Доступны сотрудникам или по заголовку Authorization: Bearer <METRICS_TOKEN>.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorized = request.user.is_active and request.user.is_staff
+    if not authorized and token:
+        authorized = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized:
+        return HttpResponse(status=403)
+    lines = fragment_cache.lookups.render() + circuit_breakers.render()
+    body = request_metrics.render() + '\n'.join(lines) + '\n'
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@login_required
+def serve_media(request, path):
+    """
+    Документы и миниатюры из MEDIA_ROOT для вошедших пользователей. В
+    production файл отдаёт nginx по X-Accel-Redirect (MEDIA_DELIVERY).
+    """
+    return media_response(request, path)
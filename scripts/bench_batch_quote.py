@@ -0,0 +1,70 @@
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from mi_django.models import Cart, Doc
+
+BENCH_USERNAME = 'bench_batch_quote'
+
+
+def _measure(func):
+    queries = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+    return queries, elapsed
+
+
+def run(batch_sizes=(1, 10, 100, 1000)):
+    """
+    Сравнивает оплату N документов по одному (order_analysis на каждый)
+    и одним пакетом (batch_order): число запросов к БД и время.
+    Число запросов пакетного заказа не должно зависеть от N.
+    """
+    user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+    client = Client()
+    client.force_login(user)
+
+    print(f"{'Документов':>11} {'По одному: запросов':>20} {'время, с':>9} {'Пакетом: запросов':>18} {'время, с':>9}")
+    try:
+        for size in batch_sizes:
+            docs = Doc.objects.bulk_create(
+                Doc(user=user, file_path=f'bench/{size}_{i}.jpg', size=100.0) for i in range(size)
+            )
+
+            def one_by_one():
+                for doc in docs:
+                    client.get(reverse('order_analysis', args=[doc.id]))
+                    client.post(reverse('order_analysis', args=[doc.id]))
+
+            single_queries, single_time = _measure(one_by_one)
+            Cart.objects.filter(user=user).delete()
+
+            def batch():
+                ids = [doc.id for doc in docs]
+                client.get(reverse('batch_quote'), {'doc_ids': ids}, HTTP_ACCEPT='application/json')
+                client.post(reverse('batch_order'), {'doc_ids': ids}, HTTP_ACCEPT='application/json')
+
+            batch_queries, batch_time = _measure(batch)
+            Cart.objects.filter(user=user).delete()
+            print(f"{size:>11} {single_queries:>20} {single_time:>9.3f} {batch_queries:>18} {batch_time:>9.3f}")
+    finally:
+        Cart.objects.filter(user=user).delete()
+        Doc.objects.filter(user=user).delete()
+        user.delete()
+
+
+# python manage.py shell
+
+'''from scripts.bench_batch_quote import run
+run()'''
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import override_settings
+
+from mi_django import deletions
+from mi_django.http_client import backend
+from mi_django.media_store import delete_doc
+from mi_django.models import BackendDeletion, Doc
+from mi_django.thumbnails import delete_thumbnails
+
+BENCH_USERNAME = 'bench_bulk_delete'
+
+
+def _make_stub_handler(latency):
+    class StubFastAPIHandler(BaseHTTPRequestHandler):
+        """Заглушка FastAPI /doc_delete/<id>: отвечает 200 с искусственной задержкой."""
+        protocol_version = 'HTTP/1.1'
+
+        def do_DELETE(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return StubFastAPIHandler
+
+
+def _populate(user, docs):
+    """docs документов, у каждого свой файл, миниатюра и документ FastAPI."""
+    rows = []
+    for i in range(docs):
+        file_path = f'cas/bench/{i}.jpg'
+        thumbnail = f'thumbnails/bench/{i}.webp'
+        for name in (file_path, thumbnail):
+            with open(os.path.join(settings.MEDIA_ROOT, name), 'wb') as f:
+                f.write(b'x' * 1024)
+        rows.append(Doc(user=user, file_path=file_path, size=1, fastapi_doc_id=10 ** 6 + i,
+                        thumbnails={'small': thumbnail}))
+    Doc.objects.bulk_create(rows, batch_size=1000)
+
+
+def _delete_one_by_one(user, fastapi_url):
+    """Прежний путь: на каждый документ delete_doc, DELETE в FastAPI и os.remove."""
+    for doc in Doc.objects.filter(user=user):
+        last_file_ref, last_fastapi_ref = delete_doc(doc)
+        if last_fastapi_ref:
+            backend.delete(f"{fastapi_url}/doc_delete/{doc.fastapi_doc_id}")
+        if last_file_ref:
+            os.remove(os.path.join(settings.MEDIA_ROOT, doc.file_path))
+            delete_thumbnails(doc.thumbnails)
+    # Записи outbox от delete_doc прежнему пути не нужны
+    BackendDeletion.objects.all().delete()
+
+
+def run(docs=10000, latency=0.005, batch_size=100):
+    """
+    Удаление всех docs документов пользователя: по одному (как в цикле
+    delete_document) и пакетом (delete_documents + воркер outbox пачками
+    по batch_size). FastAPI — локальная заглушка с задержкой latency.
+
+    Печатается время ответа пользователю и время до полного удаления
+    документов в FastAPI.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _make_stub_handler(latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    fastapi_url = f'http://127.0.0.1:{server.server_address[1]}'
+    user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+    print(f"Документов: {docs}, задержка FastAPI: {latency * 1000:.0f} мс")
+    print(f"{'Путь':>10} {'Ответ, с':>9} {'До очистки FastAPI, с':>22} {'Осталось файлов':>16}")
+    try:
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                patch.object(deletions, 'FASTAPI_BASE_URL', fastapi_url):
+            os.makedirs(os.path.join(media_root, 'cas', 'bench'))
+            os.makedirs(os.path.join(media_root, 'thumbnails', 'bench'))
+
+            _populate(user, docs)
+            started = time.perf_counter()
+            _delete_one_by_one(user, fastapi_url)
+            elapsed = time.perf_counter() - started
+            left = sum(len(files) for _, _, files in os.walk(media_root))
+            print(f"{'по одному':>10} {elapsed:>9.2f} {elapsed:>22.2f} {left:>16}")
+
+            _populate(user, docs)
+            started = time.perf_counter()
+            deletions.delete_documents(user)
+            response = time.perf_counter() - started
+            while deletions.run_once(batch_size):
+                pass
+            elapsed = time.perf_counter() - started
+            left = sum(len(files) for _, _, files in os.walk(media_root))
+            print(f"{'пакетом':>10} {response:>9.2f} {elapsed:>22.2f} {left:>16}")
+            print(f"Записей в outbox после воркера: {BackendDeletion.objects.count()}")
+    finally:
+        server.shutdown()
+        Doc.objects.filter(user=user).delete()
+        user.delete()
+
+
+# python manage.py shell
+
+'''from scripts.bench_bulk_delete import run
+run()'''
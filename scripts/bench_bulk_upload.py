@@ -0,0 +1,125 @@
+import io
+import itertools
+import json
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, override_settings
+from django.urls import reverse
+from PIL import Image, ImageDraw
+
+from mi_django.models import Doc
+
+BENCH_USERNAME = 'bench_bulk_upload'
+
+
+def _make_stub_handler(latency):
+    ids = itertools.count(1)
+
+    class StubProxyHandler(BaseHTTPRequestHandler):
+        """Заглушка /api/upload_doc/: дочитывает тело и отвечает с искусственной задержкой."""
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining:
+                remaining -= len(self.rfile.read(min(remaining, 1024 * 1024)))
+            time.sleep(latency)
+            body = json.dumps({'id': next(ids)}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return StubProxyHandler
+
+
+def _make_pages(count, width=1240, height=1754):
+    """Разные JPEG-«сканы» страниц A4 (150 dpi): строки текста случайной длины."""
+    pages = []
+    for i in range(count):
+        image = Image.new('RGB', (width, height), 'white')
+        draw = ImageDraw.Draw(image)
+        for y in range(120, height - 120, 36):
+            draw.rectangle((100, y, 100 + random.randint(200, width - 200), y + 14), fill='black')
+        draw.text((100, 60), f'page {i}', fill='black')
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        pages.append((f'page_{i}.jpg', buffer.getvalue()))
+    return pages
+
+
+def _client(user):
+    client = Client()
+    client.force_login(user)
+    session = client.session
+    session['access_token'] = 'bench'
+    session['refresh_token'] = 'bench'
+    session.save()
+    return client
+
+
+def run(pages=50, latency=0.2):
+    """
+    Сравнивает загрузку pages страниц по одной (upload_document) с одним
+    пакетным запросом (bulk_upload_documents) на локальной заглушке прокси
+    с задержкой ответа latency секунд.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _make_stub_handler(latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+    files = _make_pages(pages)
+
+    try:
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root, PROXY_BASE_URL=f'http://127.0.0.1:{server.server_port}'
+        ):
+            client = _client(user)
+            started = time.perf_counter()
+            for name, content in files:
+                response = client.post(reverse('upload_document'), {
+                    'document': SimpleUploadedFile(name, content, content_type='image/jpeg'),
+                })
+                assert response.status_code == 302
+            sequential = time.perf_counter() - started
+            Doc.objects.filter(user=user).delete()
+
+        # Новый MEDIA_ROOT: файлы не должны совпасть с уже загруженными
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root, PROXY_BASE_URL=f'http://127.0.0.1:{server.server_port}'
+        ):
+            client = _client(user)
+            started = time.perf_counter()
+            response = client.post(
+                reverse('bulk_upload_documents'),
+                {'documents': [SimpleUploadedFile(name, content, content_type='image/jpeg') for name, content in files]},
+                HTTP_ACCEPT='application/json',
+            )
+            bulk = time.perf_counter() - started
+            summary = response.json()['summary']
+            assert summary['failed'] == 0, summary
+    finally:
+        server.shutdown()
+        Doc.objects.filter(user=user).delete()
+        user.delete()
+
+    print(f"Страниц: {pages}, задержка прокси: {latency * 1000:.0f} мс")
+    print(f"{'Режим':<22} {'Всего, с':>9} {'На страницу, мс':>16}")
+    print(f"{'По одной':<22} {sequential:>9.2f} {sequential / pages * 1000:>16.1f}")
+    print(f"{'Одним пакетом':<22} {bulk:>9.2f} {bulk / pages * 1000:>16.1f}")
+    print(f"Ускорение: {sequential / bulk:.1f}x")
+
+
+# python manage.py shell
+
+'''from scripts.bench_bulk_upload import run
+run()'''
@@ -0,0 +1,71 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from mi_django.circuit import CircuitBreakers
+from mi_django.http_client import BackendClient
+
+
+class DegradedHandler(BaseHTTPRequestHandler):
+    """Деградировавший сервис: отвечает 503 после задержки latency."""
+    protocol_version = 'HTTP/1.1'
+    latency = 1.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.send_response(503)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def run(calls=200, concurrency=16, latency=1.0, timeout=(1, 3)):
+    """
+    Сколько ждут представления, когда сервис деградировал: calls обращений
+    в concurrency потоков к заглушке, отвечающей 503 через latency секунд.
+    Без автомата каждое обращение ждёт заглушку; с автоматом после порога
+    неудач остальные завершаются сразу.
+    """
+    DegradedHandler.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DegradedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/get_text/1'
+    modes = (
+        ('без автомата', CircuitBreakers(failure_threshold=10 ** 9)),
+        ('с автоматом', CircuitBreakers(failure_threshold=5, recovery_timeout=30)),
+    )
+    print(f"Обращений: {calls}, потоков: {concurrency}, задержка сервиса: {latency * 1000:.0f} мс")
+    print(f"{'Режим':>13} {'Всего, с':>9} {'p50, мс':>9} {'p95, мс':>9} {'Отклонено сразу':>16}")
+    try:
+        for name, breakers in modes:
+            client = BackendClient(retries=0, timeout=timeout, breakers=breakers)
+
+            def call(_):
+                started = time.perf_counter()
+                try:
+                    client.get(url)
+                except requests.RequestException:
+                    pass
+                return time.perf_counter() - started
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                timings = sorted(pool.map(call, range(calls)))
+            elapsed = time.perf_counter() - started
+            rejected = sum(breakers.rejected.items().values())
+            print(f"{name:>13} {elapsed:>9.2f} {statistics.median(timings) * 1000:>9.1f} "
+                  f"{timings[int(len(timings) * 0.95) - 1] * 1000:>9.1f} {rejected:>16}")
+    finally:
+        server.shutdown()
+
+
+# python manage.py shell
+
+'''from scripts.bench_circuit import run
+run()'''
@@ -0,0 +1,71 @@
+import io
+import tempfile
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+
+from mi_django.models import BackendDeletion, Cart, Doc, DocText
+
+BENCH_USERNAME = 'bench_clear_table'
+
+
+def _populate(user, docs):
+    """docs документов пользователя, у каждого строка корзины и текст (без файлов на диске)."""
+    Doc.objects.bulk_create(
+        (Doc(user=user, file_path=f'cas/bench/{i}.jpg', size=1, fastapi_doc_id=10 ** 6 + i) for i in range(docs)),
+        batch_size=5000,
+    )
+    ids = list(Doc.objects.filter(user=user).values_list('id', flat=True))
+    now = timezone.now()
+    Cart.objects.bulk_create((Cart(user=user, doc_id=doc_id, order_price=1) for doc_id in ids), batch_size=5000)
+    DocText.objects.bulk_create(
+        (DocText(doc_id=doc_id, texts=['текст'], content_hash='x', fetched_at=now) for doc_id in ids),
+        batch_size=5000,
+    )
+
+
+def _measure(purge):
+    tracemalloc.start()
+    started = time.perf_counter()
+    purge()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+
+def run(docs=50000, chunk_size=5000):
+    """
+    Очистка docs документов пользователя (с корзиной и текстами): прежний
+    Doc.objects.filter(...).delete() и команда clear_table --user пачками
+    по chunk_size. Печатаются время и пик памяти Python (tracemalloc).
+    """
+    user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+    print(f"Документов: {docs} (+ столько же строк cart и doc_texts)")
+    print(f"{'Способ':>22} {'Время, с':>9} {'Пик памяти, МБ':>15}")
+    try:
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            _populate(user, docs)
+            elapsed, peak = _measure(lambda: Doc.objects.filter(user=user).delete())
+            print(f"{'ORM delete()':>22} {elapsed:>9.2f} {peak:>15.1f}")
+
+            _populate(user, docs)
+            elapsed, peak = _measure(lambda: call_command(
+                'clear_table', '--user', BENCH_USERNAME, '--noinput', '--chunk-size', str(chunk_size),
+                stdout=io.StringIO(),
+            ))
+            print(f"{'clear_table пачками':>22} {elapsed:>9.2f} {peak:>15.1f}")
+    finally:
+        BackendDeletion.objects.filter(fastapi_doc_id__gte=10 ** 6).delete()
+        Doc.objects.filter(user=user).delete()
+        user.delete()
+
+
+# python manage.py shell
+
+'''from scripts.bench_clear_table import run
+run()'''
@@ -0,0 +1,119 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+
+from mi_django.models import Cart, Doc
+
+BENCH_USERNAME = 'bench_db_connections'
+
+
+def _pool_available():
+    if connection.vendor != 'postgresql':
+        return False
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    return is_psycopg3
+
+
+def _configure(mode):
+    """Переключает соединение default в режим mode ('none', 'persistent', 'pool') без перезапуска процесса."""
+    connection.close()
+    if hasattr(connection, 'close_pool'):
+        connection.close_pool()
+    settings_dict = connection.settings_dict
+    settings_dict['OPTIONS'].pop('pool', None)
+    settings_dict['CONN_MAX_AGE'] = 0
+    settings_dict['CONN_HEALTH_CHECKS'] = False
+    if mode == 'persistent':
+        settings_dict['CONN_MAX_AGE'] = 600
+        settings_dict['CONN_HEALTH_CHECKS'] = True
+    elif mode == 'pool':
+        settings_dict['OPTIONS']['pool'] = {'min_size': 1, 'max_size': 4}
+
+
+def _opened_connections():
+    """Счётчик настоящих подключений к серверу БД (выдача соединения из пула тоже шлёт connection_created)."""
+    pool = getattr(connection, 'pool', None)
+    if pool:
+        return lambda: pool.get_stats().get('connections_num', 0)
+    opened = 0
+
+    def count(**kwargs):
+        nonlocal opened
+        opened += 1
+
+    connection_created.connect(count, weak=False, dispatch_uid='bench_db_connections')
+    return lambda: opened
+
+
+def _measure(client, url, repeats):
+    opened = _opened_connections()
+    before = opened()
+    timings = []
+    try:
+        for _ in range(repeats):
+            started = time.perf_counter()
+            response = client.get(url)
+            # Тестовый клиент отключает закрытие соединений по request_finished; сервер делает это так
+            close_old_connections()
+            timings.append(time.perf_counter() - started)
+            assert response.status_code == 200
+    finally:
+        connection_created.disconnect(dispatch_uid='bench_db_connections')
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1], (opened() - before) / repeats
+
+
+def run(repeats=300, docs=24, cart_items=50):
+    """
+    Накладные расходы на соединение с БД: p50/p95 ответа index и cart_list
+    и число новых соединений на запрос без переиспользования, с постоянными
+    соединениями (CONN_MAX_AGE + проверка) и с пулом psycopg 3.
+
+    После каждого запроса соединения закрываются так же, как на сервере
+    (close_old_connections по request_finished). Разница заметна
+    на PostgreSQL (db_app2): подключение с аутентификацией занимает единицы
+    миллисекунд, у SQLite — почти ничего.
+    """
+    user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+    created = Doc.objects.bulk_create(
+        Doc(user=user, file_path=f'bench/{i}.jpg', size=100.0) for i in range(max(docs, cart_items))
+    )
+    Cart.objects.bulk_create(Cart(user=user, doc=doc, order_price=10.0) for doc in created[:cart_items])
+    client = Client()
+    client.force_login(user)
+
+    modes = ['none', 'persistent'] + (['pool'] if _pool_available() else [])
+    original = {key: connection.settings_dict.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+    original_pool = connection.settings_dict['OPTIONS'].get('pool')
+    print(f"БД: {connection.vendor}; режимы: {', '.join(modes)}")
+    print(f"{'Режим':>11} {'Страница':>10} {'p50, мс':>9} {'p95, мс':>9} {'Подключений на запрос':>22}")
+    try:
+        for mode in modes:
+            _configure(mode)
+            for name, url in (('index', reverse('index')), ('cart_list', reverse('cart_list'))):
+                client.get(url)  # прогрев: пул и постоянное соединение уже открыты
+                p50, p95, per_request = _measure(client, url, repeats)
+                print(f"{mode:>11} {name:>10} {p50 * 1000:>9.2f} {p95 * 1000:>9.2f} {per_request:>22.2f}")
+    finally:
+        _configure('none')
+        connection.settings_dict.update(original)
+        if original_pool is not None:
+            connection.settings_dict['OPTIONS']['pool'] = original_pool
+        Cart.objects.filter(user=user).delete()
+        Doc.objects.filter(user=user).delete()
+        user.delete()
+
+
+# python manage.py shell
+
+'''from scripts.bench_db_connections import run
+run()'''
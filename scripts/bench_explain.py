@@ -0,0 +1,116 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from mi_django.models import Cart, Doc
+
+BENCH_PREFIX = 'bench_explain_'
+
+
+def _seed(rows, users):
+    """rows документов и строк корзины (половина оплачена) у users пользователей, одним INSERT ... SELECT."""
+    User.objects.bulk_create(User(username=f'{BENCH_PREFIX}{i}') for i in range(users))
+    user_ids = list(User.objects.filter(username__startswith=BENCH_PREFIX).order_by('id').values_list('id', flat=True))
+    first_user, last_user = user_ids[0], user_ids[-1]
+    assert last_user - first_user + 1 == users, "id тестовых пользователей должны идти подряд"
+
+    if connection.vendor == 'postgresql':
+        series = f"generate_series(0, {rows - 1}) AS s(n)"
+        prefix = ''
+    else:
+        prefix = f"WITH RECURSIVE s(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM s WHERE n < {rows - 1})"
+        series = 's'
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO docs (user_id, size, file_path, thumbnails, content_hash, analysis_status)
+            {prefix}
+            SELECT {first_user} + n % {users}, 100, 'bench/' || n || '.jpg', '{{}}', '', '' FROM {series}
+        """)
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO cart (user_id, doc_id, order_price, payment)
+            SELECT user_id, id, 200, id % 2 = 0 FROM docs WHERE file_path LIKE 'bench/%'
+        """)
+        if connection.vendor == 'postgresql':
+            cursor.execute("ANALYZE docs")
+            cursor.execute("ANALYZE cart")
+        else:
+            cursor.execute("ANALYZE")
+    return user_ids
+
+
+def _hot_queries(user_id, doc_id):
+    """Запросы представлений в том виде, в каком их выполняют views.py и async_views.py."""
+    return {
+        'Проверка оплаты (order_analysis, analyze_document)':
+            Cart.objects.filter(user_id=user_id, doc_id=doc_id, payment=True).order_by('pk')[:1],
+        'Строка корзины (get_or_create в order_analysis)':
+            Cart.objects.filter(user_id=user_id, doc_id=doc_id),
+        'Документ пользователя (get_object_or_404)':
+            Doc.objects.filter(id=doc_id, user_id=user_id),
+        'Корзина пользователя (cart_list)':
+            Cart.objects.filter(user_id=user_id).select_related('doc')
+            .only('id', 'order_price', 'payment', 'doc__id', 'doc__file_path', 'doc__size').order_by('id'),
+        'Главная страница (index)':
+            Doc.objects.filter(user_id=user_id).only('id', 'file_path', 'size', 'thumbnails').order_by('-id')[:24],
+    }
+
+
+def _report(title, user_id, doc_id, repeats):
+    print(f"\n=== {title} ===")
+    for name, queryset in _hot_queries(user_id, doc_id).items():
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            list(queryset.all())
+            timings.append(time.perf_counter() - started)
+        options = {'analyze': True} if connection.vendor == 'postgresql' else {}
+        print(f"\n{name}: p50 {statistics.median(timings) * 1000:.3f} мс")
+        print(queryset.explain(**options))
+
+
+def _cart_schema(add):
+    """Создаёт или удаляет индексы и ограничения Cart из миграции 0014 (для сравнения «до/после»)."""
+    with connection.schema_editor() as editor:
+        for constraint in Cart._meta.constraints:
+            (editor.add_constraint if add else editor.remove_constraint)(Cart, constraint)
+        for index in Cart._meta.indexes:
+            (editor.add_index if add else editor.remove_index)(Cart, index)
+
+
+def run(rows=1_000_000, users=1000, repeats=200, compare=True, cleanup=True):
+    """
+    Засевает rows документов и строк корзины и печатает EXPLAIN и p50 для
+    горячих запросов. При compare=True на PostgreSQL те же запросы
+    выполняются и без индексов Cart (как до миграции 0014).
+    """
+    started = time.perf_counter()
+    user_ids = _seed(rows, users)
+    print(f"Засеяно {rows} документов и строк корзины за {time.perf_counter() - started:.1f} с")
+    user_id = user_ids[len(user_ids) // 2]
+    doc_id = Doc.objects.filter(user_id=user_id).order_by('id').values_list('id', flat=True)[rows // users // 2]
+
+    try:
+        _report("С индексами", user_id, doc_id, repeats)
+        if compare and connection.vendor != 'postgresql':
+            # SQLite удаляет ограничение пересозданием таблицы по модели — индексы вернутся сами
+            print("\nСравнение без индексов Cart выполняется только на PostgreSQL.")
+        elif compare:
+            _cart_schema(add=False)
+            try:
+                _report("Без индексов Cart", user_id, doc_id, repeats)
+            finally:
+                _cart_schema(add=True)
+    finally:
+        if cleanup:
+            Cart.objects.filter(user_id__in=user_ids)._raw_delete(Cart.objects.db)
+            Doc.objects.filter(user_id__in=user_ids)._raw_delete(Doc.objects.db)
+            User.objects.filter(id__in=user_ids).delete()
+
+
+# python manage.py shell
+
+'''from scripts.bench_explain import run
+run()'''
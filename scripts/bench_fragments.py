@@ -0,0 +1,85 @@
+import statistics
+import time
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.template.backends.django import Template
+from django.test import Client
+from django.urls import reverse
+
+from mi_django.fragments import fragment_cache
+from mi_django.models import Cart, Doc
+
+BENCH_USERNAME = 'bench_fragments'
+
+
+def _timed_render():
+    """Подменяет Template.render так, чтобы копилось время отрисовки всех шаблонов запроса."""
+    spent = [0.0]
+    render = Template.render
+
+    def timed(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            spent[0] += time.perf_counter() - started
+
+    return patch.object(Template, 'render', timed), spent
+
+
+def _measure(client, url, repeats, invalidate):
+    patcher, spent = _timed_render()
+    timings, template_timings = [], []
+    user_id = client.session['_auth_user_id']
+    with patcher:
+        for _ in range(repeats):
+            if invalidate:
+                fragment_cache.bump(user_id)
+            spent[0] = 0.0
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - started)
+            template_timings.append(spent[0])
+            assert response.status_code == 200
+    return statistics.median(timings), statistics.median(template_timings)
+
+
+def run(docs=24, cart_items=50, repeats=300):
+    """
+    Время ответа и время отрисовки шаблонов (p50) главной страницы и корзины:
+    при каждом запросе фрагмент рисуется заново (метка пользователя
+    сбрасывается перед запросом) и при повторных визитах, когда сетка
+    документов и список корзины берутся из кэша фрагментов. В конце —
+    доля попаданий по фрагментам.
+    """
+    user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+    created = Doc.objects.bulk_create(
+        Doc(user=user, file_path=f'bench/{i}.jpg', size=100.0, thumbnails={'sm': f'thumbs/{i}.webp'})
+        for i in range(max(docs, cart_items))
+    )
+    Cart.objects.bulk_create(Cart(user=user, doc=doc, order_price=10.0) for doc in created[:cart_items])
+    client = Client()
+    client.force_login(user)
+    fragment_cache.reset()
+
+    print(f"{'Страница':>10} {'Режим':>10} {'p50 ответа, мс':>15} {'p50 шаблонов, мс':>17}")
+    try:
+        for name, url in (('index', reverse('index')), ('cart_list', reverse('cart_list'))):
+            client.get(url)  # прогрев: шаблоны скомпилированы, соединение открыто
+            for mode, invalidate in (('без кэша', True), ('повторный', False)):
+                response_p50, template_p50 = _measure(client, url, repeats, invalidate)
+                print(f"{name:>10} {mode:>10} {response_p50 * 1000:>15.2f} {template_p50 * 1000:>17.3f}")
+        for name, stats in fragment_cache.stats()['fragments'].items():
+            print(f"{name}: попаданий {stats['hits']}, промахов {stats['misses']}, "
+                  f"доля попаданий {stats['hit_ratio']:.2f}, отрисовка при промахе {stats['avg_render_ms']:.2f} мс")
+    finally:
+        Cart.objects.filter(user=user).delete()
+        Doc.objects.filter(user=user).delete()
+        user.delete()
+
+
+# python manage.py shell
+
+'''from scripts.bench_fragments import run
+run()'''
@@ -0,0 +1,64 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.test import Client
+from django.urls import reverse
+
+from mi_django.models import Doc
+
+BENCH_USERNAME = 'bench_index'
+
+
+def _seed(user, target, batch_size=5000):
+    """Догружает документы пользователя до target штук пачками bulk_create."""
+    existing = Doc.objects.filter(user=user).count()
+    while existing < target:
+        count = min(batch_size, target - existing)
+        Doc.objects.bulk_create(
+            Doc(user=user, file_path=f'bench/{existing + i}.jpg', size=100.0) for i in range(count)
+        )
+        existing += count
+
+
+def _measure(client, params, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        response = client.get(reverse('index'), params)
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def run(row_counts=(1_000, 10_000, 100_000), repeats=50, cleanup=True):
+    """
+    Засевает документы тестового пользователя и измеряет p50/p95 времени
+    ответа главной страницы (первая и «глубокая» страница) при росте числа
+    документов. При keyset-пагинации время не должно расти с числом строк.
+    """
+    user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+    client = Client()
+    client.force_login(user)
+
+    print(f"{'Документов':>11} {'p50 первой, мс':>15} {'p95 первой, мс':>15} {'p50 глубокой, мс':>17} {'p95 глубокой, мс':>17}")
+    try:
+        for rows in row_counts:
+            _seed(user, rows)
+            # Курсор у самых старых документов — последние страницы списка
+            deep_cursor = Doc.objects.filter(user=user).order_by('id').values_list('id', flat=True)[50]
+            first_p50, first_p95 = _measure(client, {}, repeats)
+            deep_p50, deep_p95 = _measure(client, {'after': deep_cursor}, repeats)
+            print(f"{rows:>11} {first_p50 * 1000:>15.2f} {first_p95 * 1000:>15.2f} "
+                  f"{deep_p50 * 1000:>17.2f} {deep_p95 * 1000:>17.2f}")
+    finally:
+        if cleanup:
+            Doc.objects.filter(user=user)._raw_delete(Doc.objects.db)
+            user.delete()
+
+
+# python manage.py shell
+
+'''from scripts.bench_index import run
+run()'''
@@ -0,0 +1,113 @@
+import contextlib
+import copy
+import logging.config
+import os
+import statistics
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+
+from mi_django.models import Doc
+from scripts.bench_bulk_upload import _client, _make_pages, _make_stub_handler
+
+BENCH_USERNAME = 'bench_logging'
+
+# Прежняя настройка: корневой логгер на DEBUG, запись в консоль и в файл в потоке запроса
+LEGACY_LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+        'file': {'level': 'DEBUG', 'class': 'logging.FileHandler', 'filename': 'debug.log'},
+    },
+    'loggers': {
+        '': {'handlers': ['console', 'file'], 'level': 'DEBUG', 'propagate': True},
+    },
+}
+
+
+def _queue_logging(level, filename):
+    config = copy.deepcopy(settings.LOGGING)
+    config['handlers']['queue']['filename'] = filename
+    config['root']['level'] = level
+    return config
+
+
+def _configs(log_dir):
+    legacy = copy.deepcopy(LEGACY_LOGGING)
+    legacy['handlers']['file']['filename'] = os.path.join(log_dir, 'legacy.log')
+    return [
+        ('FileHandler, DEBUG', legacy),
+        ('Очередь, DEBUG', _queue_logging('DEBUG', os.path.join(log_dir, 'queue_debug.log'))),
+        ('Очередь, INFO', _queue_logging('INFO', os.path.join(log_dir, 'queue_info.log'))),
+    ]
+
+
+def _timings(func, count):
+    timings = []
+    for i in range(count):
+        started = time.perf_counter()
+        func(i)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, sorted(timings)[int(count * 0.95)] * 1000
+
+
+def run(index_requests=500, uploads=100):
+    """
+    Время ответа главной страницы и загрузки документа (на локальной
+    заглушке прокси) при прежней записи логов в потоке запроса и при
+    записи через очередь. Консольный вывод уходит в /dev/null.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _make_stub_handler(0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+    Doc.objects.bulk_create(Doc(user=user, file_path=f'bench/{i}.jpg', size=100.0) for i in range(24))
+    pages = _make_pages(uploads * 3, width=400, height=560)
+    results = []
+
+    try:
+        with tempfile.TemporaryDirectory() as log_dir, tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root, PROXY_BASE_URL=f'http://127.0.0.1:{server.server_port}'), \
+                open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+            try:
+                for number, (name, config) in enumerate(_configs(log_dir)):
+                    logging.config.dictConfig(config)
+                    client = _client(user)
+                    client.get(reverse('index'))  # прогрев
+                    index = _timings(lambda i: client.get(reverse('index')), index_requests)
+                    batch = pages[number * uploads:(number + 1) * uploads]
+
+                    def upload(i):
+                        file_name, content = batch[i]
+                        response = client.post(reverse('upload_document'), {
+                            'document': SimpleUploadedFile(file_name, content, content_type='image/jpeg'),
+                        })
+                        assert response.status_code == 302
+
+                    upload_timings = _timings(upload, uploads)
+                    results.append((name, index, upload_timings))
+            finally:
+                # До закрытия /dev/null: обработчики закрываются, поток записи дописывает очередь
+                logging.config.dictConfig({'version': 1, 'disable_existing_loggers': False})
+    finally:
+        logging.config.dictConfig(settings.LOGGING)
+        server.shutdown()
+        Doc.objects.filter(user=user).delete()
+        user.delete()
+
+    print(f"{'Логирование':<20} {'Главная p50':>12} {'p95, мс':>8} {'Загрузка p50':>13} {'p95, мс':>8}")
+    for name, (index_p50, index_p95), (upload_p50, upload_p95) in results:
+        print(f"{name:<20} {index_p50:>12.2f} {index_p95:>8.2f} {upload_p50:>13.2f} {upload_p95:>8.2f}")
+
+
+# python manage.py shell
+
+'''from scripts.bench_logging import run
+run()'''
@@ -0,0 +1,57 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from mi_django.metrics import request_metrics
+from mi_django.models import Doc
+
+BENCH_USERNAME = 'bench_metrics'
+MIDDLEWARE_PATH = 'mi_django.metrics.RequestMetricsMiddleware'
+
+
+def _measure(user, requests_count):
+    client = Client()
+    client.force_login(user)
+    url = reverse('index')
+    client.get(url)  # прогрев
+    timings = []
+    for _ in range(requests_count):
+        started = time.perf_counter()
+        client.get(url)
+        timings.append(time.perf_counter() - started)
+    return statistics.mean(timings)
+
+
+def run(requests_count=2000, sample_rates=(0, 0.01, 0.1, 1)):
+    """
+    Накладные расходы RequestMetricsMiddleware на главной странице: среднее
+    время ответа без посредника и с ним при разных долях выборки.
+    """
+    user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+    Doc.objects.bulk_create(Doc(user=user, file_path=f'bench/{i}.jpg', size=100.0) for i in range(24))
+    configured_rate = request_metrics.sample_rate
+    try:
+        without = [path for path in settings.MIDDLEWARE if path != MIDDLEWARE_PATH]
+        with override_settings(MIDDLEWARE=without):
+            baseline = _measure(user, requests_count)
+        print(f"{'Выборка':>10} {'среднее, мс':>12} {'накладные, %':>13}")
+        print(f"{'нет':>10} {baseline * 1000:>12.3f} {'':>13}")
+        for rate in sample_rates:
+            request_metrics.sample_rate = rate
+            elapsed = _measure(user, requests_count)
+            print(f"{rate:>10g} {elapsed * 1000:>12.3f} {(elapsed / baseline - 1) * 100:>13.2f}")
+    finally:
+        request_metrics.sample_rate = configured_rate
+        request_metrics.reset()
+        Doc.objects.filter(user=user).delete()
+        user.delete()
+
+
+# python manage.py shell
+
+'''from scripts.bench_metrics import run
+run()'''
@@ -0,0 +1,93 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.core.cache import cache, caches
+from django.db import connection
+
+from mi_django.sessions import local_sessions
+
+ENGINES = (
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+    'mi_django.sessions',
+)
+# Похоже на JWT прокси-сервера: два токена по ~300 байт
+TOKEN = 'x' * 300
+
+
+def _worker(store_class, keys, requests, write_every):
+    """Запросы одного потока: чтение сессии, каждый write_every-й — ещё и обновление токена."""
+    reads, writes, queries = [], [], 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    try:
+        with connection.execute_wrapper(count):
+            for i in range(requests):
+                started = time.perf_counter()
+                session = store_class(keys[i % len(keys)])
+                session.get('access_token')
+                reads.append(time.perf_counter() - started)
+                if i % write_every == 0:
+                    started = time.perf_counter()
+                    session['access_token'] = f'{TOKEN}{i}'
+                    session.save()
+                    writes.append(time.perf_counter() - started)
+    finally:
+        connection.close()
+    return reads, writes, queries
+
+
+def run(sessions=100, threads=(1, 8, 32), requests_per_thread=500, write_every=20):
+    """
+    Стоимость чтения и записи сессии на запрос для хранилищ db, cached_db и
+    mi_django.sessions при нескольких потоках. Каждый запрос читает сессию
+    (как SessionMiddleware и AuthenticationMiddleware), каждый write_every-й
+    ещё и сохраняет обновлённый access-токен.
+
+    Общий кэш берётся из CACHES: для честного сравнения cached_db между
+    процессами нужен Redis (REDIS_URL); с LocMemCache кэш — в памяти процесса.
+    """
+    print(f"Кэш: {type(caches['default']).__name__}, сессий: {sessions}, запись каждого {write_every}-го запроса")
+    print(f"{'Хранилище':>44} {'Потоков':>8} {'Запросов/с':>11} {'p50 чтения, мкс':>16} "
+          f"{'p95 чтения, мкс':>16} {'p50 записи, мс':>15} {'Запросов к БД':>14}")
+    for engine in ENGINES:
+        store_class = import_module(engine).SessionStore
+        keys = []
+        for _ in range(sessions):
+            session = store_class()
+            session.update({'access_token': TOKEN, 'refresh_token': TOKEN, '_auth_user_id': '1'})
+            session.save()
+            keys.append(session.session_key)
+        try:
+            for level in threads:
+                cache.clear()
+                local_sessions.clear()
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=level) as pool:
+                    results = list(pool.map(
+                        lambda _: _worker(store_class, keys, requests_per_thread, write_every), range(level)
+                    ))
+                elapsed = time.perf_counter() - started
+                reads = sorted(t for r, _, _ in results for t in r)
+                writes = [t for _, w, _ in results for t in w]
+                total = level * requests_per_thread
+                queries = sum(q for _, _, q in results) / total
+                print(f"{engine:>44} {level:>8} {total / elapsed:>11.0f} {statistics.median(reads) * 1e6:>16.0f} "
+                      f"{reads[int(len(reads) * 0.95) - 1] * 1e6:>16.0f} {statistics.median(writes) * 1000:>15.2f} "
+                      f"{queries:>14.2f}")
+        finally:
+            store_class.get_model_class().objects.filter(session_key__in=keys).delete()
+            cache.clear()
+            local_sessions.clear()
+
+
+# python manage.py shell
+
+'''from scripts.bench_sessions import run
+run()'''
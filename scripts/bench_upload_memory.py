@@ -0,0 +1,96 @@
+import os
+import tempfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+
+from mi_django.uploads import MultipartFileStream, UPLOAD_CHUNK_SIZE
+
+
+class _SinkHandler(BaseHTTPRequestHandler):
+    """Заглушка /api/upload_doc/: дочитывает тело запроса и отвечает 200."""
+
+    def do_POST(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, 1024 * 1024)))
+        body = b'{"id": 1}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _make_upload(size):
+    upload = TemporaryUploadedFile('scan.jpg', 'image/jpeg', size, None)
+    block = os.urandom(1024 * 1024)
+    written = 0
+    while written < size:
+        written += upload.write(block[:size - written])
+    upload.seek(0)
+    return upload
+
+
+def _legacy(upload, storage, url):
+    """Старый путь: file.read() в ContentFile, сохранение и повторное чтение с диска."""
+    file_path = storage.save(upload.name, ContentFile(upload.read()))
+    with storage.open(file_path, 'rb') as f:
+        requests.post(url, files={'file': (upload.name, f, upload.content_type)}, timeout=60)
+
+
+def _streaming(upload, storage, url):
+    """Новый путь: один проход по файлу, куски идут и на прокси, и в локальную копию."""
+    with storage.open(storage.get_available_name(upload.name), 'wb') as local_copy:
+        body = MultipartFileStream(upload, filename=upload.name, content_type=upload.content_type,
+                                   sinks=[local_copy.write])
+        requests.post(url, data=body, headers={'Content-Type': body.content_type}, timeout=60)
+        body.drain()
+
+
+def _peak(func, *args):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def run(sizes_mb=(1, 8, 32, 64)):
+    """
+    Сравнивает пиковое потребление памяти на одну загрузку (tracemalloc)
+    для старого и потокового пути upload_document на локальной заглушке прокси.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _SinkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/api/upload_doc/'
+
+    print(f"Размер чанка: {UPLOAD_CHUNK_SIZE // 1024} КБ")
+    print(f"{'Файл, МБ':>10} {'Старый путь, МБ':>18} {'Потоковый, МБ':>16}")
+    try:
+        with tempfile.TemporaryDirectory() as media_root:
+            storage = FileSystemStorage(location=media_root)
+            for size_mb in sizes_mb:
+                upload = _make_upload(size_mb * 1024 * 1024)
+                legacy_peak = _peak(_legacy, upload, storage, url)
+                upload.seek(0)
+                streaming_peak = _peak(_streaming, upload, storage, url)
+                upload.close()
+                print(f"{size_mb:>10} {legacy_peak / 2 ** 20:>18.2f} {streaming_peak / 2 ** 20:>16.2f}")
+    finally:
+        server.shutdown()
+
+
+# python manage.py shell
+
+'''from scripts.bench_upload_memory import run
+run()'''
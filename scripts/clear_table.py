@@ -1,23 +1,18 @@
-from mi_django.models import Doc, Cart, Price, UsersToDocs
+from django.core.management import call_command
 
-def run():
-    """
-    Удаляет все объекты из таблиц Doc, Cart, Price и UsersToDocs после подтверждения.
+
+def run(*tables, **options):
     """
-    confirm = input("Вы уверены, что хотите удалить все объекты из всех таблиц? (yes/no): ")
-    if confirm.lower() == "yes":
-        # Удаляем данные из каждой модели
-        Doc.objects.all().delete()
-        Cart.objects.all().delete()
-        Price.objects.all().delete()
-        UsersToDocs.objects.all().delete()
+    Удаляет все строки из таблиц Doc, Cart, Price и UsersToDocs после подтверждения.
 
-        print("Все объекты из таблиц Doc, Cart, Price и UsersToDocs были успешно удалены.")
-    else:
-        print("Операция удаления отменена.")
+    Обёртка над командой clear_table (TRUNCATE или удаление пачками, без
+    загрузки строк в память); её параметры передаются как есть, например
+    run('docs', user='ivan', dry_run=True).
+    """
+    call_command('clear_table', *tables, **options)
 
 
 # python manage.py shell
 
 '''from scripts.clear_table import run
-run()'''
\ No newline at end of file
+run()'''
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+
+import httpx
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+
+from mi_django.models import Doc
+
+
+def _make_stub_handler(latency):
+    class StubFastAPIHandler(BaseHTTPRequestHandler):
+        """Заглушка FastAPI: отвечает на /get_text/ с искусственной задержкой."""
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = json.dumps({'texts': [{'text': 'Нагрузочный тест'}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return StubFastAPIHandler
+
+
+def _login_cookie():
+    """Создаёт пользователя, документ и готовую сессию для нагрузочного теста."""
+    user, _ = User.objects.get_or_create(username='loadtest')
+    doc, _ = Doc.objects.get_or_create(user=user, file_path='loadtest.jpg', defaults={'size': 1, 'fastapi_doc_id': 1})
+
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return {settings.SESSION_COOKIE_NAME: session.session_key}, doc
+
+
+async def _user(client, url, requests_per_user, latencies, errors):
+    for _ in range(requests_per_user):
+        started = time.perf_counter()
+        try:
+            response = await client.get(url)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+
+async def _run_level(url, cookies, users, requests_per_user):
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(cookies=cookies, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            _user(client, url, requests_per_user, latencies, errors) for _ in range(users)
+        ))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': statistics.median(latencies),
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+        'errors': len(errors),
+    }
+
+
+def run(wsgi_url='http://127.0.0.1:8001', asgi_url='http://127.0.0.1:8003',
+        users=(50, 200, 500), requests_per_user=5, backend_latency=0.2, stub_port=8900):
+    """
+    Сравнивает пропускную способность get_document_text под WSGI и ASGI.
+
+    Поднимает заглушку FastAPI на stub_port (задержка backend_latency секунд)
+    и нагружает оба сервера фронтенда, которые должны быть запущены заранее
+    с общей базой данных и FASTAPI_BASE_URL, указывающим на заглушку:
+
+        FASTAPI_BASE_URL=http://127.0.0.1:8900 gunicorn django_cor.wsgi -w 4 --threads 8 -b 127.0.0.1:8001
+        FASTAPI_BASE_URL=http://127.0.0.1:8900 ASYNC_VIEWS=1 uvicorn django_cor.asgi:application --workers 4 --port 8003
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', stub_port), _make_stub_handler(backend_latency))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    cookies, doc = _login_cookie()
+    path = f'/get-document-text/{doc.id}/'
+
+    print(f"Задержка заглушки FastAPI: {backend_latency * 1000:.0f} мс, запросов на пользователя: {requests_per_user}")
+    print(f"{'Сервер':>8} {'Пользователи':>13} {'RPS':>9} {'p50, мс':>9} {'p95, мс':>9} {'Ошибки':>7}")
+    try:
+        for name, base_url in (('WSGI', wsgi_url), ('ASGI', asgi_url)):
+            for level in users:
+                result = asyncio.run(_run_level(base_url + path, cookies, level, requests_per_user))
+                print(f"{name:>8} {level:>13} {result['rps']:>9.1f} {result['p50'] * 1000:>9.0f} "
+                      f"{result['p95'] * 1000:>9.0f} {result['errors']:>7}")
+    finally:
+        server.shutdown()
+
+
+# python manage.py shell
+
+'''from scripts.loadtest_asgi import run
+run()'''
@@ -0,0 +1,121 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from mi_django.logins import last_logins, login_users
+
+USERNAME_PREFIX = 'loadtest_login_'
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def _make_stub_handler(latency):
+    class StubProxyHandler(BaseHTTPRequestHandler):
+        """Заглушка прокси-сервера: /api/login/ выдаёт пару JWT с искусственной задержкой."""
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(latency)
+            body = json.dumps({'access': 'a' * 300, 'refresh': 'r' * 300}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return StubProxyHandler
+
+
+def _login(username):
+    """Один вход новым браузером: время ответа, запросов к БД и из них записей."""
+    queries = writes = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries, writes
+        queries += 1
+        writes += sql.lstrip().upper().startswith(WRITE_PREFIXES)
+        return execute(sql, params, many, context)
+
+    client = Client()
+    started = time.perf_counter()
+    with connection.execute_wrapper(count):
+        response = client.post(reverse('login'), {'username': username, 'password': 'secret'})
+    elapsed = time.perf_counter() - started
+    return elapsed, queries, writes, response.status_code == 302
+
+
+def _storm(rate_per_minute, duration, users, concurrency):
+    """Открытая нагрузка: входы запускаются по расписанию rate_per_minute, независимо от ответов."""
+    interval = 60.0 / rate_per_minute
+    total = int(duration / interval)
+
+    def task(index):
+        time.sleep(max(0.0, started + index * interval - time.perf_counter()))
+        return _login(f'{USERNAME_PREFIX}{index % users}')
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(task, range(total)))
+
+
+def run(rate_per_minute=1000, duration=60, users=300, concurrency=16, proxy_latency=0.02):
+    """
+    Утренний пик входов: rate_per_minute входов в минуту в течение duration
+    секунд по users существующим учётным записям (каждый вход — новый
+    браузер, как после ночи). Прокси-сервер — локальная заглушка
+    с задержкой proxy_latency.
+
+    Сравниваются прежний путь (get_or_create и запись last_login на каждый
+    вход) и быстрый (кэш пользователей, last_login пачками). Печатаются
+    p50/p95 ответа и число запросов к БД и записей на вход.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _make_stub_handler(proxy_latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    proxy_url = f'http://127.0.0.1:{server.server_address[1]}'
+    modes = (
+        ('прежний', {'timeout': 0}, {'flush_interval': 0}),
+        ('быстрый', {'timeout': login_users.timeout or 24 * 3600},
+         {'flush_interval': last_logins.flush_interval or 10}),
+    )
+    print(f"{rate_per_minute} входов/мин, {duration} с, учётных записей: {users}, "
+          f"задержка прокси-сервера: {proxy_latency * 1000:.0f} мс")
+    print(f"{'Путь':>8} {'Входов':>7} {'Ошибки':>7} {'p50, мс':>9} {'p95, мс':>9} "
+          f"{'Запросов к БД':>14} {'Записей':>8}")
+    try:
+        with override_settings(PROXY_BASE_URL=proxy_url):
+            for name, user_cache, buffer in modes:
+                # Учётные записи уже есть в БД (входили вчера), в кэше — если он включён
+                User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+                User.objects.bulk_create(User(username=f'{USERNAME_PREFIX}{i}') for i in range(users))
+                with patch.multiple(login_users, **user_cache), patch.multiple(last_logins, **buffer):
+                    for i in range(users):
+                        login_users.get_or_create(f'{USERNAME_PREFIX}{i}')
+                    results = _storm(rate_per_minute, duration, users, concurrency)
+                    last_logins.flush()
+                timings = sorted(r[0] for r in results)
+                errors = sum(1 for r in results if not r[3])
+                queries = statistics.mean(r[1] for r in results)
+                writes = statistics.mean(r[2] for r in results)
+                print(f"{name:>8} {len(results):>7} {errors:>7} {statistics.median(timings) * 1000:>9.1f} "
+                      f"{timings[int(len(timings) * 0.95) - 1] * 1000:>9.1f} {queries:>14.2f} {writes:>8.2f}")
+    finally:
+        server.shutdown()
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+
+# python manage.py shell
+
+'''from scripts.loadtest_login import run
+run()'''
@@ -0,0 +1,52 @@
+import asyncio
+import os
+
+from django.conf import settings
+
+from scripts.loadtest_asgi import _login_cookie, _run_level
+
+MEDIA_PATH = 'cas/loadtest/loadtest.jpg'
+
+
+def _media_file(size):
+    path = os.path.join(settings.MEDIA_ROOT, MEDIA_PATH)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(path) or os.path.getsize(path) != size:
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+    return path
+
+
+def run(stream_url='http://127.0.0.1:8002', accel_url='http://127.0.0.1:8001',
+        users=(20, 100, 200), requests_per_user=20, file_size=1024 * 1024):
+    """
+    Сравнивает отдачу медиафайла и главной страницы в двух режимах:
+
+    - stream_url — Django сам читает и отправляет файл (MEDIA_DELIVERY=django),
+      как прежний static() в urls.py:
+
+        DJANGO_ENV=production DJANGO_SECRET_KEY=x DJANGO_ALLOWED_HOSTS=127.0.0.1 MEDIA_DELIVERY=django \\
+            gunicorn -c gunicorn.conf.py django_cor.wsgi -b 127.0.0.1:8002
+
+    - accel_url — nginx/nginx.conf перед gunicorn с MEDIA_DELIVERY=x-accel
+      (docker compose up nginx django_frontend): Django только проверяет вход,
+      байты отдаёт nginx.
+
+    Оба сервера должны работать с общей базой данных и MEDIA_ROOT.
+    """
+    _media_file(file_size)
+    cookies, _ = _login_cookie()
+    print(f"Размер файла: {file_size // 1024} КБ, запросов на пользователя: {requests_per_user}")
+    print(f"{'Режим':>8} {'Страница':>9} {'Пользователи':>13} {'RPS':>9} {'p50, мс':>9} {'p95, мс':>9} {'Ошибки':>7}")
+    for name, base_url in (('stream', stream_url), ('x-accel', accel_url)):
+        for page, path in (('media', f'{settings.MEDIA_URL}{MEDIA_PATH}'), ('index', '/')):
+            for level in users:
+                result = asyncio.run(_run_level(base_url + path, cookies, level, requests_per_user))
+                print(f"{name:>8} {page:>9} {level:>13} {result['rps']:>9.1f} {result['p50'] * 1000:>9.0f} "
+                      f"{result['p95'] * 1000:>9.0f} {result['errors']:>7}")
+
+
+# python manage.py shell
+
+'''from scripts.loadtest_media import run
+run()'''